@@ -0,0 +1,132 @@
+"""
+Benchmark of ``PSSAdapter.get_nodes()``/``get_edges()`` on synthetic PSS
+graphs, without the dockerised PSS database.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.bench_adapter --scale 1 2 4 --output bench.json
+
+Each scale runs in its own process, so the reported peak RSS is that of a
+single build. Results are written as JSON.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run(scale, seed, batch_size, workers, server_side_reactions, reaction_processes=1,
+        reaction_mode="pairwise"):
+    """ Build one synthetic graph and time the adapter on it """
+
+    from benchmarks.synthetic_pss import SyntheticPSS, FakeDriver
+    from skm.adapters.pss_adapter import PSSAdapter
+
+    stages = {}
+
+    start = time.perf_counter()
+    graph = SyntheticPSS(scale=scale, seed=seed)
+    stages["generate"] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as outputdir:
+        graph.write_gene_annotations(os.path.join(outputdir, "gene_annotations.tsv.gz"))
+        rss_before = peak_rss_mb()
+
+        adapter = PSSAdapter(
+            outputdir=outputdir,
+            batch_size=batch_size,
+            workers=workers,
+            server_side_reactions=server_side_reactions,
+            reaction_processes=reaction_processes,
+            reaction_mode=reaction_mode,
+            driver=FakeDriver(graph),
+        )
+
+        start = time.perf_counter()
+        adapter.gene_annotations.load()
+        stages["annotations"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        nodes = sum(1 for _ in adapter.get_nodes())
+        stages["nodes"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        edges = sum(1 for _ in adapter.get_edges())
+        stages["edges"] = time.perf_counter() - start
+
+    return {
+        "scale": scale,
+        "seed": seed,
+        "batch_size": batch_size,
+        "workers": workers,
+        "server_side_reactions": server_side_reactions,
+        "reaction_processes": reaction_processes,
+        "reaction_mode": reaction_mode,
+        "source_records": graph.records(),
+        "nodes": nodes,
+        "edges": edges,
+        "nodes_per_s": nodes / stages["nodes"],
+        "edges_per_s": edges / stages["edges"],
+        "stage_seconds": stages,
+        "peak_rss_mb_before_adapter": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "adapter_metrics": adapter.metrics.report(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PSS adapter on synthetic graphs.")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--server-side-reactions", action="store_true")
+    parser.add_argument("--reaction-processes", type=int, default=1)
+    parser.add_argument("--reaction-mode", choices=["pairwise", "hypernode"], default="pairwise")
+    parser.add_argument("--output", default=None, help="JSON file (default: stdout)")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        result = run(args.scale[0], args.seed, args.batch_size, args.workers,
+                     args.server_side_reactions, args.reaction_processes, args.reaction_mode)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for scale in args.scale:
+        cmd = [
+            sys.executable, "-m", "benchmarks.bench_adapter", "--single",
+            "--scale", str(scale),
+            "--seed", str(args.seed),
+            "--batch-size", str(args.batch_size),
+            "--workers", str(args.workers),
+            "--reaction-processes", str(args.reaction_processes),
+            "--reaction-mode", args.reaction_mode,
+        ]
+        if args.server_side_reactions:
+            cmd.append("--server-side-reactions")
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    report = json.dumps({"benchmark": "pss_adapter", "runs": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
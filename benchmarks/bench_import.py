@@ -0,0 +1,74 @@
+"""
+Import-time budget of the adapter modules, measured with
+``python -X importtime`` in a fresh interpreter.
+
+    python -m benchmarks.bench_import --budget-ms 150
+
+Exits with status 1 if a module exceeds the budget or pulls in one of the
+``HEAVY_MODULES``, which are only to be imported on first use.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+MODULES = [
+    "skm.adapters.pss_adapter",
+    "skm.adapters.pss_snapshot",
+    "skm.adapters.node_index",
+    "skm.adapters.metrics",
+    "skm.adapters.spill_buffer",
+]
+
+HEAVY_MODULES = ["pandas", "numpy", "neo4j", "neo4j_utils", "biocypher", "urllib.request"]
+
+
+def measure(module):
+    """ Cumulative import time (ms) of ``module`` and the heavy modules it imported """
+
+    code = (
+        f"import sys, json, {module}; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        check=True, capture_output=True, text=True,
+    )
+
+    # lines of "import time: self [us] | cumulative | imported package"
+    cumulative = None
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, total, name = line[len("import time:"):].split("|")
+        if name.strip() == module:
+            cumulative = int(total) / 1000
+
+    return cumulative, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the adapter modules.")
+    parser.add_argument("--budget-ms", type=float, default=150.0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per module, the fastest counts")
+    args = parser.parse_args()
+
+    results = []
+    for module in MODULES:
+        runs = [measure(module) for _ in range(args.repeat)]
+        import_ms = min(ms for ms, _ in runs)
+        heavy = runs[0][1]
+        results.append({
+            "module": module,
+            "import_ms": import_ms,
+            "heavy_modules": heavy,
+            "ok": import_ms <= args.budget_ms and not heavy,
+        })
+
+    print(json.dumps({"benchmark": "import_time", "budget_ms": args.budget_ms, "runs": results}, indent=2))
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark of the import file layouts of ``skm.build.import_files`` against
+the single part per label that BioCypher writes for graphs of this size.
+
+    python -m benchmarks.bench_import_layout --scale 4 --part-mb 1 --output layout.json
+
+For each layout the files of a synthetic PSS graph are rewritten with
+``reshard`` (size-bounded parts, gzipped or not, nodes sorted by ID or not),
+and the time and bytes are reported. With ``--neo4j-admin``, each layout is
+also imported with ``neo4j-admin import`` (4.4), by default with 1 and all
+processors, to show how the import scales with cores.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.bench_reaction_modes import ImportFiles, import_seconds
+from skm.build.delta import schema_labels
+from skm.build.import_files import label_parts, reshard
+
+LAYOUTS = {
+    "single": None,
+    "sharded": {"compress": False, "sort_nodes": False},
+    "sharded_sorted": {"compress": False, "sort_nodes": True},
+    "sharded_gzip": {"compress": True, "sort_nodes": False},
+    "sharded_gzip_sorted": {"compress": True, "sort_nodes": True},
+}
+
+
+def write_graph(directory, scale, seed, batch_size):
+    """ Import files of a synthetic graph, one part per label """
+
+    from benchmarks.synthetic_pss import SyntheticPSS, FakeDriver
+    from skm.adapters.pss_adapter import PSSAdapter
+
+    graph = SyntheticPSS(scale=scale, seed=seed)
+    graph.write_gene_annotations(os.path.join(directory, "gene_annotations.tsv.gz"))
+    adapter = PSSAdapter(outputdir=directory, batch_size=batch_size, driver=FakeDriver(graph))
+
+    files = ImportFiles(directory, schema_labels("config/schema_config.yaml"))
+    try:
+        files.write_nodes(adapter.get_nodes())
+        files.write_edges(adapter.get_edges())
+    finally:
+        files.close()
+    os.remove(os.path.join(directory, "gene_annotations.tsv.gz"))
+    return files
+
+
+def run(layout, source, files, part_bytes, processes, neo4j_admin, processors):
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copytree(source, directory, dirs_exist_ok=True)
+        files.directory = directory
+
+        start = time.perf_counter()
+        if LAYOUTS[layout] is not None:
+            reshard(directory, part_bytes=part_bytes, processes=processes, **LAYOUTS[layout])
+        reshard_seconds = time.perf_counter() - start
+
+        parts = label_parts(directory)
+        result = {
+            "layout": layout,
+            "reshard_seconds": reshard_seconds,
+            "parts": sum(map(len, parts.values())),
+            "bytes": sum(os.path.getsize(path) for paths in parts.values() for path in paths),
+        }
+        if neo4j_admin:
+            result["import_seconds"] = {
+                n: import_seconds(
+                    neo4j_admin, files, directory,
+                    [f"--processors={n}", "--high-io=true"],
+                )
+                for n in processors
+            }
+        files.directory = source
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare import file layouts.")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--part-mb", type=float, default=1.0, help="part size of the sharded layouts")
+    parser.add_argument("--processes", type=int, default=None, help="resharding processes")
+    parser.add_argument("--layout", choices=list(LAYOUTS), nargs="+", default=list(LAYOUTS))
+    parser.add_argument("--neo4j-admin", default=None, help="neo4j-admin (4.4) executable to time imports")
+    parser.add_argument("--processors", type=int, nargs="+", default=[1, os.cpu_count()])
+    parser.add_argument("--output", default=None, help="JSON file (default: stdout)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as source:
+        files = write_graph(source, args.scale, args.seed, args.batch_size)
+        results = [
+            run(layout, source, files, int(args.part_mb * (1 << 20)), args.processes,
+                args.neo4j_admin, args.processors)
+            for layout in args.layout
+        ]
+
+    report = json.dumps({
+        "benchmark": "import_layout",
+        "scale": args.scale,
+        "part_mb": args.part_mb,
+        "runs": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Peak memory of the keyset-paginated extraction streams of ``PSSAdapter`` at
+two sizes of a synthetic PSS graph.
+
+    python -m benchmarks.bench_memory --scale 1 4 --batch-size 1000
+    python -m benchmarks.bench_memory --scale 1 4 --uri bolt://localhost:7687
+
+Every stream of ``QUERIES`` is read through and discarded. Exits with status
+1 if the peak at the larger scale exceeds ``--ceiling`` times the one at the
+smaller scale, i.e. if memory grows with the size of PSS rather than with
+the batch size.
+
+By default, the records are served by the stand-in driver of
+``benchmarks.synthetic_pss``, and the peak of each stream is traced with
+``tracemalloc``, the synthetic graph being generated before tracing. This
+only covers the growth on the adapter side: the stand-in hands out records
+held in memory, so the buffering of results by ``neo4j_utils`` and the
+Neo4j driver, and memory allocated outside of Python, are not measured.
+
+With ``--uri``, the graph of each scale is instead loaded into an empty
+Neo4j 4.4 (as by ``benchmarks.check_reaction_parity``, and removed
+afterwards) and read through ``neo4j_utils`` in a process of its own, whose
+peak RSS (``ru_maxrss``) above the one after connecting is reported.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.bench_adapter import peak_rss_mb
+
+
+def measure(scale, batch_size, seed):
+    from benchmarks.synthetic_pss import SyntheticPSS, FakeDriver
+    from skm.adapters.pss_adapter import QUERIES, PSSAdapter
+
+    graph = SyntheticPSS(scale=scale, seed=seed)
+    # index the keys the stand-in pages on up front, so they are not traced
+    for stream in QUERIES:
+        graph.keys(stream)
+    adapter = PSSAdapter(driver=FakeDriver(graph), batch_size=batch_size)
+
+    streams = {}
+    for stream in QUERIES:
+        tracemalloc.start()
+        start = time.perf_counter()
+        records = sum(1 for _ in adapter.get_records(stream))
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        streams[stream] = {"records": records, "seconds": seconds, "peak_mb": peak / (1 << 20)}
+
+    return {
+        "scale": scale,
+        "records": sum(s["records"] for s in streams.values()),
+        "peak_mb": max(s["peak_mb"] for s in streams.values()),
+        "streams": streams,
+    }
+
+
+def measure_rss(uri, user, password, batch_size):
+    """ Peak RSS of reading the streams of the database at ``uri``, above the RSS once connected """
+
+    import neo4j_utils as nu
+    from skm.adapters.pss_adapter import QUERIES, PSSAdapter
+
+    db = nu.Driver(db_name="neo4j", db_user=user, db_passwd=password, db_uri=uri, multi_db=False)
+    adapter = PSSAdapter(driver=db, batch_size=batch_size)
+    baseline = peak_rss_mb()
+
+    streams = {}
+    for stream in QUERIES:
+        start = time.perf_counter()
+        records = sum(1 for _ in adapter.get_records(stream))
+        seconds = time.perf_counter() - start
+        # ``ru_maxrss`` only grows: the peak of the streams read so far
+        streams[stream] = {"records": records, "seconds": seconds, "peak_rss_mb": peak_rss_mb() - baseline}
+    db.close()
+
+    return {
+        "records": sum(s["records"] for s in streams.values()),
+        "baseline_rss_mb": baseline,
+        "peak_mb": max(s["peak_rss_mb"] for s in streams.values()),
+        "streams": streams,
+    }
+
+
+def measure_loaded(scale, args):
+    """ Load the graph of ``scale`` into the database at ``args.uri`` and measure its extraction """
+
+    import neo4j_utils as nu
+    from benchmarks.check_reaction_parity import load, unload
+    from benchmarks.synthetic_pss import SyntheticPSS
+
+    db = nu.Driver(db_name="neo4j", db_user=args.user, db_passwd=args.password, db_uri=args.uri,
+                   multi_db=False)
+    existing, _ = db.query("MATCH (n) RETURN count(n) AS nodes", raise_errors=True)
+    if existing[0]["nodes"]:
+        sys.exit(f"The database at {args.uri} is not empty.")
+
+    load(db, SyntheticPSS(scale=scale, seed=args.seed))
+    try:
+        cmd = [
+            sys.executable, "-m", "benchmarks.bench_memory", "--single",
+            "--uri", args.uri, "--user", args.user, "--password", args.password,
+            "--batch-size", str(args.batch_size),
+        ]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    finally:
+        unload(db)
+        db.close()
+
+    return {"scale": scale, **json.loads(out.strip().splitlines()[-1])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that extraction memory does not grow with PSS.")
+    parser.add_argument("--scale", type=float, nargs=2, default=[1.0, 4.0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ceiling", type=float, default=1.5,
+                        help="allowed peak at the larger scale, in peaks at the smaller one")
+    parser.add_argument("--uri", default=None,
+                        help="empty Neo4j database to load the graphs into, measuring RSS")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(measure_rss(args.uri, args.user, args.password, args.batch_size)))
+        return
+
+    small, large = sorted(args.scale)
+    if args.uri:
+        runs = [measure_loaded(scale, args) for scale in (small, large)]
+    else:
+        runs = [measure(scale, args.batch_size, args.seed) for scale in (small, large)]
+
+    report = {
+        "benchmark": "extraction_memory",
+        "measure": "rss" if args.uri else "tracemalloc",
+        "driver": "neo4j_utils" if args.uri else "stand-in",
+        "batch_size": args.batch_size,
+        "ceiling": args.ceiling,
+        # RSS may barely grow above the baseline at the smaller scale
+        "growth": runs[1]["peak_mb"] / (max(runs[0]["peak_mb"], 1.0) if args.uri else runs[0]["peak_mb"]),
+        "runs": runs,
+    }
+    report["ok"] = report["growth"] <= args.ceiling
+
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Online writes of a synthetic PSS graph with ``skm.build.online.OnlineWriter``,
+into the in-process stand-in of ``benchmarks.fake_neo4j`` (or, with ``--uri``,
+a running Neo4j).
+
+    python -m benchmarks.bench_online --scale 1 --transient-rate 0.05
+
+The graph is written twice, the second time as an update of the first.
+Against the stand-in, the graph in the database is compared after each pass
+with the graph a full build imports (see
+``benchmarks.check_delta_parity``): its nodes with their labels and
+properties, and its edges by ``(source, type, target, id)``, so parallel
+edges of different reactions must be kept apart. Every label must also have
+been indexed before it was written. Exits with status 1 if a check fails.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from skm.build.delta import ancestor_labels, schema_labels
+from skm.build.online import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, OnlineWriter
+
+SCHEMA_CONFIG = "config/schema_config.yaml"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic graph with the online writer.")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--transient-rate", type=float, default=0.05,
+                        help="share of stand-in transactions failing with a transient error")
+    parser.add_argument("--uri", default=None, help="write into this Neo4j instead of the stand-in")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    args = parser.parse_args()
+
+    from benchmarks.check_delta_parity import SchemaOntology, differences, full_build
+    from benchmarks.fake_neo4j import FakeNeo4j
+    from benchmarks.synthetic_pss import SyntheticPSS, FakeDriver
+    from skm.adapters.pss_adapter import PSSAdapter
+
+    graph = SyntheticPSS(scale=args.scale, seed=args.seed)
+    with tempfile.TemporaryDirectory() as outputdir:
+        graph.write_gene_annotations(os.path.join(outputdir, "gene_annotations.tsv.gz"))
+        adapter = PSSAdapter(outputdir=outputdir, driver=FakeDriver(graph))
+        nodes = list(adapter.get_nodes())
+        edges = list(adapter.get_edges())
+
+    if args.uri:
+        import neo4j_utils as nu
+        db = nu.Driver(db_name="neo4j", db_user=args.user, db_passwd=args.password, db_uri=args.uri,
+                       multi_db=False)
+    else:
+        db = FakeNeo4j(transient_rate=args.transient_rate, seed=args.seed)
+
+    ontology = SchemaOntology(SCHEMA_CONFIG)
+    expected_nodes, expected_edges = full_build(
+        nodes, edges, schema_labels(SCHEMA_CONFIG), ancestor_labels(SCHEMA_CONFIG, ontology)
+    )
+    report = {
+        "benchmark": "online_writer",
+        "nodes": len(expected_nodes),
+        "edges": len(expected_edges),
+        "parallel_edges": len(expected_edges) - len({key[:3] for key in expected_edges}),
+        "passes": [],
+    }
+    ok = True
+
+    for _ in range(2):
+        writer = OnlineWriter(db, schema_config=SCHEMA_CONFIG, batch_size=args.batch_size,
+                              workers=args.workers, ontology=ontology)
+        start = time.perf_counter()
+        writer.nodes(nodes)
+        writer.edges(edges)
+        seconds = time.perf_counter() - start
+        writer.finish()
+
+        result = {
+            "seconds": seconds,
+            "rows_per_s": (len(nodes) + len(edges)) / seconds,
+            "batches": writer.stats["batches"],
+        }
+        if not args.uri:
+            result.update({
+                "transactions": db.transactions,
+                "transient_failures": db.failures,
+                "unindexed_batches": db.scans,
+                "node_differences": differences(expected_nodes, db.nodes),
+                "edge_differences": differences(expected_edges, db.edges),
+            })
+            ok = ok and db.scans == 0 and not any(
+                {**result["node_differences"], **result["edge_differences"]}.values()
+            )
+        report["passes"].append(result)
+
+    report["ok"] = ok
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
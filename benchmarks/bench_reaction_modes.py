@@ -0,0 +1,209 @@
+"""
+Size of the import files of the two reaction modes of the adapter, pairwise
+edges and reaction hypernodes, on a synthetic PSS graph.
+
+    python -m benchmarks.bench_reaction_modes --scale 1 --output modes.json
+
+The nodes and edges are written as tab-separated ``neo4j-admin import``
+files, one header and one data file per label, as BioCypher writes them
+with ``config/biocypher_config.yaml`` (without needing its ontology). With
+``--neo4j-admin``, each set of files is also imported into an empty
+database and the import is timed.
+
+The node and edge counts of the adapter (``get_node_count`` and
+``get_edge_count``, from a snapshot of the graph) are compared with the
+tuples written in each mode. Exits with status 1 if they differ.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from skm.build.delta import schema_labels
+
+MODES = ["pairwise", "hypernode"]
+
+
+def cell(value):
+    if isinstance(value, list):
+        value = "|".join(str(v) for v in value)
+    elif value is None:
+        return ""
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+
+class ImportFiles:
+    """ ``neo4j-admin import`` files per label in ``directory`` """
+
+    def __init__(self, directory, labels):
+        self.directory = directory
+        self.labels = labels
+        self.files = {}
+        self.tuples = {}
+
+    def file(self, kind, label, properties):
+        if label not in self.files:
+            columns = sorted(properties)
+            if kind == "nodes":
+                header = ["id:ID", *columns, "preferred_id", ":LABEL"]
+            else:
+                header = [":START_ID", ":END_ID", *columns, ":TYPE"]
+            with open(os.path.join(self.directory, f"{label}-header.csv"), "w") as f:
+                f.write("\t".join(header) + "\n")
+            self.files[label] = (kind, columns, open(os.path.join(self.directory, f"{label}-part000.csv"), "w"))
+            self.tuples[label] = 0
+        return self.files[label]
+
+    def write_nodes(self, nodes):
+        for _id, _type, props in nodes:
+            label, properties, preferred_id = self.labels[_type]
+            _, columns, f = self.file("nodes", label, properties or ())
+            f.write("\t".join([cell(_id), *(cell(props.get(c)) for c in columns), preferred_id, label]) + "\n")
+            self.tuples[label] += 1
+
+    def write_edges(self, edges):
+        for _, source, target, _type, props in edges:
+            label, properties, _ = self.labels[_type]
+            _, columns, f = self.file("edges", label, properties or ())
+            f.write("\t".join([cell(source), cell(target), *(cell(props.get(c)) for c in columns), label]) + "\n")
+            self.tuples[label] += 1
+
+    def close(self):
+        for _, _, f in self.files.values():
+            f.close()
+
+    def arguments(self):
+        """ ``--nodes``/``--relationships`` arguments of ``neo4j-admin import`` """
+
+        args = []
+        for label, (kind, _, _) in sorted(self.files.items()):
+            option = "--nodes" if kind == "nodes" else "--relationships"
+            header = os.path.join(self.directory, f"{label}-header.csv")
+            # all parts of the label, e.g. after ``skm.build.import_files.reshard``
+            part = os.path.join(self.directory, f"{label}-part.*")
+            args.append(f"{option}={label}={header},{part}")
+        return args
+
+
+def import_seconds(neo4j_admin, files, directory, options=()):
+    """ Time ``neo4j-admin import`` (4.4) of ``files`` into a scratch database """
+
+    home = os.path.join(directory, "neo4j-home")
+    env = {**os.environ, "NEO4J_HOME": home, "NEO4J_CONF": os.path.join(home, "conf")}
+    os.makedirs(env["NEO4J_CONF"], exist_ok=True)
+    with open(os.path.join(env["NEO4J_CONF"], "neo4j.conf"), "w") as f:
+        f.write(f"dbms.directories.data={os.path.join(home, 'data')}\n")
+
+    cmd = [
+        neo4j_admin, "import", "--database=neo4j", "--delimiter=TAB", "--array-delimiter=|",
+        "--skip-duplicate-nodes=true", "--skip-bad-relationships=true", *options, *files.arguments(),
+    ]
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, capture_output=True, env=env)
+    seconds = time.perf_counter() - start
+    shutil.rmtree(home)
+    return seconds
+
+
+def run(scale, seed, mode, batch_size, neo4j_admin=None):
+    from benchmarks.synthetic_pss import SyntheticPSS, FakeDriver
+    from skm.adapters.pss_adapter import PSSAdapter
+    from skm.adapters.pss_snapshot import write_snapshot
+
+    graph = SyntheticPSS(scale=scale, seed=seed)
+    labels = schema_labels("config/schema_config.yaml")
+
+    with tempfile.TemporaryDirectory() as outputdir:
+        graph.write_gene_annotations(os.path.join(outputdir, "gene_annotations.tsv.gz"))
+        adapter = PSSAdapter(
+            outputdir=outputdir,
+            batch_size=batch_size,
+            reaction_mode=mode,
+            driver=FakeDriver(graph),
+        )
+
+        directory = os.path.join(outputdir, mode)
+        os.makedirs(directory)
+        files = ImportFiles(directory, labels)
+
+        start = time.perf_counter()
+        try:
+            files.write_nodes(adapter.get_nodes())
+            files.write_edges(adapter.get_edges())
+        finally:
+            files.close()
+        build_seconds = time.perf_counter() - start
+
+        sizes = {
+            name: os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+        }
+        result = {
+            "scale": scale,
+            "seed": seed,
+            "reaction_mode": mode,
+            "build_seconds": build_seconds,
+            "bytes": sum(sizes.values()),
+            "reaction_bytes": sum(
+                size for name, size in sizes.items() if name.startswith(reaction_labels(labels, mode))
+            ),
+            "tuples": files.tuples,
+            "nodes": sum(n for label, n in files.tuples.items() if files.files[label][0] == "nodes"),
+            "edges": sum(n for label, n in files.tuples.items() if files.files[label][0] == "edges"),
+        }
+        if neo4j_admin:
+            result["import_seconds"] = import_seconds(neo4j_admin, files, outputdir)
+
+        # counts of the same graph, as the adapter sizes its output
+        snapshot = os.path.join(outputdir, "snapshot")
+        write_snapshot(PSSAdapter(outputdir=outputdir, batch_size=batch_size, driver=FakeDriver(graph)), snapshot)
+        counter = PSSAdapter(outputdir=outputdir, snapshot=snapshot, reaction_mode=mode)
+        result["counted"] = {"nodes": counter.get_node_count(), "edges": counter.get_edge_count()}
+        result["counts_ok"] = result["counted"] == {"nodes": result["nodes"], "edges": result["edges"]}
+
+    return result
+
+
+def reaction_labels(labels, mode):
+    """ Prefixes of the files holding the reactions of ``mode`` """
+
+    from skm.adapters.pss_adapter import REACTION_ROLES
+
+    if mode == "hypernode":
+        input_labels = ["reaction", *{_type for _type, _ in REACTION_ROLES.values()}]
+    else:
+        from skm.adapters.pss_adapter import REACTION_PROJECTIONS
+        input_labels = {_type for projections in REACTION_PROJECTIONS.values() for _, _, _type in projections}
+    return tuple(f"{labels[label][0]}-" for label in input_labels if label in labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the import files of the reaction modes.")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--neo4j-admin", default=None, help="neo4j-admin (4.4) executable to time imports")
+    parser.add_argument("--output", default=None, help="JSON file (default: stdout)")
+    args = parser.parse_args()
+
+    results = [
+        run(scale, args.seed, mode, args.batch_size, args.neo4j_admin)
+        for scale in args.scale for mode in MODES
+    ]
+
+    ok = all(result["counts_ok"] for result in results)
+    report = json.dumps({"benchmark": "reaction_modes", "runs": results, "ok": ok}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Memory ceiling of the deferred (incidental) edges of the adapter, kept in a
+``SpillBuffer``, against a plain list.
+
+    python -m benchmarks.bench_spill --edges 2000000 --limit-mb 16
+
+Peak memory is traced (``tracemalloc``) while the edges are appended, while
+the buffer is pickled (as in a checkpoint of the adapter state) and while
+they are read back. Exits with status 1 if the buffer's peak exceeds
+``--ceiling`` times the memory limit, or if the unpickled copy does not read
+back the same edges.
+"""
+
+import argparse
+import json
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from skm.adapters.spill_buffer import SpillBuffer
+
+
+def edges(n, clusters=5000):
+    """ ``functional_cluster_member`` edges, as generated for the genes of the clusters """
+
+    for i in range(n):
+        yield None, f"tair:AT{i % 5 + 1}G{i:08d}", f"skm:FC{i % clusters:06d}", "functional_cluster_member", {}
+
+
+def measure(buffer, n):
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    for edge in edges(n):
+        buffer.append(edge)
+    append_seconds = time.perf_counter() - start
+    _, append_peak = tracemalloc.get_traced_memory()
+
+    tracemalloc.reset_peak()
+    state = pickle.dumps(buffer, pickle.HIGHEST_PROTOCOL)
+    _, pickle_peak = tracemalloc.get_traced_memory()
+
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    count = sum(1 for _ in buffer)
+    read_seconds = time.perf_counter() - start
+    _, read_peak = tracemalloc.get_traced_memory()
+
+    tracemalloc.stop()
+
+    # as restored from a checkpoint
+    copy = pickle.loads(state)
+    return {
+        "edges": count,
+        "restored_edges": sum(1 for _ in copy),
+        "state_mb": len(state) / (1 << 20),
+        "append_seconds": append_seconds,
+        "read_seconds": read_seconds,
+        "append_peak_mb": append_peak / (1 << 20),
+        "pickle_peak_mb": pickle_peak / (1 << 20),
+        "read_peak_mb": read_peak / (1 << 20),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the memory ceiling of the spill buffer.")
+    parser.add_argument("--edges", type=int, default=2_000_000)
+    parser.add_argument("--limit-mb", type=float, default=16.0)
+    parser.add_argument("--ceiling", type=float, default=1.5, help="allowed peak, in memory limits")
+    parser.add_argument("--baseline", action="store_true", help="also measure a plain list")
+    args = parser.parse_args()
+
+    limit = int(args.limit_mb * (1 << 20))
+    # the runs are kept for the unpickled copy, so they are removed with the directory
+    with tempfile.TemporaryDirectory() as directory:
+        buffer = SpillBuffer(memory_limit=limit, directory=directory)
+        result = measure(buffer, args.edges)
+        result["runs"] = len(buffer._runs)
+
+    peak_mb = max(result["append_peak_mb"], result["pickle_peak_mb"], result["read_peak_mb"])
+    report = {
+        "benchmark": "spill_buffer",
+        "limit_mb": args.limit_mb,
+        "ceiling_mb": args.limit_mb * args.ceiling,
+        "spill_buffer": result,
+        "ok": peak_mb <= args.limit_mb * args.ceiling and result["edges"] == result["restored_edges"],
+    }
+    if args.baseline:
+        report["list"] = measure([], args.edges)
+
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
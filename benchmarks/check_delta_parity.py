@@ -0,0 +1,225 @@
+"""
+Parity of incremental builds (``skm.build.delta``) with full builds, on two
+generations of a synthetic PSS graph.
+
+    python -m benchmarks.check_delta_parity --scale 1
+
+Reactions repeating the participants of others are added to the graph, so
+their pairwise edges run parallel to the others' (same source, target and
+type, from another reaction). The first generation is written as a delta
+and applied to the in-process stand-in of ``benchmarks.fake_neo4j``; the
+graph is then edited as a new PSS release would be (node properties
+revised, nodes and reactions removed, more repeated reactions added) and
+the delta of the second generation is applied on top.
+
+After each generation, the graph in the stand-in is compared with the graph
+a full build imports: the adapter output deduplicated as BioCypher does it
+(with its ``Deduplicator``), without the edges of missing nodes, as
+``neo4j-admin import --skip-bad-relationships`` drops them. Nodes are
+compared by ID, with their labels and properties, and edges by ``(source,
+type, target, id)``, with their properties. Labels of ancestor classes come
+from the ``is_a`` entries of the schema configuration (``SchemaOntology``),
+standing in for BioCypher's ontology. Exits with status 1 on a difference.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+import yaml
+
+from skm.build.delta import DeltaBuilder, ancestor_labels, apply_delta, schema_labels
+
+SCHEMA_CONFIG = "config/schema_config.yaml"
+
+
+class SchemaOntology:
+    """ Stand-in for BioCypher's ontology, with the ``is_a`` classes of the schema configuration only """
+
+    def __init__(self, schema_config):
+        with open(schema_config) as f:
+            schema = yaml.safe_load(f)
+
+        self.parents = {}
+        for key, entry in schema.items():
+            if not isinstance(entry, dict) or not entry.get("is_a"):
+                continue
+            is_a = entry["is_a"]
+            chain = [key, *([is_a] if isinstance(is_a, str) else is_a)]
+            for child, parent in zip(chain, chain[1:]):
+                self.parents.setdefault(child, parent)
+
+    def get_ancestors(self, key):
+        while key is not None:
+            yield key
+            key = self.parents.get(key)
+
+
+def set_reactions(graph, reactions):
+    """ Replace the reactions of ``graph``, with the streams derived from them """
+
+    from benchmarks.synthetic_pss import reaction_edge_rows
+
+    graph.streams["reactions"] = reactions
+    graph.streams["reaction_edges"] = [row for res in reactions for row in reaction_edge_rows(res)]
+    graph.streams["reaction_nodes"] = [{"key": res["key"], "reaction": res["reaction"]} for res in reactions]
+    graph._keys.clear()
+
+
+def repeat_reactions(graph, rng, share):
+    """ Add reactions with the participants of a ``share`` of the others """
+
+    reactions = graph.streams["reactions"]
+    key = reactions[-1]["key"]
+    reaction_id = max(res["reaction"]["reaction_id"] for res in reactions)
+    repeated = rng.sample(reactions, max(1, int(len(reactions) * share)))
+    set_reactions(graph, reactions + [
+        {"key": key + i, "reaction": {**res["reaction"], "reaction_id": reaction_id + i}, "path": res["path"]}
+        for i, res in enumerate(repeated, start=1)
+    ])
+
+
+def edit(graph, rng, share):
+    """ Revise, remove and add a ``share`` of the records of ``graph`` """
+
+    for res in rng.sample(graph.streams["functional_clusters"], max(1, int(len(graph.streams["functional_clusters"]) * share))):
+        res["node"] = {**res["node"], "description": f"{res['node']['description']} (revised)"}
+
+    families = graph.streams["families"]
+    removed = set(map(id, rng.sample(families, max(1, int(len(families) * share)))))
+    graph.streams["families"] = [res for res in families if id(res) not in removed]
+
+    reactions = graph.streams["reactions"]
+    removed = set(map(id, rng.sample(reactions, max(1, int(len(reactions) * share)))))
+    set_reactions(graph, [res for res in reactions if id(res) not in removed])
+    repeat_reactions(graph, rng, share)
+
+
+def adapter_output(graph):
+    from benchmarks.synthetic_pss import FakeDriver
+    from skm.adapters.pss_adapter import PSSAdapter
+
+    with tempfile.TemporaryDirectory() as outputdir:
+        graph.write_gene_annotations(os.path.join(outputdir, "gene_annotations.tsv.gz"))
+        adapter = PSSAdapter(outputdir=outputdir, driver=FakeDriver(graph))
+        return list(adapter.get_nodes()), list(adapter.get_edges())
+
+
+def normalized(props):
+    """ Properties as they come back from the JSON lines of a delta """
+
+    return json.loads(json.dumps(props, default=str))
+
+
+def full_build(nodes, edges, labels, ancestors=None):
+    """
+    Nodes and edges of a full build of ``nodes`` and ``edges``, as
+    ``FakeNeo4j`` holds them. Nodes get the labels in ``ancestors`` (see
+    ``skm.build.delta.ancestor_labels``), or their own only.
+    """
+
+    from biocypher._create import BioCypherEdge, BioCypherNode
+    from biocypher._deduplicate import Deduplicator
+
+    deduplicator = Deduplicator()
+
+    graph_nodes = {}
+    for _id, _type, props in nodes:
+        if _type not in labels:
+            continue
+        label, properties, preferred_id = labels[_type]
+        if deduplicator.node_seen(BioCypherNode(_id, label)):
+            continue
+        if properties is not None:
+            props = {k: v for k, v in props.items() if k in properties}
+        props = {**props, "id": _id, "preferred_id": preferred_id}
+        graph_nodes[_id] = (set((ancestors or {}).get(_type, [label])), normalized(props))
+
+    graph_edges = {}
+    for _id, source, target, _type, props in edges:
+        if _type not in labels:
+            continue
+        label, properties, _ = labels[_type]
+        if deduplicator.edge_seen(BioCypherEdge(source, target, label, _id)):
+            continue
+        if source not in graph_nodes or target not in graph_nodes:
+            continue
+        if properties is not None:
+            props = {k: v for k, v in props.items() if k in properties}
+        if _id:
+            props = {**props, "id": _id}
+        graph_edges[(source, label, target, _id or None)] = normalized(props)
+
+    return graph_nodes, graph_edges
+
+
+def differences(expected, actual):
+    """ Keys missing, unexpected and with other values in ``actual`` """
+
+    return {
+        "missing": len(expected.keys() - actual.keys()),
+        "unexpected": len(actual.keys() - expected.keys()),
+        "changed": sum(1 for key in expected.keys() & actual.keys() if expected[key] != actual[key]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare incremental with full builds.")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--share", type=float, default=0.05,
+                        help="share of records repeated, revised or removed per generation")
+    args = parser.parse_args()
+
+    from benchmarks.fake_neo4j import FakeNeo4j
+    from benchmarks.synthetic_pss import SyntheticPSS
+
+    rng = random.Random(args.seed)
+    labels = schema_labels(SCHEMA_CONFIG)
+    ontology = SchemaOntology(SCHEMA_CONFIG)
+    graph = SyntheticPSS(scale=args.scale, seed=args.seed)
+    repeat_reactions(graph, rng, args.share)
+
+    db = FakeNeo4j()
+    report = {"benchmark": "delta_parity", "generations": []}
+    ok = True
+
+    with tempfile.TemporaryDirectory() as deltadir:
+        for generation in (1, 2):
+            if generation > 1:
+                edit(graph, rng, args.share)
+            nodes, edges = adapter_output(graph)
+
+            builder = DeltaBuilder(deltadir, schema_config=SCHEMA_CONFIG, ontology=ontology)
+            builder.nodes(nodes)
+            builder.edges(edges)
+            apply_delta(db, builder.finish())
+
+            expected_nodes, expected_edges = full_build(
+                nodes, edges, labels, ancestor_labels(SCHEMA_CONFIG, ontology)
+            )
+            result = {
+                "generation": generation,
+                "nodes": len(expected_nodes),
+                "edges": len(expected_edges),
+                "parallel_edges": len(expected_edges) - len({key[:3] for key in expected_edges}),
+                "delta": dict(builder.writer.counts),
+                "node_differences": differences(expected_nodes, db.nodes),
+                "edge_differences": differences(expected_edges, db.edges),
+            }
+            result["ok"] = not any(
+                {**result["node_differences"], **result["edge_differences"]}.values()
+            )
+            ok = ok and result["ok"]
+            report["generations"].append(result)
+
+    report["ok"] = ok
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Parity of the reaction edges derived in Cypher (``--server-side-reactions``)
+with those of the Python reaction handlers, against a real Neo4j.
+
+    python -m benchmarks.check_reaction_parity --uri bolt://localhost:7687
+    python -m benchmarks.check_reaction_parity --container neo4j:4.4
+    python -m benchmarks.check_reaction_parity --uri bolt://localhost:7688 --pss
+
+A synthetic PSS graph (see ``benchmarks.synthetic_pss``), plus reactions
+covering edge cases (no or an unknown reaction type, no participants,
+repeated participants, condition modifiers, participants missing from the
+node index), is loaded into an empty database, and the reaction edges of
+both modes are extracted from it. The edges are compared as multisets, with
+their properties, since the rows of a reaction come in no particular order;
+so are the counts of reactions reported with an unknown type. Exits with
+status 1 on a difference.
+
+The synthetic stand-in driver does not interpret Cypher, so this needs a
+Neo4j 4.4: given by ``--uri`` (its database must be empty, and the loaded
+graph is removed afterwards), or started with ``--container`` as a
+throwaway container (requires ``pip install testcontainers``).
+
+With ``--pss``, the database given by ``--uri`` is taken to hold PSS (e.g.
+restored from a dump) and both modes are extracted from it as it is,
+without loading or removing anything. ``--server-side-reactions`` stays off
+by default until this passes against a PSS dump.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from collections import Counter, defaultdict
+
+# Extra label of the loaded nodes, indexed on ``name`` to load relationships
+LOADED = "ParityCheck"
+
+# Loaded with a label outside the node plan, so never in the node index
+ORPHAN = "orphan_0"
+
+# Stands for the reaction itself in the relationships of ``EDGE_CASES``
+REACTION = None
+
+# (reaction type, [(relationship type, start, end, properties)]), with
+# participants as (stream, index) of the synthetic graph
+EDGE_CASES = [
+    # no reaction type
+    (None, [("SUBSTRATE", ("functional_clusters", 0), REACTION, {}),
+            ("PRODUCT", REACTION, ("functional_clusters", 1), {})]),
+    # unknown reaction type
+    ("mystery", [("SUBSTRATE", ("functional_clusters", 0), REACTION, {})]),
+    # unknown reaction type, no participants
+    ("mystery", []),
+    # no participants
+    ("catalysis", []),
+    # repeated participants
+    ("binding/oligomerisation", [("SUBSTRATE", ("functional_clusters", 2), REACTION, {}),
+                                 ("SUBSTRATE", ("functional_clusters", 2), REACTION, {}),
+                                 ("SUBSTRATE", ("metabolites", 0), REACTION, {}),
+                                 ("PRODUCT", REACTION, ("complexes", 0), {})]),
+    # condition modifier, modifier without a form
+    ("catalysis", [("SUBSTRATE", ("metabolites", 1), REACTION, {}),
+                   ("PRODUCT", REACTION, ("metabolites", 2), {}),
+                   ("ACTIVATES", ("functional_clusters", 3), REACTION, {"source_form": "condition"}),
+                   ("INHIBITS", ("functional_clusters", 4), REACTION, {})]),
+    # participant missing from the node index
+    ("protein activation", [("ACTIVATES", ORPHAN, REACTION, {"source_form": "protein"}),
+                            ("SUBSTRATE", ("functional_clusters", 5), REACTION, {})]),
+    # edge type with properties of its own
+    ("transcriptional/translational repression", [("INHIBITS", ("complexes", 1), REACTION, {}),
+                                                  ("SUBSTRATE", ("functional_clusters", 6), REACTION, {})]),
+    # translocation
+    ("translocation", [("TRANSLOCATE_FROM", ("metabolites", 3), REACTION, {}),
+                       ("TRANSLOCATE_TO", REACTION, ("metabolites", 3), {}),
+                       ("ACTIVATES", ("functional_clusters", 7), REACTION, {})]),
+]
+
+
+def edge_case_reactions(graph, first_id):
+    """ ``EDGE_CASES`` as reactions and relationships of ``graph`` """
+
+    def participant(end, reaction_name):
+        if end is REACTION:
+            return reaction_name
+        if end == ORPHAN:
+            return ORPHAN
+        stream, i = end
+        return graph.names[stream][i]
+
+    reactions = []
+    relationships = []
+    for i, (reaction_type, ends) in enumerate(EDGE_CASES):
+        reaction_id = first_id + i
+        reaction = {"reaction_id": reaction_id}
+        if reaction_type is not None:
+            reaction["reaction_type"] = reaction_type
+        if i % 2:
+            reaction["external_links"] = [f"doi:10.1/parity.{i}", f"pmid:{i}"]
+        reactions.append((f"reaction_{reaction_id}", reaction))
+        relationships += [
+            (_type, participant(start, f"reaction_{reaction_id}"), participant(end, f"reaction_{reaction_id}"), props)
+            for _type, start, end, props in ends
+        ]
+    return reactions, relationships
+
+
+def write(db, statement, rows, batch_size=1000):
+    def run_tx(tx, batch):
+        tx.run(statement, rows=batch).consume()
+
+    for i in range(0, len(rows), batch_size):
+        with db.session() as session:
+            session.write_transaction(run_tx, rows[i:i + batch_size])
+
+
+def load(db, graph):
+    """ Load ``graph`` and the ``EDGE_CASES`` into ``db``; returns the number of reactions """
+
+    from skm.adapters.pss_adapter import NODE_PLAN
+
+    db.query(f"CREATE INDEX IF NOT EXISTS FOR (n:{LOADED}) ON (n.name)", raise_errors=True)
+
+    for stream, label, _, _ in NODE_PLAN:
+        write(db, f"UNWIND $rows AS row CREATE (n:{label}:{LOADED}) SET n = row",
+              [res["node"] for res in graph.streams[stream]])
+    write(db, f"UNWIND $rows AS row CREATE (n:Orphan:{LOADED}) SET n = row", [{"name": ORPHAN}])
+
+    reactions = [(f"reaction_{res['reaction']['reaction_id']}", res["reaction"]) for res in graph.streams["reactions"]]
+    relationships = [
+        (rel.type, rel.start_node["name"], rel.end_node["name"], {k: v for k, v in rel.items() if v is not None})
+        for res in graph.streams["reactions"]
+        for rel in (path.relationships[0] for path in res["path"])
+    ]
+    cases, case_relationships = edge_case_reactions(graph, len(reactions))
+    reactions += cases
+    relationships += case_relationships
+
+    write(db, f"UNWIND $rows AS row CREATE (r:Reaction:{LOADED}) SET r = row.props, r.name = row.name",
+          [{"name": name, "props": props} for name, props in reactions])
+
+    by_type = defaultdict(list)
+    for _type, source, target, props in relationships:
+        by_type[_type].append({"source": source, "target": target, "props": props})
+    for _type, rows in by_type.items():
+        write(db, (
+            "UNWIND $rows AS row "
+            f"MATCH (a:{LOADED} {{name: row.source}}) MATCH (b:{LOADED} {{name: row.target}}) "
+            f"CREATE (a)-[r:{_type}]->(b) SET r = row.props"
+        ), rows)
+
+    return len(reactions)
+
+
+def unload(db):
+    """ Remove the loaded graph """
+
+    while True:
+        result, _ = db.query(
+            f"MATCH (n:{LOADED}) WITH n LIMIT 10000 DETACH DELETE n RETURN count(*) AS deleted",
+            raise_errors=True,
+        )
+        if not result or not result[0]["deleted"]:
+            break
+    db.query(f"DROP INDEX ON :{LOADED}(name)")
+
+
+def reaction_edges(adapter):
+    """ Multiset of the reaction edges of ``adapter``, and its error counts """
+
+    edges = Counter()
+    for stage, _, tuples in adapter.get_edge_stages():
+        for _id, source, target, _type, props in tuples:
+            if stage == "reactions":
+                edges[(_id, source, target, _type, json.dumps(props, sort_keys=True))] += 1
+    return edges, adapter.metrics.errors()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the parity of server-side and Python reaction edges.")
+    parser.add_argument("--scale", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--uri", default=None, help="empty Neo4j database to load the graph into")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--container", default=None, metavar="IMAGE",
+                        help="start a throwaway Neo4j from this image (e.g. neo4j:4.4) instead")
+    parser.add_argument("--pss", action="store_true",
+                        help="compare on the PSS held by the database at --uri, loading nothing")
+    parser.add_argument("--annotation-mirror", default=None,
+                        help="directory to copy the CKN gene annotations from (with --pss)")
+    args = parser.parse_args()
+
+    if (args.uri is None) == (args.container is None):
+        parser.error("give one of --uri or --container")
+    if args.pss and args.container:
+        parser.error("--pss needs a database holding PSS, given by --uri")
+
+    import neo4j_utils as nu
+
+    from benchmarks.synthetic_pss import SyntheticPSS
+    from skm.adapters.metrics import UNKNOWN_REACTION_TYPE
+    from skm.adapters.pss_adapter import PSSAdapter
+
+    container = None
+    if args.container:
+        from testcontainers.neo4j import Neo4jContainer
+
+        container = Neo4jContainer(args.container)
+        container.start()
+        args.uri, args.user, args.password = container.get_connection_url(), container.username, container.password
+
+    try:
+        db = nu.Driver(db_name="neo4j", db_user=args.user, db_passwd=args.password, db_uri=args.uri,
+                       multi_db=False)
+        if args.pss:
+            graph = None
+            counted, _ = db.query("MATCH (r:Reaction) RETURN count(r) AS reactions", raise_errors=True)
+            reactions = counted[0]["reactions"]
+        else:
+            existing, _ = db.query("MATCH (n) RETURN count(n) AS nodes", raise_errors=True)
+            if existing[0]["nodes"]:
+                sys.exit(f"The database at {args.uri} is not empty.")
+            graph = SyntheticPSS(scale=args.scale, seed=args.seed)
+            reactions = load(db, graph)
+
+        try:
+            with tempfile.TemporaryDirectory() as outputdir:
+                if graph is not None:
+                    graph.write_gene_annotations(os.path.join(outputdir, "gene_annotations.tsv.gz"))
+                options = {"outputdir": outputdir, "driver": db, "batch_size": args.batch_size,
+                           "annotation_mirror": args.annotation_mirror}
+                python, python_errors = reaction_edges(PSSAdapter(**options))
+                server, server_errors = reaction_edges(PSSAdapter(**options, server_side_reactions=True))
+        finally:
+            if container is None and not args.pss:
+                unload(db)
+        db.close()
+    finally:
+        if container is not None:
+            container.stop()
+
+    unknown = {
+        "python": python_errors.get(UNKNOWN_REACTION_TYPE, 0),
+        "server_side": server_errors.get(UNKNOWN_REACTION_TYPE, 0),
+    }
+    ok = python == server and unknown["python"] == unknown["server_side"]
+    report = {
+        "benchmark": "reaction_parity",
+        "source": "pss" if args.pss else "synthetic",
+        "reactions": reactions,
+        "python_edges": sum(python.values()),
+        "server_side_edges": sum(server.values()),
+        "unknown_reaction_types": unknown,
+        # a few edges of one mode only, with their surplus
+        "python_only": [[*edge, n] for edge, n in list((python - server).items())[:5]],
+        "server_side_only": [[*edge, n] for edge, n in list((server - python).items())[:5]],
+        "ok": ok,
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
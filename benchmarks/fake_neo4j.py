@@ -0,0 +1,193 @@
+"""
+In-process stand-in for a writable ``neo4j_utils.Driver``, holding the graph
+written by ``skm.build.online.OnlineWriter`` or ``skm.build.delta.apply_delta``.
+
+Like ``benchmarks.synthetic_pss.FakeDriver``, it does not interpret Cypher:
+the statements of the writers are matched against their templates. Write
+transactions fail with a ``TransientError`` at ``transient_rate``, before
+changing anything, as deadlocked transactions do, and ``write_transaction``
+retries them as the driver's managed transactions do, up to ``RETRIES``
+times.
+
+Nodes are held by ID, with their labels and properties, and relationships
+by ``(source, type, target, id)``, with ``id`` the ``id`` property (``None``
+if they have none). A ``MERGE`` without an ID matches the relationships of
+its type between the two nodes, whatever their ID.
+"""
+
+import random
+import re
+import threading
+
+from neo4j.exceptions import TransientError
+
+from skm.build.delta import (
+    EDGE_DELETE_STATEMENT,
+    EDGE_ID_DELETE_STATEMENT,
+    EDGE_ID_UPSERT_STATEMENT,
+    EDGE_UPSERT_STATEMENT,
+    NODE_DELETE_STATEMENT,
+    NODE_UPSERT_STATEMENT,
+)
+from skm.build.online import CONSTRAINT_STATEMENT, INDEX_STATEMENT
+
+# Retries of a failing write transaction, standing in for the time budget
+# of the driver (``max_transaction_retry_time``)
+RETRIES = 10
+
+
+def template_pattern(template):
+    """ Regex matching the statements formatted from ``template`` """
+
+    pattern = re.escape(template.replace("{{", "{").replace("}}", "}"))
+    for field in re.findall(r"(?<!\{)\{(\w+)\}(?!\})", template):
+        # labels, or several joined with colons
+        pattern = pattern.replace(re.escape(f"{{{field}}}"), f"(?P<{field}>[\\w:]+)")
+    return re.compile(pattern + "$")
+
+
+SCHEMA_PATTERNS = [template_pattern(CONSTRAINT_STATEMENT), template_pattern(INDEX_STATEMENT)]
+
+# (pattern, method of ``FakeNeo4j``, whether relationships are matched on their ID)
+STATEMENT_PATTERNS = [
+    (template_pattern(NODE_UPSERT_STATEMENT), "merge_node", False),
+    (template_pattern(NODE_DELETE_STATEMENT), "delete_node", False),
+    (template_pattern(EDGE_UPSERT_STATEMENT), "merge_edge", False),
+    (template_pattern(EDGE_ID_UPSERT_STATEMENT), "merge_edge", True),
+    (template_pattern(EDGE_DELETE_STATEMENT), "delete_edge", False),
+    (template_pattern(EDGE_ID_DELETE_STATEMENT), "delete_edge", True),
+]
+
+
+class FakeResult:
+
+    def consume(self):
+        return None
+
+
+class FakeWriteTransaction:
+
+    def __init__(self, db):
+        self.db = db
+
+    def run(self, query, rows=()):
+        self.db.execute(query, rows)
+        return FakeResult()
+
+
+class FakeWriteSession:
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def write_transaction(self, fn, *args, **kwargs):
+        for _ in range(RETRIES + 1):
+            with self.db.lock:
+                self.db.transactions += 1
+                fail = self.db.rng.random() < self.db.transient_rate
+                if fail:
+                    self.db.failures += 1
+            if not fail:
+                return fn(FakeWriteTransaction(self.db), *args, **kwargs)
+        raise TransientError("Deadlock detected (stand-in)")
+
+
+class FakeNeo4j:
+    """ In-process stand-in for a ``neo4j_utils.Driver`` of a writable database """
+
+    def __init__(self, transient_rate=0.0, seed=0):
+        self.transient_rate = transient_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        # id -> (labels, properties)
+        self.nodes = {}
+        # (source, type, target) -> {id: properties}
+        self._edges = {}
+        self.indexed = set()
+        self.transactions = 0
+        self.failures = 0
+        # node batches written before their label was indexed
+        self.scans = 0
+
+    @property
+    def edges(self):
+        """ ``(source, type, target, id)`` -> properties """
+
+        return {(*key, _id): props for key, group in self._edges.items() for _id, props in group.items()}
+
+    def query(self, query, rows=None, **kwargs):
+        for pattern in SCHEMA_PATTERNS:
+            match = pattern.match(query)
+            if match:
+                self.indexed.add(match["label"])
+                return [], None
+        if rows is not None:
+            self.execute(query, rows)
+            return [], None
+        raise ValueError(f"Unexpected query {query}")
+
+    def session(self, **kwargs):
+        return FakeWriteSession(self)
+
+    def execute(self, query, rows):
+        for pattern, method, by_id in STATEMENT_PATTERNS:
+            match = pattern.match(query)
+            if match:
+                break
+        else:
+            raise ValueError(f"Unexpected statement {query}")
+
+        with self.lock:
+            if method == "merge_node" and match["label"] not in self.indexed:
+                self.scans += 1
+            for row in rows:
+                getattr(self, method)(match, row, by_id)
+
+    def has_node(self, label, _id):
+        return _id in self.nodes and label in self.nodes[_id][0]
+
+    def merge_node(self, match, row, by_id):
+        label = match["label"]
+        if row["id"] in self.nodes and not self.has_node(label, row["id"]):
+            raise ValueError(f"The stand-in holds one node per ID, {row['id']} is not a {label}")
+        labels = self.nodes[row["id"]][0] if row["id"] in self.nodes else {label}
+        if match.groupdict().get("labels"):
+            labels = labels | set(match["labels"].split(":"))
+        self.nodes[row["id"]] = (labels, dict(row["props"]))
+
+    def delete_node(self, match, row, by_id):
+        if not self.has_node(match["label"], row["id"]):
+            return
+        del self.nodes[row["id"]]
+        for key in [key for key in self._edges if row["id"] in (key[0], key[2])]:
+            del self._edges[key]
+
+    def merge_edge(self, match, row, by_id):
+        # MATCH finds no endpoint: nothing is merged
+        if not (self.has_node(match["source_label"], row["source"])
+                and self.has_node(match["target_label"], row["target"])):
+            return
+        group = self._edges.setdefault((row["source"], match["type"], row["target"]), {})
+        props = dict(row["props"])
+        if by_id:
+            group[row["id"]] = props
+        else:
+            # SET r = row.props on every relationship matched
+            group.clear()
+            group[props.get("id")] = props
+
+    def delete_edge(self, match, row, by_id):
+        if not (self.has_node(match["source_label"], row["source"])
+                and self.has_node(match["target_label"], row["target"])):
+            return
+        key = (row["source"], match["type"], row["target"])
+        group = self._edges.get(key, {})
+        group.pop(row["id"] if by_id else None, None)
+        if not group:
+            self._edges.pop(key, None)
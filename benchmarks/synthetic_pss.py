@@ -0,0 +1,461 @@
+"""
+Seeded generator of PSS-shaped graphs, and an in-process stand-in for
+``neo4j_utils.Driver`` serving them to ``PSSAdapter``.
+
+The stand-in answers the extraction ``QUERIES`` of the adapter (it does not
+interpret Cypher): each query is mapped back to its stream and served from
+the generated records with the same keyset pagination. The subgraph queries
+(``SUBGRAPH_QUERIES`` and those of ``skm.adapters.subgraph``) and the
+fingerprint queries are answered from the generated records as well.
+"""
+
+import bisect
+import gzip
+import random
+from itertools import islice
+
+from skm.adapters.pss_adapter import (
+    FINGERPRINT_QUERIES,
+    NODE_STREAMS,
+    QUERIES,
+    REACTION_PROJECTIONS,
+    STRICT_FINGERPRINT_QUERIES,
+    SUBGRAPH_QUERIES,
+)
+from skm.adapters.pss_snapshot import SnapshotNode, SnapshotPath, SnapshotRelationship
+from skm.adapters.subgraph import (
+    FOREIGN_TARGETS_QUERY,
+    NODE_REACTIONS_QUERY,
+    REACTION_PARTICIPANTS_QUERY,
+    SEED_NODES_QUERY,
+    SEED_REACTIONS_QUERY,
+)
+
+# Number of entities per label at scale 1
+BASE_COUNTS = {
+    "functional_clusters": 1000,
+    "metabolites": 500,
+    "complexes": 200,
+    "foreign_entities": 50,
+    "foreign_abiotics": 30,
+    "foreign_codings": 60,
+    "families": 100,
+    "processes": 100,
+    "pathways": 80,
+    "genes": 6000,
+    "reactions": 3000,
+}
+
+FOREIGN_CLASSIFICATIONS = ["virus", "bacteria", "oomycete"]
+
+LOCATIONS = ["cytoplasm", "nucleus", "chloroplast", "plasma membrane", "extracellular"]
+
+FORMS = ["protein", "gene", "metabolite", "complex", "ox", "active"]
+
+# Participant labels and (min, max) fan-out of substrates, products and
+# modifiers per reaction type
+REACTION_SHAPES = {
+    "catalysis": (["metabolites"], ["metabolites"], ["functional_clusters", "complexes"], (1, 3), (1, 3), (1, 4)),
+    "translocation": (["metabolites", "functional_clusters"], ["metabolites", "functional_clusters"], ["functional_clusters"], (1, 1), (1, 1), (0, 2)),
+    "binding/oligomerisation": (["functional_clusters", "metabolites"], ["complexes"], ["functional_clusters"], (2, 6), (1, 1), (0, 2)),
+    "degradation/secretion": (["functional_clusters", "metabolites"], [], ["functional_clusters"], (1, 2), (0, 0), (1, 3)),
+    "transcriptional/translational repression": (["functional_clusters"], [], ["functional_clusters", "complexes"], (1, 2), (0, 0), (1, 3)),
+    "transcriptional/translational activation": (["functional_clusters"], [], ["functional_clusters", "complexes", "foreign_codings"], (1, 2), (0, 0), (1, 3)),
+    "protein activation": (["functional_clusters"], [], ["functional_clusters", "metabolites", "foreign_entities"], (1, 2), (0, 0), (1, 3)),
+    "protein deactivation": (["functional_clusters"], [], ["functional_clusters", "metabolites", "foreign_abiotics"], (1, 2), (0, 0), (1, 3)),
+    "dissociation": (["complexes"], ["functional_clusters", "metabolites"], ["functional_clusters"], (1, 1), (2, 4), (0, 1)),
+    "unknown": (["functional_clusters"], ["functional_clusters"], [], (1, 1), (1, 1), (0, 0)),
+}
+
+
+class SyntheticPSS:
+    """
+    PSS-shaped graph with ``scale`` times the ``BASE_COUNTS`` entities.
+
+    Records are generated in the form the adapter reads them from the
+    driver, keyed by stream.
+    """
+
+    def __init__(self, scale=1.0, seed=0):
+        self.scale = scale
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.counts = {k: max(1, int(v * scale)) for k, v in BASE_COUNTS.items()}
+
+        self.genes = [f"AT{1 + i % 5}G{i:05d}" for i in range(self.counts["genes"])]
+        self.pathways = [f"Pathway {i}" for i in range(self.counts["pathways"])]
+        self.names = {}
+        self.streams = {}
+        self._keys = {}
+
+        key = 0
+        for stream, make in [
+            ("functional_clusters", self.functional_cluster),
+            ("metabolites", self.metabolite),
+            ("complexes", self.node),
+            ("foreign_entities", self.foreign_entity),
+            ("foreign_abiotics", self.node),
+            ("foreign_codings", self.node),
+            ("families", self.node),
+            ("processes", self.node),
+        ]:
+            records = []
+            names = []
+            for i in range(self.counts[stream]):
+                key += 1
+                name = f"{stream}_{i}"
+                names.append(name)
+                records.append({"key": key, "node": make(name, i)})
+            self.names[stream] = names
+            self.streams[stream] = records
+
+        self.streams["foreign_edges"] = [
+            {"key": i, "source": source, "target": self.rng.choice(self.names["foreign_entities"])}
+            for i, source in enumerate(self.names["foreign_codings"])
+        ]
+
+        self.streams["reactions"] = [
+            self.reaction(key + i, i) for i in range(self.counts["reactions"])
+        ]
+        self.streams["reaction_edges"] = [
+            row for res in self.streams["reactions"] for row in reaction_edge_rows(res)
+        ]
+        self.streams["reaction_nodes"] = [
+            {"key": res["key"], "reaction": res["reaction"]} for res in self.streams["reactions"]
+        ]
+
+    def common(self, name):
+        props = {"name": name, "description": f"Description of {name}"}
+        if self.rng.random() < 0.5:
+            props["all_pathways"] = self.rng.sample(self.pathways, self.rng.randint(1, 3))
+        return props
+
+    def node(self, name, i):
+        return self.common(name)
+
+    def functional_cluster(self, name, i):
+        props = self.common(name)
+        props.update({
+            "functional_cluster_id": i,
+            "short_name": name.upper(),
+            # as projected by the query (see ``PROJECTED_PROPERTIES``)
+            "additional_information": f"Cluster {i}",
+            "ath_homologues": self.rng.sample(self.genes, self.rng.randint(1, 5)),
+        })
+        return props
+
+    def metabolite(self, name, i):
+        props = self.common(name)
+        if self.rng.random() < 0.7:
+            props["external_links"] = [f"chebi:{10000 + i}", f"kegg:C{i:05d}"]
+        return props
+
+    def foreign_entity(self, name, i):
+        props = self.common(name)
+        props["classification"] = self.rng.choice(FOREIGN_CLASSIFICATIONS)
+        props["external_links"] = [f"ncbitaxon:{20000 + i}"]
+        return props
+
+    def participants(self, labels, fan_out):
+        if not labels:
+            return []
+        n = self.rng.randint(*fan_out)
+        return [self.rng.choice(self.names[self.rng.choice(labels)]) for _ in range(n)]
+
+    def relationship(self, _type, start, end):
+        return SnapshotPath(SnapshotRelationship(
+            _type,
+            SnapshotNode(name=start),
+            SnapshotNode(name=end),
+            {
+                "source_location": self.rng.choice(LOCATIONS),
+                "source_form": "condition" if self.rng.random() < 0.05 else self.rng.choice(FORMS),
+                "target_location": self.rng.choice(LOCATIONS),
+                "target_form": self.rng.choice(FORMS),
+            },
+        ))
+
+    def reaction(self, key, i):
+        reaction_type = self.rng.choice(list(REACTION_SHAPES))
+        substrate_labels, product_labels, modifier_labels, n_s, n_p, n_m = REACTION_SHAPES[reaction_type]
+
+        reaction_name = f"reaction_{i}"
+        substrate_type, product_type = (
+            ("TRANSLOCATE_FROM", "TRANSLOCATE_TO") if reaction_type == "translocation"
+            else ("SUBSTRATE", "PRODUCT")
+        )
+
+        path = [self.relationship(substrate_type, name, reaction_name)
+                for name in self.participants(substrate_labels, n_s)]
+        path += [self.relationship(product_type, reaction_name, name)
+                 for name in self.participants(product_labels, n_p)]
+        path += [self.relationship(self.rng.choice(["ACTIVATES", "INHIBITS"]), name, reaction_name)
+                 for name in self.participants(modifier_labels, n_m)]
+
+        reaction = {"reaction_id": i, "reaction_type": reaction_type}
+        if self.rng.random() < 0.8:
+            reaction["external_links"] = [f"doi:10.{1000 + i}/pss.{j}" for j in range(self.rng.randint(1, 3))]
+
+        return {"key": key, "reaction": reaction, "path": path}
+
+    def write_gene_annotations(self, path):
+        """ Write a CKN-like annotation table covering the generated genes """
+
+        columns = ["node_ID", "TAIR", "short_name", "synonyms", "full_name", "GMM", "node_type"]
+        with gzip.open(path, "wt") as f:
+            f.write("\t".join(columns) + "\n")
+            for i, gene in enumerate(self.genes):
+                f.write("\t".join([
+                    gene,
+                    gene,
+                    f"G{i}",
+                    f"G{i}a|G{i}b",
+                    f"Gene {i}",
+                    f"{i % 35}.{i % 7}|{i % 11}.1",
+                    "protein_coding",
+                ]) + "\n")
+
+    def records(self):
+        return sum(len(v) for v in self.streams.values())
+
+    def keys(self, stream):
+        """ Sorted record keys of ``stream`` """
+
+        if stream not in self._keys:
+            self._keys[stream] = [res["key"] for res in self.streams.get(stream, [])]
+        return self._keys[stream]
+
+    def entity_records(self, name):
+        """ Records of the ``STRICT_FINGERPRINT_QUERIES`` query ``name`` """
+
+        cached = f"fingerprint_{name}"
+        if cached in self.streams:
+            return self.streams[cached]
+
+        if name == "nodes":
+            records = [
+                {"id": res["key"], "kind": [stream], "properties": res["node"]}
+                for stream in NODE_STREAMS for res in self.streams[stream]
+            ]
+            records += [
+                {"id": res["key"], "kind": ["Reaction"], "properties": res["reaction"]}
+                for res in self.streams["reactions"]
+            ]
+        else:
+            keys = self.node_keys()
+            keys.update({f"reaction_{res['reaction']['reaction_id']}": res["key"] for res in self.streams["reactions"]})
+
+            relationships = [
+                ("GENE_OF", keys[res["source"]], keys[res["target"]], {}) for res in self.streams["foreign_edges"]
+            ]
+            relationships += [
+                (rel.type, keys[rel.start_node["name"]], keys[rel.end_node["name"]], dict(rel.items()))
+                for res in self.streams["reactions"]
+                for rel in (path.relationships[0] for path in res["path"])
+            ]
+            records = [
+                {"id": i, "kind": kind, "source": source, "target": target, "properties": props}
+                for i, (kind, source, target, props) in enumerate(relationships)
+            ]
+
+        self.streams[cached] = records
+        return records
+
+    def fingerprint_records(self, name):
+        """ Rows of the ``FINGERPRINT_QUERIES`` query ``name`` """
+
+        def size(properties):
+            return sum(
+                len(k) + sum(len(str(x)) for x in (v if isinstance(v, list) else [v]))
+                for k, v in properties.items() if v is not None
+            )
+
+        rows = {}
+        for record in self.entity_records(name):
+            kind = record["kind"]
+            row = rows.setdefault(str(kind), {"kind": kind, "count": 0, "ids": 0, "size": 0})
+            row["count"] += 1
+            row["ids"] += record["id"]
+            row["size"] += size(record["properties"])
+            if name == "relationships":
+                row["sources"] = row.get("sources", 0) + record["source"]
+                row["targets"] = row.get("targets", 0) + record["target"]
+        return list(rows.values())
+
+    def node_keys(self):
+        """ Entity name -> key """
+
+        return {
+            res["node"]["name"]: res["key"] for stream in NODE_STREAMS for res in self.streams[stream]
+        }
+
+    def subgraph_records(self, stream, subgraph_nodes, subgraph_reactions):
+        """ Records of ``stream`` in a subgraph, as ``SUBGRAPH_QUERIES`` match them """
+
+        nodes = set(subgraph_nodes)
+        if stream in NODE_STREAMS:
+            return [res for res in self.streams[stream] if res["key"] in nodes]
+        if stream == "foreign_edges":
+            keys = self.node_keys()
+            return [
+                res for res in self.streams[stream]
+                if keys[res["source"]] in nodes and keys[res["target"]] in nodes
+            ]
+        reactions = set(subgraph_reactions)
+        return [res for res in self.streams[stream] if res["key"] in reactions]
+
+    def seed_nodes(self, names, functional_clusters, pathways):
+        return [
+            res["key"] for stream in NODE_STREAMS for res in self.streams[stream]
+            if res["node"]["name"] in names
+            or str(res["node"].get("functional_cluster_id")) in functional_clusters
+            or set(res["node"].get("all_pathways", [])) & set(pathways)
+        ]
+
+    def seed_reactions(self, reactions):
+        return [res["key"] for res in self.streams["reactions"] if str(res["reaction"]["reaction_id"]) in reactions]
+
+    def reaction_keys(self, roles):
+        """ Reaction key -> keys of its participants by ``roles`` """
+
+        keys = self.node_keys()
+        return {
+            res["key"]: {
+                keys[node["name"]]
+                for path in res["path"] if path.relationships[0].type in roles
+                for node in (path.relationships[0].start_node, path.relationships[0].end_node)
+                if node["name"] in keys
+            }
+            for res in self.streams["reactions"]
+        }
+
+    def node_reactions(self, keys, roles):
+        keys = set(keys)
+        return [key for key, participants in self.reaction_keys(roles).items() if participants & keys]
+
+    def reaction_participants(self, keys, roles):
+        participants = self.reaction_keys(roles)
+        return list(set().union(*(participants[key] for key in keys)))
+
+    def foreign_targets(self, keys):
+        node_keys = self.node_keys()
+        keys = set(keys)
+        return list({
+            node_keys[res["target"]] for res in self.streams["foreign_edges"] if node_keys[res["source"]] in keys
+        })
+
+
+def reaction_edge_rows(res):
+    """
+    Rows of the ``reaction_edges`` query for one reaction record. This is a
+    Python model of the query for benchmarking; its parity with the Python
+    handlers is checked against Neo4j by ``benchmarks.check_reaction_parity``.
+    """
+
+    reaction = res["reaction"]
+    relationships = [path.relationships[0] for path in res["path"]]
+    roles = {
+        "substrates": [rel.start_node["name"] for rel in relationships
+                       if rel.type in ("SUBSTRATE", "TRANSLOCATE_FROM")],
+        "products": [rel.end_node["name"] for rel in relationships
+                     if rel.type in ("PRODUCT", "TRANSLOCATE_TO")],
+        "modifiers": [rel.start_node["name"] for rel in relationships
+                      if rel.type in ("INHIBITS", "ACTIVATES") and rel["source_form"] != "condition"],
+    }
+
+    pairs = []
+    for sources, targets, _type in REACTION_PROJECTIONS.get(reaction.get("reaction_type"), []):
+        items = roles[sources]
+        if targets == "permutations":
+            pairs += [(a, b, _type) for i, a in enumerate(items) for j, b in enumerate(items) if i != j]
+        else:
+            pairs += [(a, b, _type) for a in items for b in roles[targets]]
+
+    dois = [x for x in reaction.get("external_links", []) if x.startswith("doi:")]
+    return [
+        {"key": res["key"], "source": source, "target": target, "type": _type,
+         "reaction_id": reaction["reaction_id"], "reaction_type": reaction.get("reaction_type"),
+         "participants": len(relationships), "dois": dois}
+        for source, target, _type in pairs or [(None, None, None)]
+    ]
+
+
+class FakeRecord(dict):
+
+    def data(self):
+        return dict(self)
+
+
+class FakeTransaction:
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.streams = {query: stream for stream, query in QUERIES.items()}
+        self.subgraph_streams = {query: stream for stream, query in SUBGRAPH_QUERIES.items()}
+        self.fingerprint_queries = {
+            **{query: (graph.fingerprint_records, name) for name, query in FINGERPRINT_QUERIES.items()},
+            **{query: (graph.entity_records, name) for name, query in STRICT_FINGERPRINT_QUERIES.items()},
+        }
+        self.subgraph_keys = {
+            SEED_NODES_QUERY: graph.seed_nodes,
+            SEED_REACTIONS_QUERY: graph.seed_reactions,
+            NODE_REACTIONS_QUERY: graph.node_reactions,
+            REACTION_PARTICIPANTS_QUERY: graph.reaction_participants,
+            FOREIGN_TARGETS_QUERY: graph.foreign_targets,
+        }
+
+    def run(self, query, last_key=-1, batch_size=1000, **params):
+        if query in self.subgraph_keys:
+            return [FakeRecord(keys=self.subgraph_keys[query](**params))]
+
+        if query in self.fingerprint_queries:
+            # a single aggregate or full scan, not paginated
+            records, name = self.fingerprint_queries[query]
+            return [FakeRecord(res) for res in records(name)]
+
+        if query in self.subgraph_streams:
+            stream = self.subgraph_streams[query]
+            records = self.graph.subgraph_records(stream, **params)
+            start = bisect.bisect_right([res["key"] for res in records], last_key)
+        else:
+            stream = self.streams[query]
+            records = self.graph.streams.get(stream, [])
+            start = bisect.bisect_right(self.graph.keys(stream), last_key)
+
+        # records are sorted by key; a page holds batch_size distinct keys
+        page = []
+        keys = 0
+        previous = None
+        for res in islice(records, start, None):
+            if res["key"] != previous:
+                keys += 1
+                previous = res["key"]
+                if keys > batch_size:
+                    break
+            page.append(FakeRecord(res))
+        return page
+
+
+class FakeSession:
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def read_transaction(self, fn, *args, **kwargs):
+        return fn(FakeTransaction(self.graph), *args, **kwargs)
+
+
+class FakeDriver:
+    """ In-process stand-in for ``neo4j_utils.Driver`` serving a ``SyntheticPSS`` """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def session(self, **kwargs):
+        return FakeSession(self.graph)
@@ -1,28 +1,383 @@
-from biocypher import BioCypher, Resource
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+from biocypher import BioCypher, Resource, config
 from skm.adapters.pss_adapter import (
     PSSAdapter,
 )
+from skm.adapters.subgraph import DEFAULT_HOPS, Subgraph
+from skm.build.checkpoint import CheckpointedBuild
+from skm.build.dedup import Deduplicator
+from skm.build.delta import DeltaBuilder
+from skm.build.fingerprint import BuildFingerprint, build_fingerprint
+from skm.build.import_files import reshard, tune_import_call
+from skm.build.online import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, OnlineWriter
+from skm.build.pipeline import Pipeline
+
+logger = logging.getLogger("biocypher")
+
+parser = argparse.ArgumentParser(description="Build the PSS knowledge graph.")
+parser.add_argument(
+    "--snapshot",
+    default=None,
+    help="build from an offline PSS snapshot directory instead of the pss service",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="number of PSS extraction queries to run concurrently",
+)
+parser.add_argument(
+    "--node-index",
+    default=None,
+    help="SQLite file persisting the PSS name to node ID index between runs",
+)
+parser.add_argument(
+    "--server-side-reactions",
+    action="store_true",
+    help="derive reaction edges in Cypher instead of walking reaction paths in Python "
+    "(experimental: not yet checked against PSS, see benchmarks/check_reaction_parity.py)",
+)
+parser.add_argument(
+    "--reaction-processes",
+    type=int,
+    default=1,
+    help="number of processes running the reaction handlers",
+)
+parser.add_argument(
+    "--reaction-mode",
+    choices=["pairwise", "hypernode"],
+    default="pairwise",
+    help="write reactions as edges between each pair of participants, "
+    "or as nodes linked to their participants by role edges",
+)
+parser.add_argument(
+    "--incidental-memory-mb",
+    type=int,
+    default=64,
+    help="memory for the edges deferred from the node pass, spilled to disk beyond it",
+)
+parser.add_argument(
+    "--annotation-mirror",
+    default=None,
+    help="directory holding gene_annotations.tsv.gz, used instead of downloading it",
+)
+parser.add_argument(
+    "--refresh-annotations",
+    action="store_true",
+    help="revalidate the downloaded gene annotations against the server",
+)
+parser.add_argument(
+    "--annotation-sha256",
+    default=None,
+    help="SHA-256 digest the gene annotations must have; without it, downloads are only "
+    "checked for completeness",
+)
+parser.add_argument(
+    "--dedup",
+    choices=["exact", "disk", "bloom"],
+    default=None,
+    help="drop duplicate nodes and edges before writing",
+)
+parser.add_argument(
+    "--merge-edges",
+    action="store_true",
+    help="merge the properties of duplicate edges (with --dedup exact or disk)",
+)
+parser.add_argument(
+    "--metrics",
+    choices=["json", "prometheus"],
+    default="json",
+    help="format of the adapter metrics written next to the BioCypher log",
+)
+parser.add_argument(
+    "--delta",
+    default=None,
+    help="write only the changes since the previous build recorded in this directory, "
+    "as a delta to apply to the deployed database (no import files are written)",
+)
+parser.add_argument(
+    "--online",
+    default=None,
+    help="write into the running Neo4j at this URI (e.g. bolt://localhost:7687) "
+    "instead of writing import files",
+)
+parser.add_argument(
+    "--online-user",
+    default="neo4j",
+    help="user of the database written with --online",
+)
+parser.add_argument(
+    "--online-password",
+    default="password",
+    help="password of the database written with --online",
+)
+parser.add_argument(
+    "--online-batch-size",
+    type=int,
+    default=DEFAULT_BATCH_SIZE,
+    help="rows per transaction with --online",
+)
+parser.add_argument(
+    "--online-workers",
+    type=int,
+    default=DEFAULT_WORKERS,
+    help="concurrent write transactions with --online",
+)
+parser.add_argument(
+    "--pipeline",
+    action="store_true",
+    help="run the adapter on producer threads feeding the writers through bounded queues",
+)
+parser.add_argument(
+    "--checkpoint",
+    action="store_true",
+    help="write the import files stage by stage, checkpointing after each",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="resume an unfinished checkpointed build after its last checkpoint (implies --checkpoint)",
+)
+parser.add_argument(
+    "--output-directory",
+    default=None,
+    help="BioCypher output directory (default: from the BioCypher config); "
+    "must be the same to resume a build",
+)
+parser.add_argument(
+    "--part-mb",
+    type=int,
+    default=None,
+    help="rewrite the import files as parts of at most this size, read in parallel by neo4j-admin",
+)
+parser.add_argument(
+    "--gzip",
+    action="store_true",
+    help="gzip the import file parts (with --part-mb)",
+)
+parser.add_argument(
+    "--sort-nodes",
+    action="store_true",
+    help="sort the node import files by ID (with --part-mb)",
+)
+parser.add_argument(
+    "--import-processors",
+    type=int,
+    default=None,
+    help="number of processors used by neo4j-admin import",
+)
+parser.add_argument(
+    "--high-io",
+    action="store_true",
+    help="tell neo4j-admin import that the storage handles parallel IO well (e.g. SSDs)",
+)
+parser.add_argument(
+    "--seed-pathway",
+    action="append",
+    default=[],
+    help="build only the subgraph around the entities of this pathway (repeatable)",
+)
+parser.add_argument(
+    "--seed-functional-cluster",
+    action="append",
+    default=[],
+    help="build only the subgraph around this functional cluster ID (repeatable)",
+)
+parser.add_argument(
+    "--seed-reaction",
+    action="append",
+    default=[],
+    help="build only the subgraph around this reaction ID (repeatable)",
+)
+parser.add_argument(
+    "--seed-name",
+    action="append",
+    default=[],
+    help="build only the subgraph around the PSS entity of this name (repeatable)",
+)
+parser.add_argument(
+    "--hops",
+    type=int,
+    default=DEFAULT_HOPS,
+    help="reactions between the seeds and the furthest entities of the subgraph",
+)
+parser.add_argument(
+    "--strict-fingerprint",
+    action="store_true",
+    help="fingerprint PSS from all of its nodes and relationships, reading all of it, "
+    "instead of from aggregates (also detects edits keeping the size of a property)",
+)
+parser.add_argument(
+    "--force",
+    action="store_true",
+    help="rebuild even if the inputs are unchanged since the last build",
+)
+args = parser.parse_args()
+
+args.checkpoint = args.checkpoint or args.resume
+if args.checkpoint and (args.delta or args.online or args.pipeline or args.dedup):
+    parser.error("--checkpoint and --resume cannot be combined with --delta, --online, --pipeline or --dedup")
+if args.delta and args.online:
+    parser.error("--delta and --online cannot be combined")
+if (args.gzip or args.sort_nodes) and args.part_mb is None:
+    parser.error("--gzip and --sort-nodes require --part-mb")
+
+subgraph = None
+if args.seed_pathway or args.seed_functional_cluster or args.seed_reaction or args.seed_name:
+    if args.snapshot or args.delta:
+        parser.error("subgraph seeds cannot be combined with --snapshot or --delta")
+    subgraph = Subgraph(
+        pathways=args.seed_pathway,
+        functional_clusters=args.seed_functional_cluster,
+        reactions=args.seed_reaction,
+        names=args.seed_name,
+        hops=args.hops,
+    )
+
+# Output directory of the import files: as given, as configured or, as
+# BioCypher would name it, a new one per build
+output_directory = args.output_directory or config("biocypher").get("output_directory")
+persistent_output = output_directory is not None
+if not persistent_output:
+    output_directory = os.path.join("biocypher-out", datetime.now().strftime("%Y%m%d%H%M%S"))
+output_directory = os.path.abspath(output_directory)
 
 # Instantiate the BioCypher interface
 # You can use `config/biocypher_config.yaml` to configure the framework or
 # supply settings via parameters below
-bc = BioCypher()
-
-bc.show_ontology_structure(to_disk="./")
+bc = BioCypher(output_directory=output_directory)
 
 # Create a protein adapter instance
 adapter = PSSAdapter(
-    outputdir = "./data"
+    outputdir = "./data",
+    snapshot = args.snapshot,
+    workers = args.workers,
+    node_index = args.node_index,
+    server_side_reactions = args.server_side_reactions,
+    reaction_processes = args.reaction_processes,
+    reaction_mode = args.reaction_mode,
+    incidental_memory = args.incidental_memory_mb << 20,
+    subgraph = subgraph,
+    annotation_mirror = args.annotation_mirror,
+    refresh_annotations = args.refresh_annotations,
+    annotation_sha256 = args.annotation_sha256,
+    strict_fingerprint = args.strict_fingerprint,
 )
 
+# Options that change the output; the others only change how it is built
+# (e.g. --workers, --pipeline or --resume) or where its inputs come from
+OUTPUT_OPTIONS = [
+    "server_side_reactions",
+    "reaction_mode",
+    "dedup",
+    "merge_edges",
+    "seed_pathway",
+    "seed_functional_cluster",
+    "seed_reaction",
+    "seed_name",
+    "hops",
+    "part_mb",
+    "gzip",
+    "sort_nodes",
+    "import_processors",
+    "high_io",
+]
+
+# Skip the build if its inputs are unchanged since the last one (import
+# files only; without an output directory, each build writes a new one)
+fingerprint = None
+if not (args.delta or args.online) and persistent_output:
+    fingerprint = build_fingerprint(adapter, {option: getattr(args, option) for option in OUTPUT_OPTIONS})
+    last_build = BuildFingerprint(output_directory)
+    changed = last_build.changed(fingerprint)
+    if not changed and not args.force:
+        logger.info("Inputs unchanged since the last build, skipping the build.")
+        sys.exit(0)
+    logger.info(f"Building, changed inputs: {', '.join(changed) or 'none (forced)'}.")
+    last_build.remove()
+
+bc.show_ontology_structure(to_disk="./")
 
 # Create a knowledge graph from the adapter
-bc.write_nodes(adapter.get_nodes())
-bc.write_edges(adapter.get_edges())
+nodes = adapter.get_nodes()
+edges = adapter.get_edges()
+
+if args.dedup:
+    dedup = Deduplicator(mode=args.dedup, merge_edges=args.merge_edges, metrics=adapter.metrics)
+    nodes = dedup.nodes(nodes)
+    edges = dedup.edges(edges)
+
+if args.pipeline:
+    pipeline = Pipeline()
+    nodes = pipeline.stage("nodes", nodes)
+    edges = pipeline.stage("edges", edges, after=nodes)
+
+try:
+    if args.checkpoint:
+        CheckpointedBuild(
+            bc,
+            adapter,
+            resume=args.resume,
+            fingerprint=fingerprint and fingerprint["fingerprint"],
+        ).run()
+    elif args.delta:
+        # labels of ancestor classes, as for online builds
+        delta = DeltaBuilder(args.delta, ontology=bc._get_ontology())
+        delta.nodes(nodes)
+        delta.edges(edges)
+        delta.finish()
+    elif args.online:
+        import neo4j_utils as nu
+
+        writer = OnlineWriter(
+            nu.Driver(
+                db_name="neo4j",
+                db_user=args.online_user,
+                db_passwd=args.online_password,
+                db_uri=args.online,
+                multi_db=False,
+            ),
+            batch_size=args.online_batch_size,
+            workers=args.online_workers,
+            # for the labels of ancestor classes, as in the import files;
+            # BioCypher has no public accessor for its ontology
+            ontology=bc._get_ontology(),
+        )
+        writer.nodes(nodes)
+        writer.edges(edges)
+        writer.finish()
+    else:
+        bc.write_nodes(nodes)
+        bc.write_edges(edges)
+finally:
+    if args.pipeline:
+        pipeline.close()
+
+if args.pipeline:
+    pipeline.log_report()
+
+if args.dedup:
+    dedup.report()
+
+adapter.metrics.write(format=args.metrics)
+
+if not (args.delta or args.online):
+    # Write admin import statement
+    bc.write_import_call()
+
+    if args.part_mb:
+        reshard(output_directory, part_bytes=args.part_mb << 20, compress=args.gzip, sort_nodes=args.sort_nodes)
+    if args.import_processors or args.high_io:
+        tune_import_call(output_directory, processors=args.import_processors, high_io=args.high_io)
 
-# Write admin import statement
-bc.write_import_call()
+    bc.write_schema_info(as_node=True)
 
-bc.write_schema_info(as_node=True)
+    if fingerprint is not None:
+        last_build.save(fingerprint)
 # Print summary
 # bc.summary()
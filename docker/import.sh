@@ -1,2 +1,10 @@
 #!/bin/bash
-bash import/$BC_TABLE_NAME/neo4j-admin-import-call.sh
+# skip the import if the build is the one imported last (see skm.build.fingerprint)
+FINGERPRINT=import/$BC_TABLE_NAME/build-fingerprint.json
+IMPORTED=import/$BC_TABLE_NAME/imported-fingerprint.json
+if [ -f $FINGERPRINT ] && cmp -s $FINGERPRINT $IMPORTED; then
+  echo "Build unchanged since the last import, skipping the import."
+  exit 0
+fi
+rm -f $IMPORTED
+bash import/$BC_TABLE_NAME/neo4j-admin-import-call.sh && if [ -f $FINGERPRINT ]; then cp $FINGERPRINT $IMPORTED; fi
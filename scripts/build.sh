@@ -3,5 +3,5 @@ cd /usr/app/
 cp -r /src/* .
 cp config/biocypher_docker_config.yaml config/biocypher_config.yaml
 poetry install
-python3 create_knowledge_graph.py
+python3 create_knowledge_graph.py --resume
 chmod -R 777 biocypher-log
\ No newline at end of file
@@ -1,9 +1,17 @@
 #!/bin/bash -c -e
 sleep 2
 ls /data/build2neo/neo4j-admin-import-call.sh
+# skip the import if the build is the one imported last (see skm.build.fingerprint)
+FINGERPRINT=/data/build2neo/build-fingerprint.json
+IMPORTED=/data/build2neo/imported-fingerprint.json
+if [ -f $FINGERPRINT ] && [ -d /data/databases/neo4j ] && cmp -s $FINGERPRINT $IMPORTED; then
+  echo "Build unchanged since the last import, skipping the import."
+  exit 0
+fi
+rm -f $IMPORTED
 if [ -f /data/build2neo/neo4j-admin-import-call.sh ]; then
   chmod +x /data/build2neo/neo4j-admin-import-call.sh
-  /data/build2neo/neo4j-admin-import-call.sh
+  /data/build2neo/neo4j-admin-import-call.sh && if [ -f $FINGERPRINT ]; then cp $FINGERPRINT $IMPORTED; fi
 fi
 neo4j start
 sleep 10
@@ -0,0 +1,205 @@
+"""
+Local cache of the CKN gene annotation table.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+CHUNK_SIZE = 1 << 20
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def check_gzip(path):
+    """ Read a gzip file to the end, raising on truncated or corrupt data """
+
+    with gzip.open(path, "rb") as f:
+        while f.read(CHUNK_SIZE):
+            pass
+
+
+class AnnotationCache:
+    """
+    Downloaded copy of the CKN annotation table in ``directory``.
+
+    Downloads go to a temporary file that is only moved in place once its
+    size (against Content-Length) and gzip stream check out, so an
+    interrupted download never leaves a corrupt table. Only with ``sha256``
+    is the content itself verified, so that a complete but different table
+    is rejected too. The checksum, ETag and Last-Modified of the copy are
+    kept in a ``.json`` file next to it.
+
+    With ``refresh``, an existing copy is revalidated with a conditional
+    request and only downloaded again if it changed on the server; if the
+    server cannot be reached, the copy is used as it is. With a ``mirror``
+    directory holding the table, it is copied from there instead of
+    downloaded, for offline builds.
+    """
+
+    def __init__(
+        self,
+        directory,
+        url,
+        filename="gene_annotations.tsv.gz",
+        mirror=None,
+        sha256=None,
+        refresh=False,
+        timeout=60,
+    ):
+        self.directory = Path(directory)
+        self.url = url
+        self.path = self.directory / filename
+        self.meta_path = self.directory / f"{filename}.json"
+        self.mirror = Path(mirror) if mirror is not None else None
+        self.sha256 = sha256
+        self.refresh = refresh
+        self.timeout = timeout
+
+    def read_meta(self):
+        if not self.meta_path.exists():
+            return None
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def write_meta(self, meta):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, self.meta_path)
+
+    def valid(self, meta):
+        """ Whether the local copy is the one described by ``meta`` """
+
+        if meta is None or not self.path.exists():
+            return False
+        if self.path.stat().st_size != meta["size"]:
+            return False
+        return self.sha256 is None or meta["sha256"] == self.sha256
+
+    def fetch(self):
+        """ Make sure a verified copy of the table is present, returns its path """
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta = self.read_meta()
+
+        if self.mirror is not None:
+            return self.fetch_mirror(meta)
+
+        if self.path.exists() and meta is None:
+            # copy from before the cache, or placed by hand: adopt it
+            try:
+                meta = self.install(self.path, {"url": self.url})
+            except (OSError, EOFError, ValueError) as e:
+                logger.warning(f"Discarding corrupt {self.path} ({e}).")
+                os.remove(self.path)
+            else:
+                if not self.refresh:
+                    return self.path
+
+        if self.valid(meta) and not self.refresh:
+            return self.path
+
+        try:
+            self.download(meta if self.valid(meta) else None)
+        except (URLError, OSError) as e:
+            if not self.valid(meta):
+                raise
+            logger.warning(f"Could not revalidate {self.url} ({e}), using {self.path}.")
+
+        return self.path
+
+    def fetch_mirror(self, meta):
+        source = self.mirror / self.path.name
+        if not source.exists():
+            raise FileNotFoundError(f"No {self.path.name} in mirror {self.mirror}")
+
+        checksum = sha256_file(source)
+        if self.valid(meta) and meta["sha256"] == checksum:
+            return self.path
+
+        logger.info(f"Copying gene annotations from mirror {source}.")
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp_path)
+            self.install(tmp_path, {"url": str(source)})
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return self.path
+
+    def download(self, meta):
+        """ (Conditionally) download the table """
+
+        from urllib.request import Request, urlopen
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = urlopen(Request(self.url, headers=headers), timeout=self.timeout)
+        except HTTPError as e:
+            if e.code == 304:
+                logger.info(f"Gene annotations at {self.url} are unchanged.")
+                return
+            raise
+
+        logger.info(f"Downloading gene annotations (CKN) to {self.path}.")
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with response, os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(response, f, CHUNK_SIZE)
+                expected_size = response.headers.get("Content-Length")
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+
+            if expected_size is not None and os.path.getsize(tmp_path) != int(expected_size):
+                raise OSError(
+                    f"Incomplete download of {self.url}: "
+                    f"{os.path.getsize(tmp_path)} of {expected_size} bytes"
+                )
+
+            self.install(tmp_path, {
+                "url": self.url,
+                "etag": etag,
+                "last_modified": last_modified,
+            })
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def install(self, tmp_path, meta):
+        """ Verify a file and move it in place as the local copy """
+
+        checksum = sha256_file(tmp_path)
+        if self.sha256 is not None and checksum != self.sha256:
+            raise ValueError(f"Checksum mismatch for {meta['url']}: {checksum}")
+        check_gzip(tmp_path)
+
+        meta = {**meta, "sha256": checksum, "size": os.path.getsize(tmp_path)}
+        if Path(tmp_path) != self.path:
+            os.replace(tmp_path, self.path)
+        self.write_meta(meta)
+        return meta
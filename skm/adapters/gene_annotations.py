@@ -0,0 +1,178 @@
+"""
+Gene annotations from the CKN node table, for genes of functional clusters.
+"""
+
+import logging
+import os
+import pickle
+import re
+import sys
+import tempfile
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+
+class GeneAnnotations:
+    """
+    Read-only store of CKN gene annotations, keyed by TAIR ID.
+
+    Only the columns used for gene nodes are read, and each is kept as a
+    tuple of interned strings, so repeated values (node types, GoMapMan
+    bins, ...) are stored once. The table is loaded on the first lookup and
+    a fresh property dict is built for every lookup, so callers can extend
+    it without touching the store.
+
+    Values are normalised for writing when the table is loaded, a column
+    at a time (see ``normalise``), so a lookup does no parsing: array
+    columns are split into tuples of items, and missing values are left
+    out of the properties.
+    """
+
+    # CKN column -> gene property
+    COLUMNS = {
+        "short_name": "name",
+        "synonyms": "synonyms",
+        "full_name": "description",
+        "GMM": "gomapman_annotations",
+        "node_type": "type",
+    }
+
+    # CKN columns holding ``SOURCE_DELIMITER`` separated lists (``str[]`` properties)
+    ARRAY_COLUMNS = {"synonyms", "GMM"}
+
+    SOURCE_DELIMITER = "|"
+
+    # removed from all values: quotes, and the delimiters of the import
+    # files (tab, and ``array_delimiter`` within array items)
+    STRIPPED = r"[\"'\t\r\n]"
+
+    # properties shared by all genes
+    CONSTANTS = {
+        "taxon": "ncbitaxon:3702",
+        "species": "Arabidopsis thaliana",
+    }
+
+    # version of the binary cache layout
+    CACHE_VERSION = 2
+
+    def __init__(self, path, cache_path=None):
+        self.path = path
+        self.cache_path = cache_path
+        self._index = None
+        self._columns = None
+
+    def load(self):
+        if self._index is not None:
+            return
+
+        if self.cache_path is not None and self.load_cache():
+            return
+
+        import pandas as pd
+
+        logger.info(f"Loading gene annotations from {self.path}.")
+
+        node_df = pd.read_csv(
+            self.path,
+            usecols=["node_ID", "TAIR", *self.COLUMNS],
+            dtype=str,
+            na_values=[''],
+            keep_default_na=False,
+            sep="\t",
+            compression="gzip",
+        )
+        node_df = node_df[~node_df["TAIR"].isna()].reset_index(drop=True)
+
+        self._index = {node_id: i for i, node_id in enumerate(node_df["node_ID"])}
+        self._columns = tuple(
+            tuple(self.normalise(node_df[column], column in self.ARRAY_COLUMNS))
+            for column in self.COLUMNS
+        )
+
+        if self.cache_path is not None:
+            self.write_cache()
+
+    @classmethod
+    def normalise(cls, column, array):
+        """
+        Write-ready values of a table ``column``: strings without
+        ``STRIPPED`` characters (interned), tuples of the non-empty items
+        of arrays, ``None`` for missing values.
+        """
+
+        text = column.str.replace(cls.STRIPPED, "", regex=True)
+
+        if not array:
+            return [sys.intern(v) if isinstance(v, str) and v else None for v in text.str.strip()]
+
+        # one delimiter between items, without blanks around them or at the ends
+        delimiter = re.escape(cls.SOURCE_DELIMITER)
+        text = text.str.replace(rf"\s*{delimiter}[\s{delimiter}]*", cls.SOURCE_DELIMITER, regex=True)
+        return [
+            tuple(map(sys.intern, v.split(cls.SOURCE_DELIMITER))) if isinstance(v, str) and v else None
+            for v in text.str.strip(f" {cls.SOURCE_DELIMITER}")
+        ]
+
+    def source_stamp(self):
+        stat = os.stat(self.path)
+        return [self.CACHE_VERSION, list(self.COLUMNS), stat.st_size, stat.st_mtime_ns]
+
+    def load_cache(self):
+        """
+        Load the parsed table from the binary cache, if it was built from
+        the current annotation file.
+        """
+
+        try:
+            with open(self.cache_path, "rb") as f:
+                stamp = pickle.load(f)
+                if stamp != self.source_stamp():
+                    return False
+                node_ids, self._columns = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+
+        self._index = {node_id: i for i, node_id in enumerate(node_ids)}
+        logger.info(f"Loaded gene annotations from cache {self.cache_path}.")
+        return True
+
+    def write_cache(self):
+        """
+        Store the parsed table as pickled columns. Repeated strings are
+        pickled once, so the cache keeps them shared when loaded.
+        """
+
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(self.source_stamp(), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump((tuple(self._index), self._columns), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.cache_path)
+
+    def __contains__(self, tair):
+        self.load()
+        return tair in self._index
+
+    def __len__(self):
+        self.load()
+        return len(self._index)
+
+    def __getitem__(self, tair):
+        self.load()
+        i = self._index[tair]
+
+        props = {
+            prop: list(v) if isinstance(v, tuple) else v
+            for prop, column in zip(self.COLUMNS.values(), self._columns)
+            if (v := column[i]) is not None
+        }
+        props.update(self.CONSTANTS)
+        return props
+
+    def get(self, tair, default=None):
+        try:
+            return self[tair]
+        except KeyError:
+            return default
@@ -0,0 +1,187 @@
+"""
+Per-stage metrics and error counters of the PSS adapter.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+# Error categories counted by the adapter
+MISSING_PARTICIPANT = "missing_participant"
+UNKNOWN_REACTION_TYPE = "unknown_reaction_type"
+PROCESSING_EXCEPTION = "processing_exception"
+# Duplicate edges dropped with properties differing from the edge kept
+CONFLICTING_DUPLICATE = "conflicting_duplicate"
+
+# Characters of a failing record kept in a sample
+SAMPLE_LENGTH = 500
+
+
+class StageMetrics:
+    """ Counters of one adapter stage, incremented on the hot path """
+
+    __slots__ = ("name", "rows_in", "tuples_out", "seconds", "errors")
+
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = 0
+        self.tuples_out = 0
+        self.seconds = 0.0
+        self.errors = Counter()
+
+    def as_dict(self):
+        return {
+            "rows_in": self.rows_in,
+            "tuples_out": self.tuples_out,
+            "seconds": self.seconds,
+            "errors": dict(self.errors),
+        }
+
+
+class AdapterMetrics:
+    """
+    Timings, row and tuple counts and error counts by category of the
+    adapter stages, with a few sampled failing records per category.
+
+    Counting is an attribute increment, nothing is logged per row: a summary
+    line is logged when a stage ends, and ``write`` exports the report next
+    to the BioCypher log, as JSON or as a Prometheus textfile.
+
+    Stage times are wall-clock, so for generator stages they include the
+    time the consumer spends between tuples.
+    """
+
+    def __init__(self, sample_size=5):
+        self.sample_size = sample_size
+        self.stages = {}
+        self.samples = {}
+
+    @contextmanager
+    def stage(self, name):
+        """ Time the stage ``name`` and yield its counters """
+
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageMetrics(name)
+
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds += time.perf_counter() - start
+            logger.info(
+                f"Stage {name}: {stage.rows_in} rows in, {stage.tuples_out} tuples out, "
+                f"{sum(stage.errors.values())} errors, {stage.seconds:.2f} s."
+            )
+
+    def error(self, stage, category, record=None, exc=None):
+        """ Count an error of ``category`` in ``stage``, sampling the first ones """
+
+        if stage not in self.stages:
+            self.stages[stage] = StageMetrics(stage)
+        stage = self.stages[stage]
+        stage.errors[category] += 1
+
+        samples = self.samples.setdefault(category, [])
+        if len(samples) < self.sample_size:
+            samples.append({
+                "stage": stage.name,
+                "error": repr(exc) if exc is not None else None,
+                "record": repr(record)[:SAMPLE_LENGTH],
+            })
+
+    def merge(self, other):
+        """ Add the counters and samples of ``other``, e.g. from a worker process """
+
+        for name, theirs in other.stages.items():
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            stage = self.stages[name]
+            stage.rows_in += theirs.rows_in
+            stage.tuples_out += theirs.tuples_out
+            stage.seconds += theirs.seconds
+            stage.errors.update(theirs.errors)
+
+        for category, theirs in other.samples.items():
+            samples = self.samples.setdefault(category, [])
+            samples.extend(theirs[:self.sample_size - len(samples)])
+
+    def errors(self):
+        """ Error counts by category over all stages """
+
+        total = Counter()
+        for stage in self.stages.values():
+            total.update(stage.errors)
+        return dict(total)
+
+    def report(self):
+        return {
+            "stages": {name: stage.as_dict() for name, stage in self.stages.items()},
+            "errors": self.errors(),
+            "samples": self.samples,
+        }
+
+    def prometheus(self, prefix="skm_adapter"):
+        """ The report in the Prometheus text exposition format """
+
+        metrics = [
+            ("stage_seconds", "gauge", "Wall-clock time of the stage.", "seconds"),
+            ("rows_in_total", "counter", "Source records read by the stage.", "rows_in"),
+            ("tuples_out_total", "counter", "Node or edge tuples yielded by the stage.", "tuples_out"),
+        ]
+
+        lines = []
+        for name, kind, help_text, attr in metrics:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for stage in self.stages.values():
+                lines.append(f'{prefix}_{name}{{stage="{stage.name}"}} {getattr(stage, attr)}')
+
+        lines.append(f"# HELP {prefix}_errors_total Errors by stage and category.")
+        lines.append(f"# TYPE {prefix}_errors_total counter")
+        for stage in self.stages.values():
+            for category, count in stage.errors.items():
+                lines.append(
+                    f'{prefix}_errors_total{{stage="{stage.name}",category="{category}"}} {count}'
+                )
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None, format="json"):
+        """
+        Write the report, by default as ``pss_adapter_metrics.{json,prom}``
+        in the directory of the BioCypher log. Returns the path written.
+        """
+
+        if format not in ("json", "prometheus"):
+            raise ValueError(f"Unknown metrics format {format}")
+
+        if path is None:
+            # BioCypher's log file, if it logs to disk
+            directory = "."
+            for handler in logger.handlers:
+                if isinstance(handler, logging.FileHandler):
+                    directory = os.path.dirname(handler.baseFilename)
+                    break
+            path = os.path.join(
+                directory, "pss_adapter_metrics." + ("json" if format == "json" else "prom")
+            )
+
+        # Prometheus' textfile collector must not see partial files
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            if format == "json":
+                json.dump(self.report(), f, indent=2)
+            else:
+                f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+        logger.info(f"Adapter metrics written to {path}.")
+        return path
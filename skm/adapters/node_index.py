@@ -0,0 +1,197 @@
+"""
+Persistent identity index of the PSS nodes.
+
+Maps the PSS ``name`` of every node to the ID resolved by the ``process_*``
+methods of ``PSSAdapter`` (e.g. ``chebi:...``, ``ncbitaxon:...``,
+``skm:...`` or ``pss:...``). The index also keeps the incidental edges that
+are found while processing nodes (functional cluster members, pathway
+memberships). It is kept in a SQLite file, so edges can be generated in a
+different process than nodes, or without a prior ``get_nodes`` pass.
+
+The index is rebuilt by every node pass, and records the fingerprint of the
+PSS content it was built from, so an edges-only run only trusts an index of
+the current content.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+
+class NodeIndex:
+    """
+    Dict-like, SQLite-backed mapping of PSS node names to node IDs.
+
+    Writes are buffered and committed every ``batch_size`` entries. Reads
+    see buffered writes, so the index can replace the in-memory
+    ``node_lookup`` dict of the adapter.
+    """
+
+    def __init__(self, path, batch_size=10000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_edges = []
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        # readers in other processes are not blocked by the writer
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS node_ids (name TEXT PRIMARY KEY, id TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS incidental_edges ("
+            "source TEXT NOT NULL, target TEXT NOT NULL, type TEXT NOT NULL, "
+            "PRIMARY KEY (source, target, type))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+
+    def __setitem__(self, name, _id):
+        with self._lock:
+            self._pending[name] = _id
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name in self._pending:
+                return self._pending[name]
+            row = self._conn.execute(
+                "SELECT id FROM node_ids WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        self.commit()
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM node_ids").fetchone()[0]
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def items(self):
+        self.commit()
+        with self._lock:
+            rows = self._conn.execute("SELECT name, id FROM node_ids").fetchall()
+        return rows
+
+    def add_edge(self, source, target, _type):
+        with self._lock:
+            self._pending_edges.append((source, target, _type))
+            if len(self._pending_edges) >= self.batch_size:
+                self._flush()
+
+    def edges(self):
+        """ Incidental edges as ``(source, target, type)`` """
+
+        self.commit()
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, source, target, type FROM incidental_edges "
+                    "WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, self.batch_size),
+                ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            for _, source, target, _type in rows:
+                yield source, target, _type
+
+    def _flush(self):
+        if self._pending:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO node_ids (name, id) VALUES (?, ?)",
+                self._pending.items(),
+            )
+            self._pending = {}
+        if self._pending_edges:
+            # edges are a set, repeated node passes do not duplicate them
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO incidental_edges (source, target, type) VALUES (?, ?, ?)",
+                self._pending_edges,
+            )
+            self._pending_edges = []
+        self._conn.commit()
+
+    def commit(self):
+        with self._lock:
+            self._flush()
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+            self._pending_edges = []
+            self._conn.execute("DELETE FROM node_ids")
+            self._conn.execute("DELETE FROM incidental_edges")
+            self._conn.execute("DELETE FROM meta WHERE key = 'complete'")
+            self._conn.commit()
+
+    def resolved(self, source):
+        """
+        Whether all PSS nodes have been resolved into the index, from the
+        ``source`` (a JSON-serialisable fingerprint of the PSS content)
+        """
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'complete'"
+            ).fetchone()
+        return row is not None and row[0] == json.dumps(source, sort_keys=True)
+
+    def mark_complete(self, source):
+        with self._lock:
+            self._flush()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('complete', ?)",
+                (json.dumps(source, sort_keys=True),),
+            )
+            self._conn.commit()
+
+    def close(self):
+        self.commit()
+        with self._lock:
+            self._conn.close()
+
+
+class IndexedEdges:
+    """
+    List-like view on the incidental edges of a ``NodeIndex``, standing in
+    for the adapter's ``incidental_edges`` list.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def append(self, edge):
+        _id, source, target, _type, props = edge
+        self.index.add_edge(source, target, _type)
+
+    def __iter__(self):
+        for source, target, _type in self.index.edges():
+            yield None, source, target, _type, {}
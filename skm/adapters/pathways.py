@@ -0,0 +1,153 @@
+"""
+Pathway memberships of the PSS nodes.
+"""
+
+import logging
+from array import array
+from bisect import bisect_left
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+
+class PathwayIndex:
+    """
+    Compact index of pathway memberships.
+
+    Node IDs and pathway names are interned to integers, and the members of
+    each pathway are kept as an array of node integers, sorted and
+    deduplicated on first read. Overlaps between pathways are computed on
+    bitsets (Python ints) of their members, built on demand.
+
+    ``nodes`` and ``edges`` generate the pathway nodes and the
+    ``in_pathway`` edges, with the resolved IDs of the member nodes.
+    """
+
+    def __init__(self):
+        self._node_ids = {}
+        self._nodes = []
+        self._pathway_ids = {}
+        self._pathways = []
+        self._members = []
+        self._sorted = []
+        self._bitsets = {}
+        self._node_pathways = None
+
+    def _node(self, node_id):
+        i = self._node_ids.get(node_id)
+        if i is None:
+            i = self._node_ids[node_id] = len(self._nodes)
+            self._nodes.append(node_id)
+        return i
+
+    def _pathway(self, pathway):
+        i = self._pathway_ids.get(pathway)
+        if i is None:
+            i = self._pathway_ids[pathway] = len(self._pathways)
+            self._pathways.append(pathway)
+            self._members.append(array("I"))
+            self._sorted.append(True)
+        return i
+
+    def add(self, node_id, pathways):
+        """ Add the node ``node_id`` to each of ``pathways`` """
+
+        node = self._node(node_id)
+        for pathway in pathways:
+            p = self._pathway(pathway)
+            members = self._members[p]
+            if members and members[-1] >= node:
+                self._sorted[p] = False
+            members.append(node)
+            self._bitsets.pop(p, None)
+        self._node_pathways = None
+
+    def _member_ids(self, p):
+        if not self._sorted[p]:
+            self._members[p] = array("I", sorted(set(self._members[p])))
+            self._sorted[p] = True
+        return self._members[p]
+
+    def _bitset(self, p):
+        bits = self._bitsets.get(p)
+        if bits is None:
+            bits = 0
+            for node in self._member_ids(p):
+                bits |= 1 << node
+            self._bitsets[p] = bits
+        return bits
+
+    def __len__(self):
+        return len(self._pathways)
+
+    def __iter__(self):
+        return iter(self._pathways)
+
+    def __contains__(self, pathway):
+        return pathway in self._pathway_ids
+
+    def members(self, pathway):
+        """ IDs of the nodes in ``pathway`` """
+
+        return [self._nodes[node] for node in self._member_ids(self._pathway_ids[pathway])]
+
+    def size(self, pathway):
+        return len(self._member_ids(self._pathway_ids[pathway]))
+
+    def is_member(self, node_id, pathway):
+        node = self._node_ids.get(node_id)
+        if node is None or pathway not in self._pathway_ids:
+            return False
+        members = self._member_ids(self._pathway_ids[pathway])
+        i = bisect_left(members, node)
+        return i < len(members) and members[i] == node
+
+    def pathways_of(self, node_id):
+        """ Pathways of the node ``node_id`` """
+
+        if self._node_pathways is None:
+            node_pathways = {}
+            for p in range(len(self._pathways)):
+                for node in self._member_ids(p):
+                    node_pathways.setdefault(node, array("I")).append(p)
+            self._node_pathways = node_pathways
+
+        node = self._node_ids.get(node_id)
+        return [self._pathways[p] for p in self._node_pathways.get(node, [])]
+
+    def overlap(self, a, b):
+        """ Number of nodes in both pathways ``a`` and ``b`` """
+
+        return (self._bitset(self._pathway_ids[a]) & self._bitset(self._pathway_ids[b])).bit_count()
+
+    def jaccard(self, a, b):
+        """ Jaccard index of the members of pathways ``a`` and ``b`` """
+
+        bits_a = self._bitset(self._pathway_ids[a])
+        bits_b = self._bitset(self._pathway_ids[b])
+        union = (bits_a | bits_b).bit_count()
+        return (bits_a & bits_b).bit_count() / union if union else 0.0
+
+    def memberships(self):
+        """ Number of (node, pathway) memberships """
+
+        return sum(len(self._member_ids(p)) for p in range(len(self._pathways)))
+
+    @staticmethod
+    def pathway_id(pathway):
+        return f"pss:{pathway}"
+
+    def nodes(self):
+        """ Pathway node tuples """
+
+        for pathway in self._pathways:
+            yield self.pathway_id(pathway), "pathway", {"name": pathway}
+
+    def edges(self):
+        """ ``in_pathway`` edge tuples from the member nodes to their pathways """
+
+        for p, pathway in enumerate(self._pathways):
+            target = self.pathway_id(pathway)
+            for node in self._member_ids(p):
+                yield None, self._nodes[node], target, "in_pathway", {}
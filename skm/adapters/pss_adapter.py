@@ -1,23 +1,465 @@
+import hashlib
+import json
 import random
 import string
 import os
 from enum import Enum, auto
 from itertools import chain
 from typing import Optional
-from biocypher._logger import logger
+import logging
 
-from urllib.request import urlretrieve
 from pathlib import Path
-from itertools import combinations, product, permutations
-from collections import defaultdict
-
-import neo4j_utils as nu
-import pandas as pd
+from itertools import combinations, product, permutations, groupby, islice
+from operator import itemgetter
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import queue
+import threading
+
+from skm.adapters.annotation_cache import AnnotationCache
+from skm.adapters.gene_annotations import GeneAnnotations
+from skm.adapters.metrics import (
+    AdapterMetrics,
+    MISSING_PARTICIPANT,
+    PROCESSING_EXCEPTION,
+    UNKNOWN_REACTION_TYPE,
+)
+from skm.adapters.node_index import NodeIndex, IndexedEdges
+from skm.adapters.pathways import PathwayIndex
+from skm.adapters.pss_snapshot import PSSSnapshot, decode_path
+from skm.adapters.spill_buffer import DEFAULT_MEMORY_LIMIT, SpillBuffer
+
+logger = logging.getLogger("biocypher")
 
 logger.debug(f"Loading module {__name__}.")
 
 CKN_NODE_URL = 'https://skm.nib.si/downloads/ckn-annot'
 
+# Number of records fetched from PSS per transaction
+DEFAULT_BATCH_SIZE = 1000
+
+# Number of concurrent extraction queries (1 extracts sequentially)
+DEFAULT_WORKERS = 1
+
+# Number of processes running the reaction handlers (1 runs them in-process)
+DEFAULT_REACTION_PROCESSES = 1
+
+# Properties read by every node ``process_*`` method
+COMMON_PROPERTIES = ["name", "description", "all_pathways"]
+
+# Extraction plan for nodes: one query per target type, with the method
+# that processes its records and the only properties that method reads.
+# Labels are in order of precedence, a node carrying several of them is
+# only fetched by the first query.
+NODE_PLAN = [
+    ("functional_clusters", "FunctionalCluster", "process_functional_cluster",
+        ["functional_cluster_id", "short_name", "additional_information", "ath_homologues"]),
+    ("metabolites", "Metabolite", "process_metabolite", ["external_links"]),
+    ("complexes", "Complex", "process_complex", []),
+    ("foreign_entities", "ForeignEntity", "process_foreign_entity", ["external_links", "classification"]),
+    ("foreign_abiotics", "ForeignAbiotic", "process_foreign_abiotic", []),
+    ("foreign_codings", "ForeignCoding", "process_foreign_coding", []),
+    ("families", "Family", "process_family", []),
+    ("processes", "Process", "process_process", []),
+]
+
+
+# Properties cleaned for writing in the projection of the node queries, for
+# all nodes at once instead of per node in the ``process_*`` methods
+PROJECTED_PROPERTIES = {
+    "additional_information": "replace(replace(n.additional_information, '\"', ''), \"'\", '')",
+}
+
+
+def node_query(label, properties, exclude):
+    """
+    Keyset-paginated query for nodes of ``label`` without ``exclude`` labels,
+    projected to ``properties``
+    """
+
+    projection = ", ".join(
+        f"{p}: {PROJECTED_PROPERTIES[p]}" if p in PROJECTED_PROPERTIES else f".{p}"
+        for p in properties
+    )
+    excluded = "".join(f"AND NOT n:{x} " for x in exclude)
+    return (
+        f"MATCH (n:{label}) "
+        "WHERE id(n) > $last_key "
+        f"{excluded}"
+        f"RETURN id(n) AS key, n {{{projection}}} AS node "
+        "ORDER BY key LIMIT $batch_size"
+    )
+
+
+def plan_exclusions():
+    """ Labels excluded from the node query of each planned stream """
+
+    exclusions = {}
+    for i, (stream, label, method, properties) in enumerate(NODE_PLAN):
+        exclude = [x for _, x, _, _ in NODE_PLAN[:i]]
+        if i > 0:
+            exclude = ["ReactionClass", "FunctionalClusterClass"] + exclude
+        exclusions[stream] = exclude
+    return exclusions
+
+
+def plan_node_queries():
+    exclusions = plan_exclusions()
+    return {
+        stream: node_query(label, COMMON_PROPERTIES + properties, exclusions[stream])
+        for stream, label, method, properties in NODE_PLAN
+    }
+
+
+# Keyset-paginated extraction queries. Each query pages on ``$last_key`` and
+# returns its ordering key as ``key``, so memory is bound by ``$batch_size``.
+QUERIES = {
+    **plan_node_queries(),
+    "foreign_edges": (
+        "MATCH (g:ForeignCoding)-[rel]->(n:ForeignEntity) "
+        "WHERE id(rel) > $last_key "
+        "RETURN id(rel) AS key, n.name AS target, g.name AS source "
+        "ORDER BY key LIMIT $batch_size"
+    ),
+    # reactions are paged before expanding their paths, so a page never
+    # splits the participants of one reaction
+    "reactions": (
+        "MATCH (r:Reaction) "
+        "WHERE id(r) > $last_key "
+        "WITH r ORDER BY id(r) LIMIT $batch_size "
+        "OPTIONAL MATCH p=(r)-[]-() "
+        "RETURN id(r) AS key, r AS reaction, collect(p) AS path "
+        "ORDER BY key"
+    ),
+}
+
+NODE_STREAMS = [stream for stream, _, _, _ in NODE_PLAN]
+
+NODE_METHODS = {stream: method for stream, _, method, _ in NODE_PLAN}
+
+EDGE_STREAMS = ["foreign_edges", "reactions"]
+
+# Stages of the node pass, in order
+NODE_STAGES = ["functional_clusters", "other_nodes", "reaction_nodes", "pathways"]
+
+
+# ----
+# Server-side reaction edges
+# ----
+
+# Edge projections of each reaction type, as (sources, targets, edge type),
+# mirroring the ``process_*`` reaction handlers. ``permutations`` pairs the
+# participants of one role with each other.
+REACTION_PROJECTIONS = {
+    "catalysis": [
+        ("substrates", "products", "downstream_metabolite"),
+        ("modifiers", "substrates", "enzyme_substrate"),
+        ("modifiers", "products", "enzyme_product"),
+    ],
+    "translocation": [
+        ("modifiers", "substrates", "transport_substrate"),
+    ],
+    "binding/oligomerisation": [
+        ("substrates", "permutations", "protein_protein_interaction"),
+        ("substrates", "products", "complex_subunits"),
+        ("modifiers", "products", "complex_formation_catalyst"),
+    ],
+    "degradation/secretion": [
+        ("modifiers", "substrates", "enzyme_degradation"),
+    ],
+    "transcriptional/translational repression": [
+        ("modifiers", "substrates", "transcriptional_inhibition"),
+    ],
+    "transcriptional/translational activation": [
+        ("modifiers", "substrates", "transcriptional_activation"),
+    ],
+    "protein activation": [
+        ("modifiers", "substrates", "protein_activation"),
+    ],
+    "protein deactivation": [
+        ("modifiers", "substrates", "protein_inhibition"),
+    ],
+    "dissociation": [
+        ("substrates", "products", "dissociation_product"),
+        ("substrates", "modifiers", "dissociation_catalyst"),
+    ],
+}
+
+# Reaction types without edges
+EDGELESS_REACTION_TYPES = {"unknown", "cleavage/auto-cleavage"}
+
+KNOWN_REACTION_TYPES = set(REACTION_PROJECTIONS) | EDGELESS_REACTION_TYPES
+
+# Reaction properties added per edge type, as in the ``process_*`` handlers
+REACTION_EDGE_PROPERTIES = {
+    "transcriptional_inhibition": {"causal_mechanism": "transcriptional regulation"},
+}
+
+
+def reaction_edge_id(reaction_identifier, source, target):
+    """
+    ID of a pairwise edge of a reaction. BioCypher keeps one edge without ID
+    per source, target and type, so parallel edges of different reactions
+    are told apart by the reaction.
+    """
+
+    return f"{reaction_identifier}:{source}->{target}"
+
+
+def cypher_pairs(sources, targets, _type):
+    """ Cypher list of [source, target, type] for one reaction projection """
+
+    if targets == "permutations":
+        return (
+            f"reduce(acc = [], i IN range(0, size({sources}) - 1) | acc + "
+            f"[j IN range(0, size({sources}) - 1) WHERE j <> i | [{sources}[i], {sources}[j], '{_type}']])"
+        )
+    return f"reduce(acc = [], x IN {sources} | acc + [y IN {targets} | [x, y, '{_type}']])"
+
+
+def reaction_edges_query():
+    """
+    Keyset-paginated query deriving reaction edges in Cypher.
+
+    Participants are split into substrates, products and modifiers and
+    expanded per reaction type, returning one flat row per edge. Reactions
+    without edges return a single row without ``type``, so every page
+    covers its ``$batch_size`` reactions. The rows of a reaction are in no
+    particular order.
+    """
+
+    cases = " ".join(
+        f"WHEN '{reaction_type}' THEN "
+        + " + ".join(cypher_pairs(*projection) for projection in projections)
+        for reaction_type, projections in REACTION_PROJECTIONS.items()
+    )
+    return (
+        "MATCH (r:Reaction) "
+        "WHERE id(r) > $last_key "
+        "WITH r ORDER BY id(r) LIMIT $batch_size "
+        "OPTIONAL MATCH (r)-[e]-() "
+        "WITH r, collect(e) AS rels "
+        "WITH r, size(rels) AS participants, "
+        "[e IN rels WHERE type(e) IN ['SUBSTRATE', 'TRANSLOCATE_FROM'] | startNode(e).name] AS substrates, "
+        "[e IN rels WHERE type(e) IN ['PRODUCT', 'TRANSLOCATE_TO'] | endNode(e).name] AS products, "
+        "[e IN rels WHERE type(e) IN ['INHIBITS', 'ACTIVATES'] "
+        "AND coalesce(e.source_form, '') <> 'condition' | startNode(e).name] AS modifiers "
+        f"WITH r, participants, CASE r.reaction_type {cases} ELSE [] END AS pairs "
+        "UNWIND CASE WHEN pairs = [] THEN [null] ELSE pairs END AS pair "
+        "RETURN id(r) AS key, pair[0] AS source, pair[1] AS target, pair[2] AS type, "
+        "r.reaction_id AS reaction_id, r.reaction_type AS reaction_type, participants, "
+        "[link IN coalesce(r.external_links, []) WHERE link STARTS WITH 'doi:'] AS dois "
+        "ORDER BY key"
+    )
+
+
+QUERIES["reaction_edges"] = reaction_edges_query()
+
+
+# ----
+# Reaction hypernodes
+# ----
+
+# Output modes of reactions: edges between each pair of participants, or a
+# node per reaction linked to its participants by role edges
+REACTION_MODES = ("pairwise", "hypernode")
+
+# Role edge of a reaction participant per relationship type, with the end
+# of the relationship holding the participant
+REACTION_ROLES = {
+    "SUBSTRATE": ("reaction_substrate", "source"),
+    "TRANSLOCATE_FROM": ("reaction_substrate", "source"),
+    "PRODUCT": ("reaction_product", "target"),
+    "TRANSLOCATE_TO": ("reaction_product", "target"),
+    "ACTIVATES": ("reaction_modifier", "source"),
+    "INHIBITS": ("reaction_modifier", "source"),
+}
+
+# reaction properties only, for the reaction nodes
+QUERIES["reaction_nodes"] = (
+    "MATCH (r:Reaction) "
+    "WHERE id(r) > $last_key "
+    "RETURN id(r) AS key, r {.reaction_id, .reaction_type, .external_links} AS reaction "
+    "ORDER BY key LIMIT $batch_size"
+)
+
+
+# ----
+# Subgraph builds
+# ----
+
+# Restriction of each extraction query to the PSS IDs of the entities and
+# reactions of a subgraph (see ``skm.adapters.subgraph``)
+SUBGRAPH_FILTERS = {
+    **{stream: "AND id(n) IN $subgraph_nodes " for stream in NODE_STREAMS},
+    "foreign_edges": "AND id(g) IN $subgraph_nodes AND id(n) IN $subgraph_nodes ",
+    "reactions": "AND id(r) IN $subgraph_reactions ",
+    "reaction_edges": "AND id(r) IN $subgraph_reactions ",
+    "reaction_nodes": "AND id(r) IN $subgraph_reactions ",
+}
+
+
+def subgraph_query(stream):
+    """ ``QUERIES[stream]`` with the subgraph filter after its keyset condition """
+
+    query = QUERIES[stream]
+    end = query.index("> $last_key ") + len("> $last_key ")
+    return query[:end] + SUBGRAPH_FILTERS[stream] + query[end:]
+
+
+SUBGRAPH_QUERIES = {stream: subgraph_query(stream) for stream in QUERIES}
+
+
+# ----
+# Count queries
+# ----
+
+def node_count_query(label, exclude):
+    """ Count of the nodes of ``label`` without ``exclude`` labels, and of their genes """
+
+    excluded = " AND ".join(f"NOT n:{x}" for x in exclude)
+    return (
+        f"MATCH (n:{label}) "
+        + (f"WHERE {excluded} " if exclude else "")
+        + "RETURN count(n) AS nodes, sum(size(coalesce(n.ath_homologues, []))) AS genes"
+    )
+
+
+def pathway_count_query():
+    """ Distinct pathways and pathway memberships of the planned nodes """
+
+    exclusions = plan_exclusions()
+    planned = " OR ".join(
+        "(n:{}{})".format(label, "".join(f" AND NOT n:{x}" for x in exclusions[stream]))
+        for stream, label, _, _ in NODE_PLAN
+    )
+    return (
+        f"MATCH (n) WHERE ({planned}) AND n.all_pathways IS NOT NULL "
+        "UNWIND n.all_pathways AS pathway "
+        "RETURN count(DISTINCT pathway) AS pathways, "
+        "count(DISTINCT [pathway, n.name]) AS memberships"
+    )
+
+
+# Reaction participant pairs summed over reactions, as named in the fan-out
+# query (see ``fan_out_key``)
+FAN_OUT_KEYS = [
+    "products_substrates",
+    "modifiers_substrates",
+    "modifiers_products",
+    "substrates_permutations",
+]
+
+
+def fan_out_key(sources, targets):
+    if targets == "permutations":
+        return f"{sources}_permutations"
+    return "_".join(sorted([sources, targets]))
+
+
+COUNT_QUERIES = {
+    **{
+        stream: node_count_query(label, plan_exclusions()[stream])
+        for stream, label, _, _ in NODE_PLAN
+    },
+    "pathways": pathway_count_query(),
+    "foreign_edges": (
+        "MATCH (g:ForeignCoding)-[rel]->(n:ForeignEntity) "
+        "RETURN count(rel) AS edges"
+    ),
+    # participants per role of every reaction, aggregated per reaction type
+    "reactions": (
+        "MATCH (r:Reaction) "
+        "OPTIONAL MATCH (r)-[e]-() "
+        "WITH r, collect(e) AS rels "
+        "WITH r.reaction_type AS reaction_type, "
+        "size([e IN rels WHERE type(e) IN ['SUBSTRATE', 'TRANSLOCATE_FROM']]) AS s, "
+        "size([e IN rels WHERE type(e) IN ['PRODUCT', 'TRANSLOCATE_TO']]) AS p, "
+        "size([e IN rels WHERE type(e) IN ['INHIBITS', 'ACTIVATES'] "
+        "AND coalesce(e.source_form, '') <> 'condition']) AS m "
+        "RETURN reaction_type, count(*) AS reactions, sum(s + p + m) AS roles, "
+        "sum(s * p) AS products_substrates, sum(m * s) AS modifiers_substrates, "
+        "sum(m * p) AS modifiers_products, sum(s * (s - 1)) AS substrates_permutations"
+    ),
+}
+
+
+# ----
+# Fingerprint queries
+# ----
+
+def property_size(x):
+    """
+    Cypher sum of the lengths of the property keys and values of ``x``, with
+    list values summed element by element (``v + []`` is a list of any value)
+    """
+
+    return (
+        f"reduce(s = 0, k IN keys({x}) | s + size(k) + "
+        f"reduce(t = 0, v IN {x}[k] + [] | t + size(toString(v))))"
+    )
+
+
+# Aggregates of the nodes per label set and of the relationships per type,
+# with the sums of their IDs (and of the IDs of their ends) and of the sizes
+# of their properties, so adding, removing, relabelling or rewiring an entity
+# or resizing a property changes the fingerprint. One scan each, on the server.
+FINGERPRINT_QUERIES = {
+    "nodes": (
+        "MATCH (n) "
+        "RETURN labels(n) AS kind, count(n) AS count, sum(id(n)) AS ids, "
+        f"sum({property_size('n')}) AS size"
+    ),
+    "relationships": (
+        "MATCH (a)-[r]->(b) "
+        "RETURN type(r) AS kind, count(r) AS count, sum(id(r)) AS ids, "
+        f"sum(id(a)) AS sources, sum(id(b)) AS targets, sum({property_size('r')}) AS size"
+    ),
+}
+
+# Every node and relationship with all of its properties, for a fingerprint
+# that also changes with edits keeping the size of a property (e.g. a
+# replaced TAIR ID). Hashed in the order they come, in a single scan.
+STRICT_FINGERPRINT_QUERIES = {
+    "nodes": (
+        "MATCH (n) "
+        "RETURN id(n) AS id, labels(n) AS kind, properties(n) AS properties"
+    ),
+    "relationships": (
+        "MATCH (a)-[r]->(b) "
+        "RETURN id(r) AS id, type(r) AS kind, id(a) AS source, id(b) AS target, "
+        "properties(r) AS properties"
+    ),
+}
+
+
+def reaction_roles(res):
+    """ Number of substrates, products and modifiers of a reaction record """
+
+    s = p = m = 0
+    for path in res["path"]:
+        edge = path.relationships[0]
+        if edge.type in ("SUBSTRATE", "TRANSLOCATE_FROM"):
+            s += 1
+        elif edge.type in ("PRODUCT", "TRANSLOCATE_TO"):
+            p += 1
+        elif edge.type in ("INHIBITS", "ACTIVATES") and edge["source_form"] != "condition":
+            m += 1
+    return s, p, m
+
+
+def estimate_reaction_edges(reaction_type, fan_out):
+    """
+    Reaction edges of ``reaction_type`` from its summed participant pairs.
+    Participants missing from the graph and duplicate edges are not
+    discounted, so this is an upper bound.
+    """
+
+    return sum(
+        fan_out[fan_out_key(sources, targets)]
+        for sources, targets, _ in REACTION_PROJECTIONS.get(reaction_type, [])
+    )
+
 
 def get_link_entry(key, links, get_all=False):
     ''' Get first entry in list of "key:value" with key==key '''
@@ -49,207 +491,127 @@ class ReactionParticipant:
         self.location = location
 
 
-class PSSAdapter:
-    """
-    Adapter for the Plant Stress Signalling model (PSS) Neo4j database
-    """
-
-    def __init__(
-        self,
-        outputdir = None
-    ):
-
-
-        # read driver
-        try:
-            self.driver = nu.Driver(
-                db_name="neo4j",
-                db_user="neo4j",
-                db_passwd="password",
-                db_uri="bolt://pss:7687",
-                multi_db=False,
-                max_connection_lifetime=7200,
-            )
-        except Exception:
-            print("Whooooops!")
-
-        self.node_lookup = {}
+def key_batches(records, size):
+    """ Lists of the ``records`` of ``size`` distinct keys each """
 
-        self.incidental_edges = []
-
-        self.pathways = defaultdict(set)
-
-        self.load_gene_annotations(outputdir)
-
-    def load_gene_annotations(self, outputdir):
-        """From CKN file """
-
-        ckn_annotations_path = Path(outputdir) / "gene_annotations.tsv.gz"
-        if not ckn_annotations_path.exists():
-            print(f"\tDownloading gene annotations (CKN) to {ckn_annotations_path}", end=" ")
-            urlretrieve(CKN_NODE_URL, ckn_annotations_path)
-            print("Success.")
-
-        node_df = pd.read_csv(ckn_annotations_path, na_values=[''], keep_default_na=False, sep="\t", compression="gzip")
-        node_df = node_df[~node_df["TAIR"].isna()]
-        node_df.set_index("node_ID", inplace=True, drop=False)
-
-        node_df = node_df[["short_name", "synonyms", "full_name", "GMM", "node_type"]]
-        node_df.columns = ["name", "synonyms", "description", "gomapman_annotations", "type"]
-
-        node_df["taxon"] = "ncbitaxon:3702"
-        node_df["species"] = "Arabidopsis thaliana"
-
-        self.gene_annotations = node_df.to_dict('index')
-
-    def get_nodes(self):
-        """
-        Returns a generator of node tuples for node types specified in the
-        adapter constructor.
-        """
-
-        logger.info("Generating nodes.")
-
-        # ----
-        # Functional clusters
-        # ----
-
-        def get_functionalcluster_nodes_tx(tx):
-            result = tx.run(
-                "MATCH (n:FunctionalCluster)"
-                "RETURN n AS node, labels(n) AS labels",
-            )
-            return result.data()
-
-        with self.driver.session() as session:
-            results = session.read_transaction(get_functionalcluster_nodes_tx)
-            for res in results:
-                try:
-                    _id, _type, _props, _use = self.process_node(res)
-                    if _use:
-                        yield (_id, _type, _props)
-
-                        for child_id, child_type, child_props in self.process_genes_of_functional_cluster(res["node"], _id):
-                            yield (child_id, child_type, child_props)
-
-                except Exception as e:
-                    print("ERROR! (functionalcluster nodes)", e, res)
-
-
-        # ----
-        # Other nodes
-        # ----
-
-        def get_other_nodes_tx(tx):
-            result = tx.run(
-                "MATCH (n) "
-                "WHERE NOT 'ReactionClass' in labels(n) AND NOT 'FunctionalClusterClass' in labels(n)"
-                "RETURN n AS node, labels(n) AS labels",
-            )
-            return result.data()
-
-        with self.driver.session() as session:
-            results = session.read_transaction(get_other_nodes_tx)
-            for res in results:
-                try:
-                    _id, _type, _props, _use = self.process_node(res)
-                    if _use:
-                        yield (_id, _type, _props)
-                except Exception as e:
-                    print("ERROR! (other nodes)", e, res)
-
-
-        # ----
-        # Reactions
-        # ----
+    batch = []
+    keys = 0
+    for record in records:
+        if not batch or record["key"] != batch[-1]["key"]:
+            if keys == size:
+                yield batch
+                batch = []
+                keys = 0
+            keys += 1
+        batch.append(record)
+    if batch:
+        yield batch
 
 
-        # ----
-        # Additional nodes (pathways, DOIs)
-        # ----
-
-        for _id, _type, _props in self.process_pathways():
-            yield (_id, _type, _props)
-
-
-    def get_edges(self):
-        """
-        Returns a generator of edge tuples for edge types specified in the
-        adapter constructor.
-
-        Args:
-
-        """
-
-        logger.info("Generating edges.")
+class SequentialStreams:
+    """
+    Read record streams one after the other on the calling thread.
+    """
 
-        # ----
-        # Incidental edges
-        # ----
+    def __init__(self, get_pages):
+        self._get_pages = get_pages
 
-        for _id, source, target, _type, props in self.incidental_edges:
-            yield _id, source, target, _type, props
+    def get_records(self, stream):
+        for page in self._get_pages(stream):
+            yield from page
 
-        # ----
-        # gene to foreign entity
-        # ----
+    def close(self):
+        pass
 
-        def get_foreign_edges_tx(tx):
-            result = tx.run(
-                "MATCH (g:ForeignCoding)-[AGENT_OF]->(n:ForeignEntity)"
-                "RETURN n.name AS target, g.name AS source",
-            )
-            return result.data()
 
-        with self.driver.session() as session:
-            results = session.read_transaction(get_foreign_edges_tx)
-            for res in results:
-                try:
-                    source = self.node_lookup[res['source']]
-                    target = self.node_lookup[res['target']]
-                    yield None, source, target, "gene_of", {}
-                except Exception as e:
-                    print("ERROR! (foreign gene of)", e, res)
-
-
-        # ----
-        # Reactions
-        # ----
+class RecordPrefetcher:
+    """
+    Fetch the pages of several record streams concurrently on a thread pool.
 
-        def get_reactions_tx(tx):
-            '''
-            Get all reactions with their substrates, products and modifiers
-            '''
-            result = tx.run(
-                "MATCH p=(r:Reaction)-[]-()"
-                "RETURN r AS reaction, collect(p) AS path"
-            )
-            return [r for r in result]
+    Every stream fills its own bounded queue of pages, while the consumer
+    reads the streams one after the other in the given order. Output order is
+    therefore the same as with sequential extraction, and memory is bound by
+    ``max_pages`` pages per stream.
+    """
 
-        with self.driver.session() as session:
-            results = session.read_transaction(get_reactions_tx)
-            for res in results:
-                try:
-                    for _id, source, target, _type, props in self.process_reaction(res):
-                        yield _id, source, target, _type, props
+    _done = object()
+
+    def __init__(self, get_pages, streams, workers, max_pages=2):
+        self._stop = threading.Event()
+        self._queues = {stream: queue.Queue(maxsize=max_pages) for stream in streams}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pss-extract")
+
+        # streams are started in consumption order, so the stream being
+        # consumed has always been started
+        for stream in streams:
+            self._executor.submit(self._fetch, get_pages, stream)
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch(self, get_pages, stream):
+        q = self._queues[stream]
+        try:
+            for page in get_pages(stream):
+                if not self._put(q, page):
+                    return
+        except Exception as e:
+            self._put(q, e)
+            return
+        self._put(q, self._done)
+
+    def get_records(self, stream):
+        q = self._queues[stream]
+        while True:
+            page = q.get()
+            if page is self._done:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield from page
+
+    def close(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Reaction path properties read by ``ReactionHandlers.process_reaction``
+REACTION_PATH_PROPERTIES = ["source_location", "source_form", "target_location", "target_form"]
+
+
+class ReactionHandlers:
+    """
+    The reaction handlers: ``process_reaction`` turns a reaction record into
+    its pairwise edges, with a ``process_*`` method per reaction type.
 
-                except Exception as e:
-                    print("ERROR! (reaction)", e, res)
+    They only read the IDs of the participants from ``node_lookup`` and
+    count errors in ``metrics``, so they can run in a worker process with
+    the IDs of a shard of reactions only (see ``process_reaction_shard``).
+    """
 
-        # ----
-        # Additional nodes (DOIs)
-        # ----
+    def __init__(self, node_lookup, metrics):
+        self.node_lookup = node_lookup
+        self.metrics = metrics
 
+    def process_reaction(self, res):
+        '''
+        Process reaction and return edges, identified by the reaction (see
+        ``reaction_edge_id``)
+        '''
 
-    def get_node_count(self):
-        """
-        Returns the number of nodes generated by the adapter.
-        """
-        return len(list(self.get_nodes()))
+        reaction_identifier = f"skm:{res['reaction']['reaction_id']}"
+        for _, source, target, _type, props in self.process_reaction_edges(res):
+            yield reaction_edge_id(reaction_identifier, source, target), source, target, _type, props
 
-    def process_reaction(self, res):
+    def process_reaction_edges(self, res):
         '''
-        Process reaction and return edges
+        Edges of a reaction, by the handler of its type
         '''
 
         substrates = []
@@ -280,8 +642,8 @@ class PSSAdapter:
 
                 try:
                     _id = self.node_lookup[name]
-                except KeyError:
-                    print("ERROR!", "SUBSTRATE not in KG", name, f"{reaction_identifier}")
+                except KeyError as e:
+                    self.metrics.error("reactions", MISSING_PARTICIPANT, reaction, e)
                     continue
 
                 location = edge[f'{key}_location']
@@ -296,8 +658,8 @@ class PSSAdapter:
 
                 try:
                     _id = self.node_lookup[name]
-                except KeyError:
-                    print("ERROR!", "SUBSTRATE not in KG", name, f"{reaction_identifier}")
+                except KeyError as e:
+                    self.metrics.error("reactions", MISSING_PARTICIPANT, reaction, e)
                     continue
 
                 location = edge[f'{key}_location']
@@ -312,8 +674,8 @@ class PSSAdapter:
 
                 try:
                     _id = self.node_lookup[name]
-                except KeyError:
-                    print("ERROR!", "SUBSTRATE not in KG", name, f"{reaction_identifier}")
+                except KeyError as e:
+                    self.metrics.error("reactions", MISSING_PARTICIPANT, reaction, e)
                     continue
 
                 location = edge[f'{key}_location']
@@ -322,7 +684,7 @@ class PSSAdapter:
                     continue
                 modifiers.append(ReactionParticipant(name, _id, form, location))
 
-        match res["reaction"]["reaction_type"]:
+        match reaction.get("reaction_type"):
             case "catalysis":
                 return self.process_catalysis(reaction, substrates, products, modifiers, props.copy())
 
@@ -356,6 +718,10 @@ class PSSAdapter:
             case "cleavage/auto-cleavage":
                 return []
 
+            case _:
+                self.metrics.error("reactions", UNKNOWN_REACTION_TYPE, reaction)
+                return []
+
     def process_catalysis(self, reaction, substrates, products, modifiers, props):
 
         _id = None
@@ -478,41 +844,970 @@ class PSSAdapter:
             yield _id, source.id, target.id, _type, props
 
 
+def process_reaction_shard(records, node_lookup):
+    """
+    Run ``ReactionHandlers.process_reaction`` on a shard of encoded reaction
+    records in a worker process (see ``PSSAdapter.process_reactions_sharded``).
+    Returns the edges and the metrics of the shard.
+    """
+
+    handlers = ReactionHandlers(node_lookup, AdapterMetrics())
+
+    edges = []
+    for key, reaction, paths in records:
+        res = {"key": key, "reaction": reaction, "path": [decode_path(p) for p in paths]}
+        try:
+            edges.extend(handlers.process_reaction(res))
+        except Exception as e:
+            handlers.metrics.error("reactions", PROCESSING_EXCEPTION, res, e)
+
+    return edges, handlers.metrics
 
 
+class PSSAdapter:
+    """
+    Adapter for the Plant Stress Signalling model (PSS) Neo4j database
+    """
+
+    def __init__(
+        self,
+        outputdir = None,
+        batch_size = DEFAULT_BATCH_SIZE,
+        snapshot = None,
+        workers = DEFAULT_WORKERS,
+        node_index = None,
+        server_side_reactions = False,
+        driver = None,
+        reaction_processes = DEFAULT_REACTION_PROCESSES,
+        annotation_mirror = None,
+        refresh_annotations = False,
+        annotation_sha256 = None,
+        reaction_mode = "pairwise",
+        strict_fingerprint = False,
+        incidental_memory = DEFAULT_MEMORY_LIMIT,
+        subgraph = None,
+    ):
+
+        self.batch_size = batch_size
+        self.workers = workers
+
+        # derive reaction edges in Cypher instead of walking reaction paths;
+        # off by default until ``benchmarks.check_reaction_parity`` has
+        # passed against PSS
+        self.server_side_reactions = server_side_reactions
+        if server_side_reactions:
+            logger.warning(
+                "Server-side reaction edges are experimental: their parity with the "
+                "reaction handlers has not been checked against PSS yet."
+            )
+
+        # run the reaction handlers on shards of reactions in a process pool
+        self.reaction_processes = reaction_processes
+
+        # reactions as pairwise edges, or as nodes linked to their participants
+        if reaction_mode not in REACTION_MODES:
+            raise ValueError(f"Unknown reaction mode {reaction_mode}")
+        if reaction_mode == "hypernode" and server_side_reactions:
+            raise ValueError("Reaction hypernodes are built from reaction paths, not server-side")
+        self.reaction_mode = reaction_mode
+
+        # replay records from an offline snapshot instead of PSS
+        self.snapshot = PSSSnapshot(snapshot) if snapshot is not None else None
+
+        # only extract a ``skm.adapters.subgraph.Subgraph`` of PSS
+        if subgraph is not None and snapshot is not None:
+            raise ValueError("Subgraphs are extracted from PSS, not from a snapshot")
+        self.subgraph = subgraph
+
+        # read driver, unless one is given (e.g. a stand-in for benchmarks);
+        # connected on the first query, which may come from several workers
+        self._driver = driver
+        self._driver_lock = threading.Lock()
+
+        # PSS name -> node ID, optionally persisted in an on-disk index
+        if node_index is not None:
+            self.node_lookup = NodeIndex(node_index)
+            self.incidental_edges = IndexedEdges(self.node_lookup)
+        else:
+            self.node_lookup = {}
+            # deferred until get_edges, spilled to disk above the memory limit
+            self.incidental_edges = SpillBuffer(incidental_memory)
 
-    def process_node(self, res):
+        # with a node index, an index complete for the current PSS content
+        # is found by ``get_edge_stages``
+        self.nodes_resolved = False
 
-        for pathway in res["node"].get("all_pathways", []):
-            self.pathways[pathway].add(res['node']['name'])
+        self.pathways = PathwayIndex()
 
-        if "Metabolite" in res["labels"]:
-            return self.process_metabolite(res["node"])
+        self.metrics = AdapterMetrics()
 
-        elif "Complex" in res["labels"]:
-            return self.process_complex(res["node"])
+        # fingerprint PSS from every entity instead of from aggregates
+        self.strict_fingerprint = strict_fingerprint
 
-        elif "ForeignEntity" in res["labels"]:
-            return self.process_foreign_entity(res["node"])
+        # cached results of ``get_counts`` and ``get_fingerprint``
+        self._counts = None
+        self._fingerprints = {}
 
-        elif "ForeignAbiotic" in res["labels"]:
-            return self.process_foreign_abiotic(res["node"])
+        # CKN annotations: copy from a local mirror, revalidate the download,
+        # only accept a table of this SHA-256 digest
+        self.annotation_mirror = annotation_mirror
+        self.refresh_annotations = refresh_annotations
+        self.annotation_sha256 = annotation_sha256
 
-        elif "ForeignCoding" in res["labels"]:
-            return self.process_foreign_coding(res["node"])
+        # loaded when the first gene of a functional cluster is expanded
+        self.outputdir = outputdir
+        self._gene_annotations = None
 
-        elif "Family" in res["labels"]:
-            return self.process_family(res["node"])
+    @property
+    def driver(self):
+        """ Read driver of PSS, connected on first use """
 
-        elif "Process" in res["labels"]:
-            return self.process_process(res["node"])
+        if self._driver is None and self.snapshot is None:
+            with self._driver_lock:
+                if self._driver is None:
+                    self._driver = self.connect()
+        return self._driver
 
-        elif "FunctionalCluster" in res["labels"]:
-            return self.process_functional_cluster(res)
+    @driver.setter
+    def driver(self, driver):
+        self._driver = driver
 
+    @staticmethod
+    def connect():
+        import neo4j_utils as nu
+
+        try:
+            return nu.Driver(
+                db_name="neo4j",
+                db_user="neo4j",
+                db_passwd="password",
+                db_uri="bolt://pss:7687",
+                multi_db=False,
+                max_connection_lifetime=7200,
+            )
+        except Exception as e:
+            logger.error(f"Could not connect to PSS: {e}")
+            raise
+
+    @property
+    def gene_annotations(self):
+        """ CKN gene annotations, fetched and loaded on first use """
+
+        if self._gene_annotations is None:
+            self.load_gene_annotations(self.outputdir)
+        return self._gene_annotations
+
+    @gene_annotations.setter
+    def gene_annotations(self, gene_annotations):
+        self._gene_annotations = gene_annotations
+
+    def annotation_cache(self, outputdir):
+        """ Local copy of the CKN annotation table in ``outputdir`` """
+
+        return AnnotationCache(
+            outputdir,
+            CKN_NODE_URL,
+            mirror=self.annotation_mirror,
+            sha256=self.annotation_sha256,
+            refresh=self.refresh_annotations,
+        )
+
+    def load_gene_annotations(self, outputdir):
+        """From CKN file """
+
+        cache = self.annotation_cache(outputdir)
+        self.gene_annotations = GeneAnnotations(
+            cache.fetch(),
+            cache_path=Path(outputdir) / "gene_annotations.cache.pkl",
+        )
+
+    def get_nodes(self):
+        """
+        Returns a generator of node tuples for node types specified in the
+        adapter constructor.
+        """
+
+        for _, tuples in self.get_node_stages():
+            yield from tuples
+
+    def get_node_stages(self, done=()):
+        """
+        Generate the nodes stage by stage, as ``(stage, tuples)`` pairs. The
+        tuples of a stage must be consumed before the next pair is requested.
+
+        Stages in ``done`` are skipped; the node state they produced must
+        have been restored with ``set_state`` (see ``skm.build.checkpoint``).
+        """
+
+        logger.info("Generating nodes.")
+
+        hypernodes = self.reaction_mode == "hypernode"
+        pending = [
+            stage for stage in NODE_STAGES
+            if stage not in done and (hypernodes or stage != "reaction_nodes")
+        ]
+
+        # a new node pass rebuilds the index
+        if isinstance(self.node_lookup, NodeIndex) and not done:
+            self.node_lookup.clear()
+
+        streams = []
+        if "functional_clusters" in pending:
+            streams.append("functional_clusters")
+        if "other_nodes" in pending:
+            streams += NODE_STREAMS[1:]
+        if "reaction_nodes" in pending:
+            streams.append("reaction_nodes")
+        streams = self.open_streams(streams)
+
+        try:
+
+            # ----
+            # Functional clusters
+            # ----
+
+            if "functional_clusters" in pending:
+                yield "functional_clusters", self._functional_cluster_nodes(streams)
+
+            # ----
+            # Other nodes
+            # ----
+
+            if "other_nodes" in pending:
+                yield "other_nodes", self._other_nodes(streams)
+
+            # ----
+            # Reactions (as hypernodes)
+            # ----
+
+            if "reaction_nodes" in pending:
+                yield "reaction_nodes", self._reaction_nodes(streams)
+
+        finally:
+            streams.close()
+
+        # ----
+        # Additional nodes (pathways, DOIs)
+        # ----
+
+        if "pathways" in pending:
+            yield "pathways", self._pathway_nodes()
+
+    def _functional_cluster_nodes(self, streams):
+        with self.metrics.stage("functional_clusters") as stage:
+            for res in streams.get_records("functional_clusters"):
+                stage.rows_in += 1
+                try:
+                    _id, _type, _props, _use = self.process_record("functional_clusters", res)
+                    if _use:
+                        stage.tuples_out += 1
+                        yield (_id, _type, _props)
+
+                        for child_id, child_type, child_props in self.process_genes_of_functional_cluster(res["node"], _id):
+                            stage.tuples_out += 1
+                            yield (child_id, child_type, child_props)
+
+                except Exception as e:
+                    self.metrics.error(stage.name, PROCESSING_EXCEPTION, res, e)
+
+    def _other_nodes(self, streams):
+        with self.metrics.stage("other_nodes") as stage:
+            for stream in NODE_STREAMS[1:]:
+                for res in streams.get_records(stream):
+                    stage.rows_in += 1
+                    try:
+                        _id, _type, _props, _use = self.process_record(stream, res)
+                        if _use:
+                            stage.tuples_out += 1
+                            yield (_id, _type, _props)
+                    except Exception as e:
+                        self.metrics.error(stage.name, PROCESSING_EXCEPTION, res, e)
+
+    def _reaction_nodes(self, streams):
+        with self.metrics.stage("reaction_nodes") as stage:
+            for res in streams.get_records("reaction_nodes"):
+                stage.rows_in += 1
+                stage.tuples_out += 1
+                yield self.process_reaction_node(res["reaction"])
+
+    def _pathway_nodes(self):
+        with self.metrics.stage("pathways") as stage:
+            for _id, _type, _props in self.process_pathways():
+                stage.tuples_out += 1
+                yield (_id, _type, _props)
+
+        self.mark_nodes_resolved()
+
+
+    def get_edges(self):
+        """
+        Returns a generator of edge tuples for edge types specified in the
+        adapter constructor.
+
+        Args:
+
+        """
+
+        for _, _, tuples in self.get_edge_stages():
+            yield from tuples
+
+    def get_edge_stages(self, done=(), reaction_key=-1, reaction_batch=None):
+        """
+        Generate the edges stage by stage, as ``(stage, key, tuples)``
+        triples. The tuples of a stage must be consumed before the next
+        triple is requested.
+
+        Stages in ``done`` are skipped, and reactions are read from after
+        ``reaction_key``. With ``reaction_batch``, reactions come in stages
+        of that many reactions, with the key of their last reaction as
+        ``key`` (otherwise ``None``), so a build can be resumed after the
+        last batch written.
+        """
+
+        logger.info("Generating edges.")
+
+        if not self.nodes_resolved:
+            if isinstance(self.node_lookup, NodeIndex) and self.node_lookup.resolved(self.index_source()):
+                self.nodes_resolved = True
+            else:
+                self.build_node_index()
+
+        # ----
+        # Incidental edges
+        # ----
+
+        if "incidental_edges" not in done:
+            yield "incidental_edges", None, self._incidental_edges()
+
+        # ----
+        # Pathway memberships (with a node index, among the incidental edges)
+        # ----
+
+        if not isinstance(self.node_lookup, NodeIndex) and "pathway_edges" not in done:
+            yield "pathway_edges", None, self._pathway_edges()
+
+        # ----
+        # gene to foreign entity
+        # ----
+
+        reactions = "reaction_edges" if self.server_side_reactions else "reactions"
+        pending = [stage for stage in ["foreign_edges", "reactions"] if stage not in done]
+        streams = self.open_streams(
+            [reactions if stage == "reactions" else stage for stage in pending],
+            last_keys={reactions: reaction_key},
+        )
+
+        try:
+            if "foreign_edges" in pending:
+                yield "foreign_edges", None, self._foreign_edges(streams)
+
+            # ----
+            # Reactions
+            # ----
+
+            if "reactions" in pending:
+                records = streams.get_records(reactions)
+                if reaction_batch is None:
+                    yield "reactions", None, self._reaction_edges(records)
+                else:
+                    for batch in key_batches(records, reaction_batch):
+                        yield "reactions", batch[-1]["key"], self._reaction_edges(batch)
+
+        finally:
+            streams.close()
+
+        # ----
+        # Additional nodes (DOIs)
+        # ----
+
+    def _incidental_edges(self):
+        with self.metrics.stage("incidental_edges") as stage:
+            for _id, source, target, _type, props in self.incidental_edges:
+                stage.tuples_out += 1
+                yield _id, source, target, _type, props
+
+    def _pathway_edges(self):
+        with self.metrics.stage("pathway_edges") as stage:
+            for _id, source, target, _type, props in self.pathways.edges():
+                stage.tuples_out += 1
+                yield _id, source, target, _type, props
+
+    def _foreign_edges(self, streams):
+        with self.metrics.stage("foreign_edges") as stage:
+            for res in streams.get_records("foreign_edges"):
+                stage.rows_in += 1
+                try:
+                    source = self.node_lookup[res['source']]
+                    target = self.node_lookup[res['target']]
+                except KeyError as e:
+                    self.metrics.error(stage.name, MISSING_PARTICIPANT, res, e)
+                    continue
+                stage.tuples_out += 1
+                yield None, source, target, "gene_of", {}
+
+    def _reaction_edges(self, records):
+        with self.metrics.stage("reactions") as stage:
+            if self.reaction_mode == "hypernode":
+                for res in records:
+                    stage.rows_in += 1
+                    for _id, source, target, _type, props in self.process_reaction_roles(res):
+                        stage.tuples_out += 1
+                        yield _id, source, target, _type, props
+
+            elif self.server_side_reactions:
+                for _, rows in groupby(records, key=itemgetter("key")):
+                    stage.rows_in += 1
+                    for _id, source, target, _type, props in self.process_reaction_rows(list(rows)):
+                        stage.tuples_out += 1
+                        yield _id, source, target, _type, props
+
+            elif self.reaction_processes > 1:
+                for _id, source, target, _type, props in self.process_reactions_sharded(records, stage):
+                    stage.tuples_out += 1
+                    yield _id, source, target, _type, props
+
+            else:
+                handlers = ReactionHandlers(self.node_lookup, self.metrics)
+                for res in records:
+                    stage.rows_in += 1
+                    # reactions without any participants
+                    if not res["path"]:
+                        continue
+                    try:
+                        for _id, source, target, _type, props in handlers.process_reaction(res):
+                            stage.tuples_out += 1
+                            yield _id, source, target, _type, props
+
+                    except Exception as e:
+                        self.metrics.error(stage.name, PROCESSING_EXCEPTION, res, e)
+
+    def get_state(self):
+        """
+        The node state that edges are generated from: resolved node IDs,
+        incidental edges, pathways and metrics. With a node index, the IDs
+        and incidental edges are in its file, which is committed instead.
+        Incidental edges spilled to disk are referred to by path (see
+        ``set_spill_directory``).
+        """
+
+        state = {
+            "nodes_resolved": self.nodes_resolved,
+            "pathways": self.pathways,
+            "metrics": self.metrics,
+        }
+        if isinstance(self.node_lookup, NodeIndex):
+            self.node_lookup.commit()
+        else:
+            state["node_lookup"] = self.node_lookup
+            state["incidental_edges"] = self.incidental_edges
+        return state
+
+    def set_spill_directory(self, directory):
+        """
+        Spill the deferred incidental edges to ``directory``, e.g. the
+        checkpoint directory, so a checkpointed state refers to runs there
+        """
+
+        if isinstance(self.incidental_edges, SpillBuffer):
+            self.incidental_edges.directory = directory
+
+    def set_state(self, state):
+        """ Restore a state from ``get_state`` """
+
+        self.nodes_resolved = state["nodes_resolved"]
+        self.pathways = state["pathways"]
+        self.metrics = state["metrics"]
+        if "node_lookup" in state:
+            self.node_lookup = state["node_lookup"]
+            self.incidental_edges = state["incidental_edges"]
+
+    def build_node_index(self):
+        """
+        Resolve the IDs of all PSS nodes into ``node_lookup``, and collect the
+        incidental edges, without generating node tuples.
+
+        Run by ``get_edges`` when nodes have not been generated, or indexed
+        from the current PSS content, before, so edges can be built on their
+        own.
+        """
+
+        logger.info("Building node index.")
+
+        # process and discard the nodes
+        for _ in self.get_nodes():
+            pass
+
+    def mark_nodes_resolved(self):
+        """ Record that ``node_lookup`` holds all PSS nodes """
+
+        self.nodes_resolved = True
+        if isinstance(self.node_lookup, NodeIndex):
+            self.node_lookup.mark_complete(self.index_source())
+
+    def index_source(self):
+        """
+        What the node index is built from, to tell if it can be reused: the
+        PSS content, from its aggregate fingerprint (see
+        ``get_fingerprint``), and the seeds of a subgraph
+        """
+
+        source = {"pss": self.get_fingerprint(strict=False)}
+        if self.subgraph is not None:
+            source["subgraph"] = {k: v for k, v in vars(self.subgraph).items() if not k.startswith("_")}
+        return source
+
+    def open_streams(self, streams, last_keys=None):
+        """
+        Open the record ``streams`` for consumption in the given order,
+        reading each from after its key in ``last_keys``, if any.
+
+        With more than one worker the streams are fetched concurrently over
+        the driver's connection pool, each worker using its own sessions.
+        """
+
+        last_keys = last_keys or {}
+
+        def get_pages(stream):
+            return self.get_pages(stream, last_keys.get(stream, -1))
+
+        if self.workers > 1:
+            return RecordPrefetcher(get_pages, streams, self.workers)
+        return SequentialStreams(get_pages)
+
+    def get_records(self, stream):
+        """
+        Stream the records of one of the extraction ``QUERIES``.
+        """
+
+        for page in self.get_pages(stream):
+            yield from page
+
+    def get_pages(self, stream, last_key=-1):
+        """
+        Stream the records of one of the extraction ``QUERIES`` page by page,
+        from after ``last_key``.
+
+        Records are fetched in pages of ``batch_size`` using keyset
+        pagination, one read transaction per page, so at most one page is
+        held in memory regardless of the size of the PSS database. With a
+        subgraph, only its records are fetched. With a snapshot, its chunks
+        are read instead.
+        """
+
+        if self.snapshot is not None:
+            for page in self.snapshot.get_pages(stream):
+                if page and page[-1]["key"] > last_key:
+                    yield [record for record in page if record["key"] > last_key]
+            return
+
+        if self.subgraph is not None:
+            query = SUBGRAPH_QUERIES[stream]
+            params = self.subgraph.parameters(self.driver)
         else:
-            # print(res['labels'])
-            return None, None, None, False
+            query = QUERIES[stream]
+            params = {}
+
+        def get_page_tx(tx, last_key):
+            result = tx.run(query, last_key=last_key, batch_size=self.batch_size, **params)
+            return [self.convert_record(stream, record) for record in result]
+
+        while True:
+            with self.driver.session() as session:
+                page = session.read_transaction(get_page_tx, last_key)
+
+            if page:
+                yield page
+
+            if len(page) < self.batch_size:
+                break
+            last_key = page[-1]["key"]
+
+    @staticmethod
+    def convert_record(stream, record):
+        """
+        Convert a driver record to plain python values. Reaction paths are
+        kept as they are, since ``ReactionHandlers.process_reaction`` walks their
+        relationships.
+        Properties missing on a node are dropped from its projection.
+        """
+
+        if stream == "reaction_nodes":
+            return {
+                "key": record["key"],
+                "reaction": {k: v for k, v in record["reaction"].items() if v is not None},
+            }
+        if stream == "reactions":
+            return {
+                "key": record["key"],
+                "reaction": dict(record["reaction"]),
+                "path": record["path"],
+            }
+        if stream in NODE_METHODS:
+            return {
+                "key": record["key"],
+                "node": {k: v for k, v in record["node"].items() if v is not None},
+            }
+        return record.data()
+
+    def get_counts(self, refresh=False):
+        """
+        Sizes of the graph the adapter generates, from aggregate queries
+        instead of an extraction:
+
+        - ``nodes``: nodes per stream, genes (one per homologue of a
+          functional cluster), distinct pathways and, in the ``hypernode``
+          reaction mode, reactions
+        - ``edges``: functional cluster members, pathway memberships, foreign
+          ``gene_of`` edges and either the estimated pairwise reaction edges
+          or the role edges of the reactions (substrates, products and
+          modifiers other than conditions)
+        - ``reactions``: reactions per reaction type
+
+        Counts are cached and the adapter state is left untouched. With a
+        snapshot, its records are counted instead. A subgraph is not taken
+        into account.
+        """
+
+        if self._counts is None or refresh:
+            if self.snapshot is not None:
+                counts = self.count_snapshot()
+            else:
+                counts = self.count_pss()
+
+            fan_out = counts.pop("fan_out")
+            roles = counts.pop("roles")
+            if self.reaction_mode == "hypernode":
+                counts["nodes"]["reactions"] = sum(counts["reactions"].values())
+                counts["edges"]["reaction_roles"] = sum(roles.values())
+            else:
+                counts["edges"]["reaction_edges"] = sum(
+                    estimate_reaction_edges(reaction_type, pairs)
+                    for reaction_type, pairs in fan_out.items()
+                )
+            self._counts = counts
+
+        return self._counts
+
+    def count_pss(self):
+        """ Run the ``COUNT_QUERIES`` """
+
+        def count_tx(tx, query):
+            return [record.data() for record in tx.run(query)]
+
+        results = {}
+        with self.driver.session() as session:
+            for name, query in COUNT_QUERIES.items():
+                results[name] = session.read_transaction(count_tx, query)
+
+        nodes = {stream: results[stream][0]["nodes"] for stream in NODE_STREAMS}
+        nodes["genes"] = results["functional_clusters"][0]["genes"]
+        nodes["pathways"] = results["pathways"][0]["pathways"]
+
+        return {
+            "nodes": nodes,
+            "edges": {
+                "functional_cluster_member": nodes["genes"],
+                "in_pathway": results["pathways"][0]["memberships"],
+                "gene_of": results["foreign_edges"][0]["edges"],
+            },
+            "reactions": {row["reaction_type"]: row["reactions"] for row in results["reactions"]},
+            "roles": {row["reaction_type"]: row["roles"] for row in results["reactions"]},
+            "fan_out": {
+                row["reaction_type"]: {key: row[key] for key in FAN_OUT_KEYS}
+                for row in results["reactions"]
+            },
+        }
+
+    def count_snapshot(self):
+        """ Count the records of the snapshot, without processing them """
+
+        nodes = {}
+        genes = 0
+        memberships = set()
+        for stream in NODE_STREAMS:
+            nodes[stream] = 0
+            for res in self.snapshot.get_records(stream):
+                nodes[stream] += 1
+                genes += len(res["node"].get("ath_homologues", []))
+                for pathway in res["node"].get("all_pathways", []):
+                    memberships.add((pathway, res["node"]["name"]))
+        nodes["genes"] = genes
+        nodes["pathways"] = len({pathway for pathway, _ in memberships})
+
+        reactions = defaultdict(int)
+        roles = defaultdict(int)
+        fan_out = defaultdict(lambda: dict.fromkeys(FAN_OUT_KEYS, 0))
+        for res in self.snapshot.get_records("reactions"):
+            reaction_type = res["reaction"].get("reaction_type")
+            s, p, m = reaction_roles(res)
+            reactions[reaction_type] += 1
+            roles[reaction_type] += s + p + m
+            pairs = fan_out[reaction_type]
+            pairs["products_substrates"] += s * p
+            pairs["modifiers_substrates"] += m * s
+            pairs["modifiers_products"] += m * p
+            pairs["substrates_permutations"] += s * (s - 1)
+
+        return {
+            "nodes": nodes,
+            "edges": {
+                "functional_cluster_member": genes,
+                "in_pathway": len(memberships),
+                "gene_of": sum(1 for _ in self.snapshot.get_records("foreign_edges")),
+            },
+            "reactions": dict(reactions),
+            "roles": dict(roles),
+            "fan_out": dict(fan_out),
+        }
+
+    def get_fingerprint(self, refresh=False, strict=None):
+        """
+        Digest of the PSS content, which changes with edits of it (see
+        ``skm.build.fingerprint``): the aggregates of the
+        ``FINGERPRINT_QUERIES``, computed on the server. If ``strict``
+        (``strict_fingerprint`` by default), hashes of every node and
+        relationship with all of their properties instead, which takes a
+        full read of PSS. With a snapshot, its manifest and the size and
+        modification time of its chunks.
+
+        Fingerprints are cached.
+        """
+
+        if strict is None:
+            strict = self.strict_fingerprint
+        if self.snapshot is not None:
+            strict = False
+        if strict in self._fingerprints and not refresh:
+            return self._fingerprints[strict]
+
+        if self.snapshot is not None:
+            self._fingerprints[strict] = {
+                "manifest": self.snapshot.manifest,
+                "chunks": {
+                    path.name: [path.stat().st_size, path.stat().st_mtime_ns]
+                    for path in sorted(self.snapshot.path.glob("*.pkl"))
+                },
+            }
+            return self._fingerprints[strict]
+
+        def aggregate_tx(tx, query):
+            rows = [record.data() for record in tx.run(query)]
+            return sorted(rows, key=lambda row: json.dumps(row["kind"]))
+
+        def strict_tx(tx, query):
+            # sum of the digests of the records, independent of their order
+            total = 0
+            for record in tx.run(query):
+                digest = hashlib.blake2b(
+                    json.dumps(record.data(), sort_keys=True, default=str).encode(), digest_size=16
+                )
+                total = (total + int.from_bytes(digest.digest(), "big")) % (1 << 128)
+            return f"{total:032x}"
+
+        fingerprint = {}
+        with self.driver.session() as session:
+            if strict:
+                for name, query in STRICT_FINGERPRINT_QUERIES.items():
+                    fingerprint[f"strict_{name}"] = session.read_transaction(strict_tx, query)
+            else:
+                for name, query in FINGERPRINT_QUERIES.items():
+                    fingerprint[name] = session.read_transaction(aggregate_tx, query)
+
+        self._fingerprints[strict] = fingerprint
+        return fingerprint
+
+    def get_node_count(self):
+        """
+        Returns the number of nodes generated by the adapter, from
+        ``get_counts``.
+        """
+        return sum(self.get_counts()["nodes"].values())
+
+    def get_edge_count(self):
+        """
+        Returns the (estimated) number of edges generated by the adapter,
+        from ``get_counts``.
+        """
+        return sum(self.get_counts()["edges"].values())
+
+    def process_reactions_sharded(self, records, stage):
+        """
+        Process reaction records in a pool of ``reaction_processes``.
+
+        Reactions are cut into shards of ``batch_size`` consecutive records
+        (ranges of the reaction key), each sent to a worker with compact
+        paths and the IDs of its participants only. Edges are yielded in
+        the order of the shards, as in the sequential stage.
+        """
+
+        records = iter(records)
+        pending = deque()
+
+        with ProcessPoolExecutor(self.reaction_processes) as pool:
+            while True:
+                shard = list(islice(records, self.batch_size))
+                if shard:
+                    stage.rows_in += len(shard)
+                    pending.append(pool.submit(process_reaction_shard, *self.encode_shard(shard)))
+
+                # bound the shards in flight, and drain them at the end
+                while pending and (len(pending) > 2 * self.reaction_processes or not shard):
+                    edges, metrics = pending.popleft().result()
+                    self.metrics.merge(metrics)
+                    yield from edges
+
+                if not shard:
+                    break
+
+    def encode_shard(self, shard):
+        """
+        Reduce reaction records to ``(key, reaction, paths)`` with paths as
+        ``(type, start name, end name, properties)``, and collect the IDs
+        of their participants.
+        """
+
+        records = []
+        lookup = {}
+        for res in shard:
+            # reactions without any participants
+            if not res["path"]:
+                continue
+
+            paths = []
+            for path in res["path"]:
+                edge = path.relationships[0]
+                start, end = edge.start_node["name"], edge.end_node["name"]
+                paths.append((
+                    edge.type, start, end,
+                    {p: edge[p] for p in REACTION_PATH_PROPERTIES},
+                ))
+                for name in (start, end):
+                    if name not in lookup:
+                        lookup[name] = self.node_lookup.get(name)
+            records.append((res["key"], res["reaction"], paths))
+
+        # missing participants stay missing in the worker
+        return records, {name: _id for name, _id in lookup.items() if _id is not None}
+
+    @staticmethod
+    def reaction_node_id(reaction):
+        return f"skm.reaction:{reaction['reaction_id']}"
+
+    def process_reaction_node(self, reaction):
+        """
+        Reaction as a node, carrying the properties that the pairwise edges
+        of the reaction share
+        """
+
+        reaction_identifier = reaction["reaction_id"]
+        props = {
+            "reaction_identifier": f"skm:{reaction_identifier}",
+            "reaction_type": reaction.get("reaction_type"),
+            "url": f"https://skm.nib.si/biomine/?reaction_id={reaction_identifier}",
+        }
+        refs = get_link_entry("doi", reaction.get("external_links"), get_all=True)
+        if refs:
+            props["references"] = refs
+
+        return self.reaction_node_id(reaction), "reaction", props
+
+    def process_reaction_roles(self, res):
+        """
+        Role edges linking the participants of a reaction to its node:
+        substrates and modifiers point to the reaction, the reaction points
+        to its products. Edges carry the location and form of the
+        participant, and modifiers whether they activate or inhibit.
+        """
+
+        reaction_id = self.reaction_node_id(res["reaction"])
+
+        for path in res["path"]:
+            edge = path.relationships[0]
+            if edge.type not in REACTION_ROLES:
+                continue
+            _type, key = REACTION_ROLES[edge.type]
+
+            # conditions do not modify reactions, as in the pairwise mode
+            if _type == "reaction_modifier" and edge[f"{key}_form"] == "condition":
+                continue
+
+            name = edge.start_node["name"] if key == "source" else edge.end_node["name"]
+            try:
+                _id = self.node_lookup[name]
+            except KeyError as e:
+                self.metrics.error("reactions", MISSING_PARTICIPANT, res["reaction"], e)
+                continue
+
+            props = {
+                "location": edge[f"{key}_location"],
+                "form": edge[f"{key}_form"],
+            }
+            if _type == "reaction_modifier":
+                props["modification"] = edge.type.lower()
+            props = {k: v for k, v in props.items() if v is not None}
+
+            if key == "source":
+                yield None, _id, reaction_id, _type, props
+            else:
+                yield None, reaction_id, _id, _type, props
+
+    def process_reaction_rows(self, rows):
+        '''
+        Process the edge rows of one reaction derived in Cypher
+        '''
+
+        # rows of a reaction without edges have no type; as in
+        # ``ReactionHandlers.process_reaction``, reactions without
+        # participants are skipped and other ones of unknown (or no) type
+        # reported
+        if rows[0]["type"] is None:
+            if rows[0]["participants"] and rows[0]["reaction_type"] not in KNOWN_REACTION_TYPES:
+                self.metrics.error("reactions", UNKNOWN_REACTION_TYPE, rows[0])
+            return
+
+        reaction_identifier = rows[0]["reaction_id"]
+        props = {
+            "reaction_identifier": f"skm:{reaction_identifier}",
+            "url": f"https://skm.nib.si/biomine/?reaction_id={reaction_identifier}"
+        }
+        if rows[0]["dois"]:
+            props["references"] = rows[0]["dois"]
+
+        # shared by the edges of a type, as in the ``process_*`` handlers
+        type_props = {}
+
+        for res in rows:
+            try:
+                source = self.node_lookup[res["source"]]
+                target = self.node_lookup[res["target"]]
+            except KeyError as e:
+                self.metrics.error("reactions", MISSING_PARTICIPANT, res, e)
+                continue
+
+            _type = res["type"]
+            if _type not in type_props:
+                type_props[_type] = {**props, **REACTION_EDGE_PROPERTIES.get(_type, {})}
+            _id = reaction_edge_id(props["reaction_identifier"], source, target)
+            yield _id, source, target, _type, type_props[_type]
+
+    def process_record(self, stream, res):
+        """
+        Process a node record with the method planned for its stream.
+        """
+
+        data = res["node"]
+        return self.add_pathways(getattr(self, NODE_METHODS[stream])(data), data)
+
+    def add_pathways(self, result, data):
+        """
+        Record the pathways of a processed node under its resolved ID, and
+        pass the ``process_*`` result through.
+        """
+
+        _id, _type, _props, _use = result
+        if _use and "all_pathways" in data:
+            self.pathways.add(_id, data["all_pathways"])
+        return result
 
     def process_metabolite(self, data):
 
@@ -628,9 +1923,7 @@ class PSSAdapter:
 
         return _id, _type, _props, True
 
-    def process_functional_cluster(self, res):
-
-        data = res["node"]
+    def process_functional_cluster(self, data):
 
         fc = data["functional_cluster_id"]
         _id = f"skm:{fc}"
@@ -640,8 +1933,8 @@ class PSSAdapter:
         _props["name"] = data["short_name"]
         _props["description"] = data.get("description", "")
 
-        a = data.get("additional_information", "")
-        _props["additional_information"] = a.replace('"', '').replace("'", "")
+        # without quotes (see ``PROJECTED_PROPERTIES``)
+        _props["additional_information"] = data.get("additional_information", "")
 
         _props["url"] = f"https://skm.nib.si/biomine/?functional_cluster_id={fc}"
 
@@ -665,16 +1958,17 @@ class PSSAdapter:
             yield _id, _type, _props
 
     def process_pathways(self):
+        """
+        Pathway nodes. Their ``in_pathway`` edges are generated from
+        ``self.pathways`` by ``get_edges``, or kept with the incidental edges
+        of a node index, so edges can be built in another process.
+        """
 
-        for p in self.pathways:
-            _props = {"name": p}
-            _id = f"pss:{p}"
-
-            for n in self.pathways[p]:
-                print(p, n, _id, "pathway")
-                self.incidental_edges.append((None, n, _id, "in_pathway", {}))
+        if isinstance(self.node_lookup, NodeIndex):
+            for edge in self.pathways.edges():
+                self.incidental_edges.append(edge)
 
-            yield (_id, "pathway", _props)
+        yield from self.pathways.nodes()
 
 
 # class Node:
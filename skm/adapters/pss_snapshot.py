@@ -0,0 +1,198 @@
+"""
+Offline snapshots of the PSS extraction streams.
+
+A snapshot is a directory holding the raw records of every stream in
+``QUERIES`` as columnar, pickled chunks plus a ``manifest.json``. A
+``PSSAdapter`` created with ``snapshot=<dir>`` replays these records through
+the same ``process_*`` code instead of querying Neo4j, so a rebuild only
+needs local disk.
+
+    python -m skm.adapters.pss_snapshot ./data/pss-snapshot
+"""
+
+import json
+import logging
+import os
+import pickle
+from pathlib import Path
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+# 2: node records carry the cleaned projections of ``PROJECTED_PROPERTIES``
+# 3: reaction edge rows carry the number of participants of their reaction
+SNAPSHOT_VERSION = 3
+MANIFEST = "manifest.json"
+
+
+class SnapshotNode(dict):
+    """Properties of a node referenced by a reaction path."""
+
+
+class SnapshotRelationship:
+    """
+    Stand-in for ``neo4j.graph.Relationship`` exposing what
+    ``ReactionHandlers.process_reaction`` reads.
+    """
+
+    __slots__ = ("type", "start_node", "end_node", "_properties")
+
+    def __init__(self, _type, start_node, end_node, properties):
+        self.type = _type
+        self.start_node = start_node
+        self.end_node = end_node
+        self._properties = properties
+
+    def __getitem__(self, key):
+        # missing properties read as None, as on driver relationships
+        return self._properties.get(key)
+
+    def get(self, key, default=None):
+        return self._properties.get(key, default)
+
+    def items(self):
+        return self._properties.items()
+
+
+class SnapshotPath:
+    """Stand-in for a single-relationship ``neo4j.graph.Path``."""
+
+    __slots__ = ("relationships",)
+
+    def __init__(self, relationship):
+        self.relationships = (relationship,)
+
+
+def encode_path(path):
+    """Flatten a reaction path to ``(type, start name, end name, properties)``."""
+
+    rel = path.relationships[0]
+    return (rel.type, rel.start_node.get("name"), rel.end_node.get("name"), dict(rel.items()))
+
+
+def decode_path(row):
+    _type, start_name, end_name, properties = row
+    return SnapshotPath(
+        SnapshotRelationship(
+            _type,
+            SnapshotNode(name=start_name),
+            SnapshotNode(name=end_name),
+            properties,
+        )
+    )
+
+
+def write_snapshot(adapter, path, streams=None):
+    """
+    Dump the records of ``streams`` (default: all extraction queries) from a
+    connected adapter to the snapshot directory ``path``.
+
+    Each page of ``adapter.batch_size`` records becomes one chunk, stored as
+    a dict of columns. The manifest is written last, so an interrupted dump
+    is never mistaken for a complete snapshot.
+    """
+
+    from skm.adapters.pss_adapter import QUERIES
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    manifest = {"version": SNAPSHOT_VERSION, "streams": {}}
+
+    for stream in streams or QUERIES:
+        chunks = []
+        columns = {}
+        count = 0
+
+        def flush():
+            chunk = f"{stream}-{len(chunks):05d}.pkl"
+            with open(path / chunk, "wb") as f:
+                pickle.dump(columns, f, protocol=pickle.HIGHEST_PROTOCOL)
+            chunks.append(chunk)
+
+        for res in adapter.get_records(stream):
+            for key, value in res.items():
+                if key == "path":
+                    value = [encode_path(p) for p in value]
+                columns.setdefault(key, []).append(value)
+            count += 1
+
+            if count % adapter.batch_size == 0:
+                flush()
+                columns = {}
+
+        if columns:
+            flush()
+
+        manifest["streams"][stream] = {"chunks": chunks, "records": count}
+        logger.info(f"Snapshot of {stream}: {count} records in {len(chunks)} chunks.")
+
+    with open(path / MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+class PSSSnapshot:
+    """
+    Read side of a snapshot directory, serving records like
+    ``PSSAdapter.get_records``.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+        manifest_path = self.path / MANIFEST
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"No PSS snapshot manifest in {self.path}")
+
+        with open(manifest_path) as f:
+            self.manifest = json.load(f)
+
+        if self.manifest["version"] != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Unsupported snapshot version {self.manifest['version']} in {self.path}"
+            )
+
+    def get_records(self, stream):
+        """
+        Stream the records of ``stream``, one chunk in memory at a time.
+        """
+
+        for page in self.get_pages(stream):
+            yield from page
+
+    def get_pages(self, stream):
+        """
+        Stream the records of ``stream`` as one list per chunk.
+        """
+
+        if stream not in self.manifest["streams"]:
+            raise KeyError(f"Stream {stream} is not in snapshot {self.path}")
+
+        for chunk in self.manifest["streams"][stream]["chunks"]:
+            with open(self.path / chunk, "rb") as f:
+                columns = pickle.load(f)
+
+            keys = list(columns)
+            page = [dict(zip(keys, values)) for values in zip(*(columns[key] for key in keys))]
+            for res in page:
+                if "path" in res:
+                    res["path"] = [decode_path(row) for row in res["path"]]
+            yield page
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from skm.adapters.pss_adapter import PSSAdapter, DEFAULT_BATCH_SIZE
+
+    parser = argparse.ArgumentParser(description="Dump the PSS database to an offline snapshot.")
+    parser.add_argument("path", help="snapshot directory")
+    parser.add_argument("--outputdir", default="./data", help="directory of the gene annotations")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    write_snapshot(PSSAdapter(outputdir=args.outputdir, batch_size=args.batch_size), args.path)
+    logger.info(f"Snapshot written to {os.path.abspath(args.path)}.")
@@ -0,0 +1,174 @@
+"""
+Memory-budgeted buffer of deferred edges, spilling to disk.
+"""
+
+import heapq
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import weakref
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+DEFAULT_MEMORY_LIMIT = 64 << 20
+
+# Runs merged at once; each run is read back in chunks of a fraction of the
+# memory limit, so a merge stays within the limit
+MERGE_FANIN = 16
+
+# Prefix of the files of the runs
+RUN_PREFIX = "spill-"
+
+# Bytes of a buffered (source, target, type) tuple and its list slot,
+# not counting the strings
+ITEM_OVERHEAD = sys.getsizeof((None, None, None)) + 8
+
+
+def write_run(items, directory, chunk):
+    """ Write the sorted ``items`` as a run of pickled chunks """
+
+    fd, path = tempfile.mkstemp(prefix=RUN_PREFIX, suffix=".pkl", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= chunk:
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def remove_runs(runs, keep=()):
+    for path in runs:
+        if path not in keep and os.path.exists(path):
+            os.remove(path)
+
+
+class SpillBuffer:
+    """
+    List-like buffer of edge tuples without ID and properties, standing in
+    for the adapter's ``incidental_edges`` list.
+
+    Edges are kept as compact ``(source, target, type)`` tuples. Once their
+    estimated size exceeds ``memory_limit`` bytes, they are sorted and
+    spilled as a run to a temporary file in ``directory``. Iterating merges
+    the runs in ``(source, target, type)`` order, ``MERGE_FANIN`` at a time
+    (in several passes if there are more), dropping duplicates, so the
+    edges are a set as in a ``NodeIndex``. Runs are removed with the buffer.
+
+    Pickling (e.g. in a checkpoint of the adapter state) spills the edges
+    still in memory and keeps the paths of the runs only. The runs are then
+    kept on disk for the pickled copy, so a buffer that is checkpointed
+    should spill to the checkpoint directory, which is cleaned up with it.
+    """
+
+    def __init__(self, memory_limit=DEFAULT_MEMORY_LIMIT, directory=None):
+        self.memory_limit = memory_limit
+        self.directory = directory
+        self._items = []
+        self._size = 0
+        self._runs = []
+        self._chunk = None
+        self._count = 0
+        # runs referenced by a pickled copy
+        self._kept = set()
+        self._finalizer = weakref.finalize(self, remove_runs, self._runs, self._kept)
+
+    def append(self, edge):
+        _id, source, target, _type, props = edge
+        if _id is not None or props:
+            raise ValueError(f"Only edges without ID and properties can be deferred, got {edge}")
+
+        self._items.append((source, target, _type))
+        self._size += ITEM_OVERHEAD + sys.getsizeof(source) + sys.getsizeof(target)
+        self._count += 1
+        if self._size > self.memory_limit:
+            self.spill()
+
+    def spill(self):
+        """ Write the buffered edges as a sorted run """
+
+        if not self._items:
+            return
+        if self._chunk is None:
+            # items of a fraction of the memory limit, also for a small first run
+            per_limit = len(self._items) * self.memory_limit // max(self._size, 1)
+            self._chunk = max(1, per_limit // (MERGE_FANIN + 1))
+        self._items.sort()
+        self._runs.append(write_run(self._items, self.directory, self._chunk))
+        logger.debug(f"Spilled {len(self._items)} deferred edges to {self._runs[-1]}.")
+        self._items = []
+        self._size = 0
+
+    def __len__(self):
+        """ Edges appended (before dropping duplicates) """
+
+        return self._count
+
+    def merge(self, runs):
+        """ Merge ``runs`` into one, removing them """
+
+        path = write_run(heapq.merge(*(read_run(run) for run in runs)), self.directory, self._chunk)
+        remove_runs(runs, self._kept)
+        return path
+
+    def __iter__(self):
+        if self._runs:
+            self.spill()
+            while len(self._runs) > MERGE_FANIN:
+                runs = [self._runs[i:i + MERGE_FANIN] for i in range(0, len(self._runs), MERGE_FANIN)]
+                self._runs[:] = [self.merge(group) for group in runs]
+            items = heapq.merge(*(read_run(path) for path in self._runs))
+        else:
+            self._items.sort()
+            items = self._items
+
+        previous = None
+        for item in items:
+            if item == previous:
+                continue
+            previous = item
+            source, target, _type = item
+            yield None, source, target, _type, {}
+
+    def clear(self):
+        remove_runs(self._runs, self._kept)
+        self._runs.clear()
+        self._chunk = None
+        self._items = []
+        self._size = 0
+        self._count = 0
+
+    def __getstate__(self):
+        self.spill()
+        self._kept.update(self._runs)
+        return {
+            "memory_limit": self.memory_limit,
+            "directory": self.directory,
+            "runs": list(self._runs),
+            "chunk": self._chunk,
+            "count": self._count,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["memory_limit"], state["directory"])
+        self._runs += state["runs"]
+        self._kept.update(state["runs"])
+        self._chunk = state["chunk"]
+        self._count = state["count"]
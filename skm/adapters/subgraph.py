@@ -0,0 +1,131 @@
+"""
+Subgraphs of PSS around seed entities, for fast partial builds.
+"""
+
+import logging
+import threading
+
+from skm.adapters.pss_adapter import REACTION_ROLES
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+# Reactions between the seeds and the furthest entities of a subgraph
+DEFAULT_HOPS = 1
+
+# Seed entities by name, functional cluster ID or pathway. Reaction nodes are
+# only reached through their seeds or participants.
+SEED_NODES_QUERY = (
+    "MATCH (n) "
+    "WHERE NOT n:Reaction AND ("
+    "n.name IN $names "
+    "OR toString(n.functional_cluster_id) IN $functional_clusters "
+    "OR any(p IN coalesce(n.all_pathways, []) WHERE p IN $pathways)) "
+    "RETURN collect(id(n)) AS keys"
+)
+
+SEED_REACTIONS_QUERY = (
+    "MATCH (r:Reaction) "
+    "WHERE toString(r.reaction_id) IN $reactions "
+    "RETURN collect(id(r)) AS keys"
+)
+
+NODE_REACTIONS_QUERY = (
+    "MATCH (n)-[e]-(r:Reaction) "
+    "WHERE id(n) IN $keys AND type(e) IN $roles "
+    "RETURN collect(DISTINCT id(r)) AS keys"
+)
+
+REACTION_PARTICIPANTS_QUERY = (
+    "MATCH (r:Reaction)-[e]-(n) "
+    "WHERE id(r) IN $keys AND type(e) IN $roles "
+    "RETURN collect(DISTINCT id(n)) AS keys"
+)
+
+# foreign entities encoded by foreign codings, the ``foreign_edges``
+FOREIGN_TARGETS_QUERY = (
+    "MATCH (g:ForeignCoding)-[]->(n:ForeignEntity) "
+    "WHERE id(g) IN $keys "
+    "RETURN collect(DISTINCT id(n)) AS keys"
+)
+
+
+class Subgraph:
+    """
+    Neighbourhood of seed entities in PSS, up to ``hops`` reactions away.
+
+    The seeds are entities by name, functional clusters by ID, the entities
+    of pathways, and reactions by ID (with their participants). Each hop
+    adds the reactions of the entities reached so far with all of their
+    participants, so the subgraph is closed: every reaction in it is
+    complete, and foreign codings bring the foreign entities they encode.
+
+    The subgraph is resolved to PSS node IDs on first use, and the adapter
+    restricts its extraction queries to them (see ``SUBGRAPH_QUERIES`` of
+    ``skm.adapters.pss_adapter``).
+    """
+
+    def __init__(self, pathways=(), functional_clusters=(), reactions=(), names=(), hops=DEFAULT_HOPS):
+        if not (pathways or functional_clusters or reactions or names):
+            raise ValueError("A subgraph needs at least one seed")
+
+        self.pathways = list(pathways)
+        self.functional_clusters = [str(x) for x in functional_clusters]
+        self.reactions = [str(x) for x in reactions]
+        self.names = list(names)
+        self.hops = hops
+
+        self._parameters = None
+        self._lock = threading.Lock()
+
+    def parameters(self, driver):
+        """ ``$subgraph_nodes`` and ``$subgraph_reactions`` of the extraction queries """
+
+        # extraction queries may run on several worker threads
+        with self._lock:
+            if self._parameters is None:
+                nodes, reactions = self.resolve(driver)
+                self._parameters = {
+                    "subgraph_nodes": sorted(nodes),
+                    "subgraph_reactions": sorted(reactions),
+                }
+        return self._parameters
+
+    def resolve(self, driver):
+        """ PSS IDs of the entities and reactions of the subgraph """
+
+        roles = list(REACTION_ROLES)
+
+        def keys_tx(tx, query, params):
+            return next(iter(tx.run(query, **params)))["keys"]
+
+        def keys(query, **params):
+            with driver.session() as session:
+                return set(session.read_transaction(keys_tx, query, params))
+
+        nodes = keys(
+            SEED_NODES_QUERY,
+            names=self.names,
+            functional_clusters=self.functional_clusters,
+            pathways=self.pathways,
+        )
+        reactions = keys(SEED_REACTIONS_QUERY, reactions=self.reactions)
+        frontier = nodes | keys(REACTION_PARTICIPANTS_QUERY, keys=list(reactions), roles=roles)
+        nodes |= frontier
+
+        for _ in range(self.hops):
+            new_reactions = keys(NODE_REACTIONS_QUERY, keys=list(frontier), roles=roles) - reactions
+            if not new_reactions:
+                break
+            reactions |= new_reactions
+            frontier = keys(REACTION_PARTICIPANTS_QUERY, keys=list(new_reactions), roles=roles) - nodes
+            nodes |= frontier
+
+        nodes |= keys(FOREIGN_TARGETS_QUERY, keys=list(nodes))
+
+        logger.info(
+            f"Subgraph of {len(nodes)} entities and {len(reactions)} reactions "
+            f"within {self.hops} hops of the seeds."
+        )
+        return nodes, reactions
@@ -0,0 +1,192 @@
+"""
+Checkpointed builds, resumable after the last stage written.
+"""
+
+import glob
+import json
+import logging
+import os
+import pickle
+from itertools import chain
+
+from skm.adapters.spill_buffer import RUN_PREFIX
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+CHECKPOINT = "checkpoint.json"
+CHECKPOINT_STATE = "checkpoint-state.pkl"
+
+# Reactions per checkpoint
+DEFAULT_REACTION_BATCH = 10000
+
+
+def write_atomic(path, data, mode="w"):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """
+    Progress of a build in the BioCypher output ``directory``.
+
+    ``checkpoint.json`` lists the stages written (and the key of the last
+    reaction written), the part files they produced and the entries of the
+    import call. The node state of the adapter, which the edges are
+    generated from, is pickled next to it after every node stage, with the
+    runs of incidental edges it spilled.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, CHECKPOINT)
+        self.state_path = os.path.join(directory, CHECKPOINT_STATE)
+        self.progress = self.empty()
+
+    @staticmethod
+    def empty():
+        return {
+            "finished": False,
+            "fingerprint": None,
+            "nodes": [],
+            "edges": [],
+            "reaction_key": -1,
+            "files": [],
+            "import_call_nodes": [],
+            "import_call_edges": [],
+        }
+
+    def load(self):
+        """ Progress of the last build, ``None`` if it was not checkpointed """
+
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def part_files(self):
+        return sorted(
+            os.path.basename(path) for path in glob.glob(os.path.join(self.directory, "*-part*.csv*"))
+        )
+
+    def save(self, writer, state=None):
+        """ Record the files on disk and the import call of ``writer`` """
+
+        self.progress["files"] = self.part_files()
+        self.progress["import_call_nodes"] = sorted(writer.import_call_nodes)
+        self.progress["import_call_edges"] = sorted(writer.import_call_edges)
+
+        # the state is written first, the progress never refers to a later one
+        if state is not None:
+            write_atomic(self.state_path, pickle.dumps(state, pickle.HIGHEST_PROTOCOL), "wb")
+        write_atomic(self.path, json.dumps(self.progress, indent=2))
+
+    def load_state(self):
+        with open(self.state_path, "rb") as f:
+            return pickle.load(f)
+
+    def remove_spills(self):
+        """ Remove the runs of incidental edges spilled to the directory """
+
+        for path in glob.glob(os.path.join(self.directory, f"{RUN_PREFIX}*.pkl")):
+            os.remove(path)
+
+    def remove_files(self, keep=()):
+        """ Remove the part files in the directory that are not in ``keep`` """
+
+        keep = set(keep)
+        removed = [name for name in self.part_files() if name not in keep]
+        for name in removed:
+            os.remove(os.path.join(self.directory, name))
+        return removed
+
+
+class CheckpointedBuild:
+    """
+    Write the output of ``adapter`` with ``bc`` one stage at a time (and
+    reactions ``reaction_batch`` at a time), checkpointing after each.
+
+    With ``resume``, an unfinished build in the output directory is picked
+    up after its last checkpoint: part files written since are removed, the
+    import call and the node state of the adapter are restored, and the
+    stages written are skipped. Otherwise, and once the last build has
+    finished or if it was started with another input ``fingerprint`` (see
+    ``skm.build.fingerprint``), the build starts over, removing the part
+    files of the last build.
+    """
+
+    def __init__(self, bc, adapter, resume=False, reaction_batch=DEFAULT_REACTION_BATCH, fingerprint=None):
+        self.bc = bc
+        self.adapter = adapter
+        self.resume = resume
+        self.reaction_batch = reaction_batch
+        self.fingerprint = fingerprint
+        self.writer = bc._get_writer()
+        self.checkpoint = Checkpoint(self.writer.outdir)
+
+    def restore(self):
+        progress = self.checkpoint.load()
+
+        self.checkpoint.progress["fingerprint"] = self.fingerprint
+
+        if progress is None:
+            return
+        if not self.resume or progress["finished"] or progress.get("fingerprint") != self.fingerprint:
+            self.checkpoint.remove_spills()
+            removed = self.checkpoint.remove_files()
+            logger.info(f"Starting a new build, removed {len(removed)} files of the last build.")
+            return
+
+        removed = self.checkpoint.remove_files(keep=progress["files"])
+        logger.info(
+            f"Resuming build after node stages {progress['nodes']}, edge stages "
+            f"{progress['edges']} and reaction {progress['reaction_key']} "
+            f"(removed {len(removed)} partial files)."
+        )
+
+        # BioCypher's writer only lists the files written by this process
+        self.writer.import_call_nodes.update(tuple(x) for x in progress["import_call_nodes"])
+        self.writer.import_call_edges.update(tuple(x) for x in progress["import_call_edges"])
+        if progress["nodes"]:
+            self.adapter.set_state(self.checkpoint.load_state())
+        self.checkpoint.progress = progress
+
+    def run(self):
+        self.adapter.set_spill_directory(self.checkpoint.directory)
+        self.restore()
+        progress = self.checkpoint.progress
+
+        for stage, tuples in self.adapter.get_node_stages(done=progress["nodes"]):
+            self.write(self.bc.write_nodes, tuples)
+            progress["nodes"].append(stage)
+            self.checkpoint.save(self.writer, self.adapter.get_state())
+
+        stages = self.adapter.get_edge_stages(
+            done=progress["edges"],
+            reaction_key=progress["reaction_key"],
+            reaction_batch=self.reaction_batch,
+        )
+        for stage, key, tuples in stages:
+            self.write(self.bc.write_edges, tuples)
+            if key is None:
+                progress["edges"].append(stage)
+            else:
+                progress["reaction_key"] = key
+            self.checkpoint.save(self.writer)
+
+        if "reactions" not in progress["edges"]:
+            progress["edges"].append("reactions")
+        progress["finished"] = True
+        self.checkpoint.save(self.writer)
+        self.checkpoint.remove_spills()
+
+    @staticmethod
+    def write(write, tuples):
+        # BioCypher cannot write an empty stage
+        tuples = iter(tuples)
+        first = next(tuples, None)
+        if first is not None:
+            write(chain([first], tuples))
@@ -0,0 +1,343 @@
+"""
+Deduplication of adapter output before it is handed to BioCypher.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import pickle
+import sqlite3
+import tempfile
+
+from skm.adapters.metrics import CONFLICTING_DUPLICATE
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+# Edge types without direction; (a, b) and (b, a) are the same edge
+SYMMETRIC_EDGE_TYPES = {"protein_protein_interaction"}
+
+
+class ExactSet:
+    """ In-memory set of seen keys """
+
+    def __init__(self):
+        self._seen = set()
+
+    def add(self, key):
+        """ Add ``key``, returns whether it was new """
+
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        return True
+
+    def close(self):
+        self._seen = set()
+
+
+class DiskSet:
+    """ Set of seen keys in a temporary SQLite file """
+
+    def __init__(self, tmpdir=None, commit_every=100000):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite", dir=tmpdir)
+        os.close(fd)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE seen (key BLOB PRIMARY KEY) WITHOUT ROWID")
+        self._commit_every = commit_every
+        self._uncommitted = 0
+
+    def add(self, key):
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO seen (key) VALUES (?)", (digest(key),)
+        )
+        self._uncommitted += 1
+        if self._uncommitted >= self._commit_every:
+            self._conn.commit()
+            self._uncommitted = 0
+        return cursor.rowcount == 1
+
+    def close(self):
+        self._conn.close()
+        os.remove(self.path)
+
+
+class BloomSet:
+    """
+    Probabilistic set of seen keys in a Bloom filter of fixed size.
+
+    A new key is taken for a duplicate with probability ``error_rate`` once
+    ``capacity`` keys have been added, so a few unique items may be dropped.
+    """
+
+    def __init__(self, capacity=10_000_000, error_rate=1e-6):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        h = hashlib.blake2b(digest(key), digest_size=16).digest()
+        h1 = int.from_bytes(h[:8], "little")
+        h2 = int.from_bytes(h[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        new = False
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                new = True
+        return new
+
+    def close(self):
+        self._bits = bytearray()
+
+
+def digest(key):
+    return hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+
+
+def merge_properties(props, other):
+    """
+    Merge the properties of a duplicate edge: list properties (such as
+    ``references``) are unioned in order, other properties keep the first
+    value.
+    """
+
+    merged = dict(props)
+    for key, value in other.items():
+        if key not in merged:
+            merged[key] = value
+        elif isinstance(merged[key], list) and isinstance(value, list):
+            merged[key] = merged[key] + [x for x in value if x not in merged[key]]
+    return merged
+
+
+def conflicting(props, other):
+    """ Whether keeping ``props`` over the duplicate ``other`` loses values of ``other`` """
+
+    return any(
+        key in props and props[key] != value
+        and not (isinstance(props[key], list) and isinstance(value, list))
+        for key, value in other.items()
+    )
+
+
+class Deduplicator:
+    """
+    Streaming deduplication stage for node and edge tuples.
+
+    Nodes are identified by their ID, edges, as in BioCypher, by their type
+    and their ID or else ``(source, target)``, ignoring direction for
+    ``SYMMETRIC_EDGE_TYPES``. Seen keys are tracked in memory (``exact``), in
+    a temporary SQLite file (``disk``) or in a Bloom filter (``bloom``).
+
+    With ``merge_edges``, duplicate edges are merged into the first one
+    (see ``merge_properties``). This needs the edges until the end of the
+    stream, so edges are then buffered (in memory, or on disk in ``disk``
+    mode) and emitted in first-seen order once the input is exhausted.
+
+    Dropped duplicates whose properties would be lost (all of them if their
+    properties differ from the edge kept; scalar ones with ``merge_edges``)
+    are counted as ``edges_conflicting``, and in ``metrics`` (an
+    ``AdapterMetrics``) with a few samples. Without ``merge_edges``, the
+    properties seen with each key are tracked in a second set of the same
+    mode, so such duplicates count once per distinct set of properties.
+    """
+
+    def __init__(
+        self,
+        mode="exact",
+        merge_edges=False,
+        symmetric_types=SYMMETRIC_EDGE_TYPES,
+        tmpdir=None,
+        capacity=10_000_000,
+        error_rate=1e-6,
+        metrics=None,
+    ):
+        if mode not in ("exact", "disk", "bloom"):
+            raise ValueError(f"Unknown deduplication mode {mode}")
+        if merge_edges and mode == "bloom":
+            raise ValueError("Edges cannot be merged in bloom mode")
+
+        self.mode = mode
+        self.merge_edges = merge_edges
+        self.symmetric_types = symmetric_types
+        self.tmpdir = tmpdir
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.metrics = metrics
+
+        self.stats = {
+            "nodes_in": 0,
+            "nodes_dropped": 0,
+            "edges_in": 0,
+            "edges_dropped": 0,
+            "edges_merged": 0,
+            "edges_conflicting": 0,
+        }
+
+    def _seen_set(self):
+        if self.mode == "disk":
+            return DiskSet(self.tmpdir)
+        if self.mode == "bloom":
+            return BloomSet(self.capacity, self.error_rate)
+        return ExactSet()
+
+    def edge_key(self, edge):
+        _id, source, target, _type, _ = edge
+        if _id is not None:
+            return (_type, _id)
+        if _type in self.symmetric_types and target < source:
+            source, target = target, source
+        return (source, target, _type)
+
+    def conflict(self, edge):
+        """ Count a dropped duplicate ``edge`` whose properties are lost """
+
+        self.stats["edges_conflicting"] += 1
+        if self.metrics is not None:
+            self.metrics.error("dedup", CONFLICTING_DUPLICATE, edge)
+
+    def nodes(self, nodes):
+        """ Deduplicate node tuples, keeping the first of each ID """
+
+        seen = self._seen_set()
+        try:
+            for node in nodes:
+                self.stats["nodes_in"] += 1
+                if seen.add(node[0]):
+                    yield node
+                else:
+                    self.stats["nodes_dropped"] += 1
+        finally:
+            seen.close()
+
+    def edges(self, edges):
+        """ Deduplicate edge tuples """
+
+        if self.merge_edges:
+            yield from self._merged_edges(edges)
+            return
+
+        seen = self._seen_set()
+        variants = self._seen_set()
+        try:
+            for edge in edges:
+                self.stats["edges_in"] += 1
+                key = self.edge_key(edge)
+                # properties not seen with the key before
+                new_variant = variants.add(digest((key, sorted(edge[4].items()))))
+                if seen.add(key):
+                    yield edge
+                else:
+                    self.stats["edges_dropped"] += 1
+                    if new_variant:
+                        self.conflict(edge)
+        finally:
+            seen.close()
+            variants.close()
+
+    def _merged_edges(self, edges):
+        buffer = DiskEdgeBuffer(self.tmpdir) if self.mode == "disk" else EdgeBuffer()
+        try:
+            for edge in edges:
+                self.stats["edges_in"] += 1
+                key = self.edge_key(edge)
+                first = buffer.get(key)
+                if first is None:
+                    buffer.put(key, edge)
+                    continue
+
+                self.stats["edges_dropped"] += 1
+                if conflicting(first[4], edge[4]):
+                    self.conflict(edge)
+                props = merge_properties(first[4], edge[4])
+                if props != first[4]:
+                    self.stats["edges_merged"] += 1
+                    buffer.put(key, first[:4] + (props,))
+
+            yield from buffer.values()
+        finally:
+            buffer.close()
+
+    def report(self):
+        """ Log and return the drop counts """
+
+        logger.info(
+            f"Deduplication ({self.mode}): "
+            f"dropped {self.stats['nodes_dropped']} of {self.stats['nodes_in']} nodes, "
+            f"{self.stats['edges_dropped']} of {self.stats['edges_in']} edges "
+            f"({self.stats['edges_merged']} merged into their first occurrence)."
+        )
+        if self.stats["edges_conflicting"]:
+            logger.warning(
+                f"{self.stats['edges_conflicting']} duplicate edges were dropped with properties "
+                "differing from the edge kept"
+                + (" (scalar properties keep the first value)." if self.merge_edges else "; see --merge-edges.")
+            )
+        return dict(self.stats)
+
+
+class EdgeBuffer:
+    """ Insertion-ordered in-memory buffer of edges by key """
+
+    def __init__(self):
+        self._edges = {}
+
+    def get(self, key):
+        return self._edges.get(key)
+
+    def put(self, key, edge):
+        self._edges[key] = edge
+
+    def values(self):
+        yield from self._edges.values()
+
+    def close(self):
+        self._edges = {}
+
+
+class DiskEdgeBuffer:
+    """ Insertion-ordered buffer of edges by key in a temporary SQLite file """
+
+    def __init__(self, tmpdir=None):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite", dir=tmpdir)
+        os.close(fd)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE edges (seq INTEGER PRIMARY KEY, key BLOB UNIQUE, edge BLOB)"
+        )
+
+    def get(self, key):
+        row = self._conn.execute(
+            "SELECT edge FROM edges WHERE key = ?", (digest(key),)
+        ).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def put(self, key, edge):
+        data = pickle.dumps(edge, protocol=pickle.HIGHEST_PROTOCOL)
+        cursor = self._conn.execute(
+            "UPDATE edges SET edge = ? WHERE key = ?", (data, digest(key))
+        )
+        if cursor.rowcount == 0:
+            self._conn.execute(
+                "INSERT INTO edges (key, edge) VALUES (?, ?)", (digest(key), data)
+            )
+
+    def values(self):
+        self._conn.commit()
+        cursor = self._conn.execute("SELECT edge FROM edges ORDER BY seq")
+        for (data,) in cursor:
+            yield pickle.loads(data)
+
+    def close(self):
+        self._conn.close()
+        os.remove(self.path)
@@ -0,0 +1,464 @@
+"""
+Incremental builds: the changes of the adapter output since the previous
+build, as delta files that can be applied to the deployed database.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+
+import yaml
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+MANIFEST = "manifest.sqlite"
+
+# Format of the manifest tables; a manifest of another format is rebuilt
+MANIFEST_FORMAT = 2
+
+# Delta files, in the order they are applied
+DELTA_FILES = ["nodes-upsert", "edges-delete", "edges-upsert", "nodes-delete"]
+
+# Statements applying the rows of the delta files. Nodes are merged on
+# their most specific label and get all their labels (``labels``, joined
+# with colons). Edges with an ID (e.g. the pairwise edges of a reaction) are
+# matched on it, so parallel edges of different reactions stay apart; edges
+# without one on their type.
+NODE_UPSERT_STATEMENT = "UNWIND $rows AS row MERGE (n:{label} {{id: row.id}}) SET n = row.props, n:{labels}"
+NODE_DELETE_STATEMENT = "UNWIND $rows AS row MATCH (n:{label} {{id: row.id}}) DETACH DELETE n"
+EDGE_UPSERT_STATEMENT = (
+    "UNWIND $rows AS row "
+    "MATCH (a:{source_label} {{id: row.source}}) MATCH (b:{target_label} {{id: row.target}}) "
+    "MERGE (a)-[r:{type}]->(b) SET r = row.props"
+)
+EDGE_ID_UPSERT_STATEMENT = (
+    "UNWIND $rows AS row "
+    "MATCH (a:{source_label} {{id: row.source}}) MATCH (b:{target_label} {{id: row.target}}) "
+    "MERGE (a)-[r:{type} {{id: row.id}}]->(b) SET r = row.props"
+)
+EDGE_DELETE_STATEMENT = (
+    "UNWIND $rows AS row "
+    "MATCH (:{source_label} {{id: row.source}})-[r:{type}]->(:{target_label} {{id: row.target}}) "
+    "WHERE r.id IS NULL DELETE r"
+)
+EDGE_ID_DELETE_STATEMENT = (
+    "UNWIND $rows AS row "
+    "MATCH (:{source_label} {{id: row.source}})-[r:{type} {{id: row.id}}]->(:{target_label} {{id: row.target}}) "
+    "DELETE r"
+)
+INDEX_STATEMENT = "CREATE INDEX IF NOT EXISTS FOR (n:{label}) ON (n.id)"
+
+
+def to_pascal(name):
+    """ Neo4j label of a schema entry, as BioCypher writes it """
+
+    return re.sub(r"(?:^|\s)(\S)", lambda m: m.group(1).upper(), name)
+
+
+def schema_entries(schema_config):
+    """ ``(class, entry, input labels)`` of the entries of ``schema_config`` with input labels """
+
+    with open(schema_config) as f:
+        schema = yaml.safe_load(f)
+
+    for key, entry in schema.items():
+        if not isinstance(entry, dict) or "input_label" not in entry:
+            continue
+        input_labels = entry["input_label"]
+        if isinstance(input_labels, str):
+            input_labels = [input_labels]
+        yield key, entry, input_labels
+
+
+def schema_labels(schema_config):
+    """
+    Map the input labels of ``schema_config`` to their Neo4j label, their
+    declared properties (``None`` if undeclared) and their preferred ID.
+    """
+
+    labels = {}
+    for key, entry, input_labels in schema_entries(schema_config):
+        properties = entry.get("properties")
+        for input_label in input_labels:
+            labels[input_label] = (
+                to_pascal(entry.get("label_as_edge", key)),
+                set(properties) if properties else None,
+                entry.get("preferred_id", "id"),
+            )
+    return labels
+
+
+def ancestor_labels(schema_config, ontology):
+    """
+    Map the input labels of ``schema_config`` to the Neo4j labels BioCypher
+    writes to the import files for its nodes: those of the class and of its
+    ancestors in ``ontology`` (BioCypher's ``Ontology``), sorted.
+    """
+
+    labels = {}
+    for key, _, input_labels in schema_entries(schema_config):
+        names = sorted({to_pascal(name) for name in ontology.get_ancestors(key)})
+        for input_label in input_labels:
+            labels[input_label] = names
+    return labels
+
+
+def content_hash(*values):
+    data = json.dumps(values, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class DeltaManifest:
+    """
+    Content hashes of the nodes and edges of the previous build, in SQLite.
+
+    Every build is a new generation: items seen in it are stamped with the
+    generation, and items of older generations are the removed ones. The
+    build is recorded in one transaction on ``commit``, so a failed build
+    leaves the manifest of the previous one.
+
+    Edges are keyed by source, target, type and ID (empty for edges without
+    one). A manifest of an older format raises a ``ValueError``, since its
+    delta could not be told from the changes of the adapter output.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS nodes ("
+            "id TEXT PRIMARY KEY, label TEXT NOT NULL, hash TEXT NOT NULL, "
+            "generation INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS edges ("
+            "source TEXT NOT NULL, target TEXT NOT NULL, type TEXT NOT NULL, id TEXT NOT NULL, "
+            "hash TEXT NOT NULL, generation INTEGER NOT NULL, "
+            "PRIMARY KEY (source, target, type, id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        self.previous = int(row[0]) if row is not None else 0
+        self.generation = self.previous + 1
+
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        _format = int(row[0]) if row is not None else (1 if self.previous else MANIFEST_FORMAT)
+        if _format != MANIFEST_FORMAT:
+            self._conn.close()
+            raise ValueError(
+                f"Delta manifest {self.path} has format {_format}, not {MANIFEST_FORMAT}: "
+                "remove it and deploy a full build."
+            )
+
+    def see_node(self, _id, label, _hash):
+        """ Record a node of this build, returns ``added``, ``changed``, ``unchanged`` or ``seen`` """
+
+        return self._see(
+            "SELECT hash, generation FROM nodes WHERE id = ?", (_id,),
+            "INSERT OR REPLACE INTO nodes (id, label, hash, generation) VALUES (?, ?, ?, ?)",
+            (_id, label, _hash, self.generation),
+            _hash,
+        )
+
+    def see_edge(self, source, target, _type, _id, _hash):
+        """ Record an edge of this build (``_id`` empty if it has none), as ``see_node`` """
+
+        return self._see(
+            "SELECT hash, generation FROM edges WHERE source = ? AND target = ? AND type = ? AND id = ?",
+            (source, target, _type, _id),
+            "INSERT OR REPLACE INTO edges (source, target, type, id, hash, generation) VALUES (?, ?, ?, ?, ?, ?)",
+            (source, target, _type, _id, _hash, self.generation),
+            _hash,
+        )
+
+    def _see(self, select, key, upsert, values, _hash):
+        row = self._conn.execute(select, key).fetchone()
+        if row is not None and row[1] == self.generation:
+            # repeated in this build, the first one is kept
+            return "seen"
+        self._conn.execute(upsert, values)
+        if row is None:
+            return "added"
+        return "unchanged" if row[0] == _hash else "changed"
+
+    def node_label(self, _id):
+        row = self._conn.execute("SELECT label FROM nodes WHERE id = ?", (_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def removed_nodes(self):
+        """ ``(id, label)`` of the nodes not seen in this build """
+
+        return self._conn.execute(
+            "SELECT id, label FROM nodes WHERE generation < ?", (self.generation,)
+        ).fetchall()
+
+    def removed_edges(self):
+        """ ``(source, target, type, id)`` of the edges not seen in this build """
+
+        return self._conn.execute(
+            "SELECT source, target, type, id FROM edges WHERE generation < ?", (self.generation,)
+        ).fetchall()
+
+    def commit(self):
+        self._conn.execute("DELETE FROM nodes WHERE generation < ?", (self.generation,))
+        self._conn.execute("DELETE FROM edges WHERE generation < ?", (self.generation,))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("generation", str(self.generation)), ("format", str(MANIFEST_FORMAT))],
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class DeltaWriter:
+    """
+    JSON lines files of one delta, one per ``DELTA_FILES`` entry. Files are
+    written under temporary names and moved in place on ``close``, with a
+    ``delta.json`` summary written last.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._files = {
+            name: open(self.directory / f".{name}.jsonl.tmp", "w") for name in DELTA_FILES
+        }
+        self.counts = dict.fromkeys(DELTA_FILES, 0)
+
+    def write(self, name, row):
+        self._files[name].write(json.dumps(row, default=str) + "\n")
+        self.counts[name] += 1
+
+    def close(self, summary):
+        for name, f in self._files.items():
+            f.close()
+            os.replace(self.directory / f".{name}.jsonl.tmp", self.directory / f"{name}.jsonl")
+
+        with open(self.directory / "delta.json", "w") as f:
+            json.dump({**summary, "counts": self.counts}, f, indent=2)
+
+
+class DeltaBuilder:
+    """
+    Compare the adapter output to the manifest of the previous build and
+    write the added, changed and removed nodes and edges as a delta.
+
+    Nodes are identified by their ID and edges, as BioCypher deduplicates
+    them, by ``(source, target, type)`` and their ID, if they have one (see
+    ``skm.adapters.pss_adapter.reaction_edge_id``); like BioCypher, only the
+    first of repeated nodes and edges is kept. Edge IDs are written as the
+    ``id`` property, as in the import files. Node and edge types are mapped
+    to Neo4j labels with the schema configuration, and properties not
+    declared there are dropped; as in BioCypher, nodes and edges of types
+    missing from it are skipped, and counted per type. With ``ontology``
+    (BioCypher's, see ``ancestor_labels``), nodes get the labels of their
+    class and its ancestors, as in the import files; otherwise their most
+    specific label only.
+
+    The delta of each build goes to a directory of its own, named after its
+    generation, next to the manifest.
+    """
+
+    def __init__(self, directory, schema_config="config/schema_config.yaml", ontology=None):
+        self.directory = Path(directory)
+        self.labels = schema_labels(schema_config)
+        self.ancestors = ancestor_labels(schema_config, ontology) if ontology is not None else {}
+        self.manifest = DeltaManifest(self.directory / MANIFEST)
+        self.delta_dir = self.directory / f"{self.manifest.generation:05d}"
+        self.writer = DeltaWriter(self.delta_dir)
+        self.stats = defaultdict(int)
+        self.unknown_types = defaultdict(int)
+
+    def label(self, _type):
+        """ Label, properties and preferred ID of ``_type``, ``None`` if it is not in the schema """
+
+        if _type not in self.labels:
+            self.unknown_types[_type] += 1
+            return None
+        return self.labels[_type]
+
+    def nodes(self, nodes):
+        """ Consume node tuples, writing the added and changed ones """
+
+        for _id, _type, props in nodes:
+            mapping = self.label(_type)
+            if mapping is None:
+                self.stats["nodes_skipped"] += 1
+                continue
+            label, properties, preferred_id = mapping
+            if properties is not None:
+                props = {k: v for k, v in props.items() if k in properties}
+            props = {**props, "id": _id, "preferred_id": preferred_id}
+
+            labels = self.ancestors.get(_type, [label])
+            state = self.manifest.see_node(_id, label, content_hash(labels, props))
+            self.stats[f"nodes_{state}"] += 1
+            if state in ("added", "changed"):
+                self.writer.write("nodes-upsert", {"id": _id, "label": label, "labels": labels, "props": props})
+
+    def edges(self, edges):
+        """ Consume edge tuples, writing the added and changed ones """
+
+        for _id, source, target, _type, props in edges:
+            mapping = self.label(_type)
+            if mapping is None:
+                self.stats["edges_skipped"] += 1
+                continue
+            label, properties, _ = mapping
+            if properties is not None:
+                props = {k: v for k, v in props.items() if k in properties}
+            if _id:
+                props = {**props, "id": _id}
+
+            state = self.manifest.see_edge(source, target, label, _id or "", content_hash(props))
+            self.stats[f"edges_{state}"] += 1
+            if state in ("added", "changed"):
+                self.writer.write("edges-upsert", self.edge_row(source, target, label, _id, props))
+
+    def edge_row(self, source, target, label, _id, props=None):
+        row = {
+            "source": source,
+            "source_label": self.manifest.node_label(source),
+            "target": target,
+            "target_label": self.manifest.node_label(target),
+            "type": label,
+        }
+        if _id:
+            row["id"] = _id
+        if props is not None:
+            row["props"] = props
+        return row
+
+    def finish(self):
+        """ Write the removals, close the delta and record the build """
+
+        for source, target, label, _id in self.manifest.removed_edges():
+            self.writer.write("edges-delete", self.edge_row(source, target, label, _id))
+            self.stats["edges_removed"] += 1
+
+        for _id, label in self.manifest.removed_nodes():
+            self.writer.write("nodes-delete", {"id": _id, "label": label})
+            self.stats["nodes_removed"] += 1
+
+        self.writer.close({
+            "generation": self.manifest.generation,
+            "previous": self.manifest.previous,
+        })
+        self.manifest.commit()
+        self.manifest.close()
+
+        if self.unknown_types:
+            logger.warning(
+                f"Skipped nodes and edges of types not in the schema configuration: {dict(self.unknown_types)}."
+            )
+        logger.info(
+            f"Delta {self.manifest.generation} written to {self.delta_dir}: "
+            + ", ".join(f"{v} {k.replace('_', ' ')}" for k, v in sorted(self.stats.items()))
+            + "."
+        )
+        return self.delta_dir
+
+
+def read_rows(path):
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def apply_delta(driver, directory, batch_size=1000):
+    """
+    Apply a delta directory to a database through a ``neo4j_utils.Driver``.
+
+    Rows are written in batches of ``UNWIND ... MERGE`` statements, one per
+    label, matching nodes on their ``id`` and edges on their type, or on
+    their ``id`` if they have one. Upserted nodes get the labels of their
+    row (see ``DeltaBuilder``), in addition to those they already have.
+
+    A failing statement raises, leaving the delta partly applied. All
+    statements are idempotent, so the delta can be applied again once the
+    cause is fixed.
+    """
+
+    directory = Path(directory)
+    with open(directory / "delta.json") as f:
+        summary = json.load(f)
+    logger.info(f"Applying delta {summary['generation']} from {directory}.")
+
+    def edge(r, statement, id_statement):
+        labels = {"source_label": r["source_label"], "type": r["type"], "target_label": r["target_label"]}
+        return labels, id_statement if "id" in r else statement
+
+    statements = {
+        "nodes-upsert": lambda r: ({"label": r["label"], "labels": ":".join(r["labels"])}, NODE_UPSERT_STATEMENT),
+        "edges-delete": lambda r: edge(r, EDGE_DELETE_STATEMENT, EDGE_ID_DELETE_STATEMENT),
+        "edges-upsert": lambda r: edge(r, EDGE_UPSERT_STATEMENT, EDGE_ID_UPSERT_STATEMENT),
+        "nodes-delete": lambda r: ({"label": r["label"]}, NODE_DELETE_STATEMENT),
+    }
+
+    node_labels = set()
+    for name in ("nodes-upsert", "nodes-delete"):
+        node_labels.update(row["label"] for row in read_rows(directory / f"{name}.jsonl"))
+    for label in node_labels:
+        driver.query(INDEX_STATEMENT.format(label=label), raise_errors=True)
+
+    skipped = defaultdict(int)
+    for name in DELTA_FILES:
+        batches = defaultdict(list)
+        for row in read_rows(directory / f"{name}.jsonl"):
+            labels, template = statements[name](row)
+            if None in labels.values():
+                # edges of nodes that are not in the graph
+                skipped[name] += 1
+                continue
+            statement = template.format(**labels)
+            batch = batches[statement]
+            batch.append(row)
+            if len(batch) >= batch_size:
+                driver.query(statement, rows=batch, raise_errors=True)
+                batch.clear()
+
+        for statement, batch in batches.items():
+            if batch:
+                driver.query(statement, rows=batch, raise_errors=True)
+
+    if skipped:
+        logger.warning(f"Skipped rows with unknown nodes: {dict(skipped)}.")
+    logger.info(f"Applied delta {summary['generation']}: {summary['counts']}.")
+
+
+if __name__ == "__main__":
+    import neo4j_utils as nu
+
+    parser = argparse.ArgumentParser(description="Apply a delta to a deployed database.")
+    parser.add_argument("delta", help="delta directory, e.g. ./data/delta/00002")
+    parser.add_argument("--uri", default="bolt://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--db-name", default="neo4j")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    driver = nu.Driver(
+        db_name=args.db_name,
+        db_user=args.user,
+        db_passwd=args.password,
+        db_uri=args.uri,
+        multi_db=False,
+    )
+    apply_delta(driver, args.delta, batch_size=args.batch_size)
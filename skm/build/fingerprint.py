@@ -0,0 +1,121 @@
+"""
+Fingerprints of the inputs of a build, to skip rebuilding an unchanged graph.
+"""
+
+import json
+import logging
+import os
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from skm.build.checkpoint import write_atomic
+from skm.build.delta import content_hash
+from skm.build.import_files import IMPORT_CALL
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+FINGERPRINT = "build-fingerprint.json"
+
+# Sources of the build, relative to the working directory
+CODE_PATHS = ["create_knowledge_graph.py", "skm"]
+CONFIG_PATHS = ["config"]
+
+# Packages whose version changes the output
+PACKAGES = ["biocypher"]
+
+
+def files_hash(paths, suffixes):
+    """ Hash of the names and contents of the files with ``suffixes`` under ``paths`` """
+
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files += [p for p in path.rglob("*") if p.is_file() and p.suffix in suffixes]
+        elif path.exists():
+            files.append(path)
+
+    return content_hash([[str(p), p.read_bytes().hex()] for p in sorted(files)])
+
+
+def package_versions(packages=PACKAGES):
+    versions = {}
+    for package in packages:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def build_fingerprint(adapter, options, code=CODE_PATHS, config=CONFIG_PATHS):
+    """
+    Fingerprint of the inputs of a build with ``adapter`` and the build
+    ``options`` that change its output (e.g. the reaction mode, but not the
+    number of workers): the PSS content (from
+    ``adapter.get_fingerprint``), the checksum of the CKN annotation table,
+    and hashes of the configuration, of the code and of the versions of the
+    packages it runs on.
+
+    The annotation table is fetched as the build would fetch it, so it is
+    only revalidated against the server with ``refresh_annotations``.
+    """
+
+    cache = adapter.annotation_cache(adapter.outputdir)
+    cache.fetch()
+
+    inputs = {
+        "pss": content_hash(adapter.get_fingerprint()),
+        "annotations": cache.read_meta()["sha256"],
+        "config": files_hash(config, {".yaml", ".yml"}),
+        "code": files_hash(code, {".py"}),
+        "packages": content_hash(package_versions()),
+        "options": content_hash(options),
+    }
+    return {"fingerprint": content_hash(inputs), "inputs": inputs}
+
+
+class BuildFingerprint:
+    """
+    Fingerprint of the last finished build, stored with its output in
+    ``directory``.
+
+    It is removed before a build starts and saved once it has finished, so
+    it only ever describes complete output. The file only depends on the
+    inputs, so the import can compare it byte for byte with the one of the
+    last import (see ``scripts/import.sh``).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, FINGERPRINT)
+
+    def load(self):
+        """ Fingerprint of the last build, ``None`` if there is none """
+
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def changed(self, fingerprint):
+        """
+        Inputs that changed since the last build, all of them if it did not
+        finish or its output is missing; empty if the build can be skipped
+        """
+
+        last = self.load()
+        if last is None or not os.path.exists(os.path.join(self.directory, IMPORT_CALL)):
+            return sorted(fingerprint["inputs"])
+        return sorted(
+            name for name, value in fingerprint["inputs"].items()
+            if last["inputs"].get(name) != value
+        )
+
+    def save(self, fingerprint):
+        write_atomic(self.path, json.dumps(fingerprint, indent=2, sort_keys=True) + "\n")
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
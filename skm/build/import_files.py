@@ -0,0 +1,214 @@
+"""
+Layout of the ``neo4j-admin import`` files written by BioCypher.
+"""
+
+import glob
+import gzip
+import heapq
+import logging
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+DEFAULT_PART_BYTES = 256 << 20
+
+# gzip level of the parts: neo4j-admin decompresses on its input threads,
+# so fast compression is enough to cut the bytes read
+COMPRESS_LEVEL = 1
+
+IMPORT_CALL = "neo4j-admin-import-call.sh"
+
+
+def label_parts(directory):
+    """ Part files per label (``{Label}-part{n}.csv[.gz]``), in part order """
+
+    parts = {}
+    for path in glob.glob(os.path.join(directory, "*-part*.csv*")):
+        label = os.path.basename(path).rsplit("-part", 1)[0]
+        parts.setdefault(label, []).append(path)
+    return {label: sorted(paths) for label, paths in parts.items()}
+
+
+def is_node_header(directory, label):
+    """ Whether the header of ``label`` is that of a node file (with an ``:ID``) """
+
+    with open(os.path.join(directory, f"{label}-header.csv"), encoding="utf-8") as f:
+        return ":ID" in f.readline()
+
+
+def open_part(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, compresslevel=COMPRESS_LEVEL, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_lines(path):
+    with open_part(path, "rt") as f:
+        yield from f
+
+
+def write_sorted_run(path, run_path, delimiter):
+    """ Write the lines of a part to ``run_path``, sorted by their ID (first column) """
+
+    with open_part(path, "rt") as f:
+        lines = f.readlines()
+    lines.sort(key=lambda line: line.split(delimiter, 1)[0])
+    with open(run_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    return run_path
+
+
+class PartWriter:
+    """ Writes lines into parts of at most ``part_bytes`` (uncompressed) each """
+
+    def __init__(self, directory, label, part_bytes, compress):
+        self.directory = directory
+        self.label = label
+        self.part_bytes = part_bytes
+        self.suffix = ".csv.gz" if compress else ".csv"
+        self.paths = []
+        self._file = None
+        self._size = 0
+
+    def write(self, line):
+        if self._file is None or self._size + len(line) > self.part_bytes:
+            self.close()
+            path = os.path.join(self.directory, f"{self.label}-part{len(self.paths):03d}{self.suffix}")
+            self.paths.append(path)
+            self._file = open_part(path, "wt")
+            self._size = 0
+        self._file.write(line)
+        self._size += len(line)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def reshard_label(directory, label, parts, part_bytes, compress, sort, delimiter):
+    """
+    Rewrite the ``parts`` of ``label`` as parts of at most ``part_bytes``,
+    gzipped with ``compress``, and sorted by ID with ``sort`` (each part is
+    sorted in memory into a run, then the runs are merged). Returns the new
+    paths.
+    """
+
+    tmpdir = os.path.join(directory, f".reshard-{label}")
+    os.makedirs(tmpdir, exist_ok=True)
+    writer = PartWriter(tmpdir, label, part_bytes, compress)
+
+    try:
+        if sort:
+            # external sort: one sorted run per part, merged line by line
+            runs = [
+                write_sorted_run(path, os.path.join(tmpdir, f"run{i:03d}.csv"), delimiter)
+                for i, path in enumerate(parts)
+            ]
+            lines = heapq.merge(
+                *(read_lines(run) for run in runs), key=lambda line: line.split(delimiter, 1)[0]
+            )
+        else:
+            lines = (line for path in parts for line in read_lines(path))
+        for line in lines:
+            if not line.endswith("\n"):
+                line += "\n"
+            writer.write(line)
+    finally:
+        writer.close()
+
+    # swap the parts; the import call matches them by ``{Label}-part.*``
+    for path in parts:
+        os.remove(path)
+    paths = []
+    for path in writer.paths:
+        target = os.path.join(directory, os.path.basename(path))
+        os.replace(path, target)
+        paths.append(target)
+    shutil.rmtree(tmpdir)
+    return paths
+
+
+def reshard(
+    directory,
+    part_bytes=DEFAULT_PART_BYTES,
+    compress=False,
+    sort_nodes=False,
+    delimiter="\t",
+    processes=None,
+):
+    """
+    Rewrite the part files of every label in ``directory`` as size-bounded
+    parts, so neo4j-admin can read them in parallel, optionally gzipped and
+    with the node files sorted by ID. Labels are processed in parallel on
+    ``processes`` (default: all cores). Returns the new parts per label.
+    """
+
+    parts = label_parts(directory)
+    processes = processes or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {
+            label: executor.submit(
+                reshard_label,
+                directory,
+                label,
+                paths,
+                part_bytes,
+                compress,
+                sort_nodes and is_node_header(directory, label),
+                delimiter,
+            )
+            for label, paths in parts.items()
+        }
+        result = {label: future.result() for label, future in futures.items()}
+
+    logger.info(
+        f"Resharded {sum(map(len, parts.values()))} parts of {len(parts)} labels "
+        f"into {sum(map(len, result.values()))} parts of at most {part_bytes >> 20} MiB"
+        + (", gzipped" if compress else "")
+        + (", nodes sorted by ID" if sort_nodes else "")
+        + "."
+    )
+    return result
+
+
+def tune_import_call(directory, processors=None, high_io=False):
+    """
+    Add import threading options to the import call written by BioCypher,
+    for both the Neo4j 4 (``--processors``, ``--high-io``) and the Neo4j 5
+    (``--threads``, ``--high-parallel-io``) branch of the script.
+    """
+
+    path = os.path.join(directory, IMPORT_CALL)
+    with open(path) as f:
+        script = f.read()
+
+    v4 = []
+    v5 = []
+    if processors:
+        v4.append(f"--processors={processors}")
+        v5.append(f"--threads={processors}")
+    if high_io:
+        v4.append("--high-io=true")
+        v5.append("--high-parallel-io=on")
+
+    script, n5 = re.subn(r"(neo4j-admin database import full )", r"\g<1>" + " ".join(v5 + [""]), script)
+    script, n4 = re.subn(r"(neo4j-admin import )", r"\g<1>" + " ".join(v4 + [""]), script)
+    if not n4 and not n5:
+        logger.warning(f"No neo4j-admin import call found in {path}, not tuned.")
+        return path
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(script)
+    os.replace(tmp_path, path)
+    os.chmod(path, 0o755)
+
+    logger.info(f"Import call tuned with {' '.join(v4)}.")
+    return path
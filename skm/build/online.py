@@ -0,0 +1,254 @@
+"""
+Online builds: the adapter output written into a running Neo4j database.
+"""
+
+import logging
+import queue
+import threading
+from collections import defaultdict
+
+from neo4j.exceptions import ClientError
+
+from skm.build.delta import (
+    EDGE_ID_UPSERT_STATEMENT,
+    EDGE_UPSERT_STATEMENT,
+    INDEX_STATEMENT,
+    NODE_UPSERT_STATEMENT,
+    ancestor_labels,
+    schema_labels,
+)
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+# Rows per transaction
+DEFAULT_BATCH_SIZE = 1000
+
+# Concurrent write transactions, over all node labels and edge types
+DEFAULT_WORKERS = 4
+
+# Batches waiting per node label or edge type
+MAX_BATCHES = 4
+
+CONSTRAINT_STATEMENT = "CREATE CONSTRAINT IF NOT EXISTS FOR (n:{label}) REQUIRE n.id IS UNIQUE"
+
+
+class WriterLane:
+    """
+    Batches of one statement, written in order on a thread of their own.
+
+    At most ``MAX_BATCHES`` batches wait in the queue. Once a batch fails,
+    the following ones are discarded and the error is raised by the next
+    ``put`` or by ``close``.
+    """
+
+    _done = object()
+
+    def __init__(self, name, statement, write):
+        self.name = name
+        self.statement = statement
+        self.write = write
+        self.error = None
+        self._queue = queue.Queue(maxsize=MAX_BATCHES)
+        self._thread = threading.Thread(target=self._run, name=f"online-{name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is self._done:
+                return
+            if self.error is None:
+                try:
+                    self.write(self.name, self.statement, batch)
+                except Exception as e:
+                    self.error = e
+
+    def put(self, batch):
+        if self.error is not None:
+            raise self.error
+        self._queue.put(batch)
+
+    def close(self):
+        self._queue.put(self._done)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class OnlineWriter:
+    """
+    Write node and edge tuples into a running database through a
+    ``neo4j_utils.Driver``, instead of import files.
+
+    Rows are written in batches of ``batch_size`` parameterised
+    ``UNWIND ... MERGE`` statements, matching nodes on their ``id``, with
+    one writer thread per node label and per edge type and at most
+    ``workers`` transactions at a time. A uniqueness constraint on ``id``
+    (or an index, if the nodes of a label are not unique) is created for
+    each label before its first batch. Batches are written in managed
+    transactions, which the driver retries on transient errors (e.g. a
+    deadlock between writers).
+
+    As in ``skm.build.delta``, types are mapped to Neo4j labels with the
+    schema configuration, properties not declared there are dropped, nodes
+    and edges of types missing from it are skipped, and edges with an ID are
+    merged on it. As in BioCypher, the first of repeated nodes and edges
+    (by ID, or by source and target for edges without one) is kept. With
+    ``ontology`` (BioCypher's, see ``ancestor_labels``), nodes get the
+    labels of their class and its ancestors, as in the import files;
+    otherwise their most specific label only. Edges are written once all
+    nodes are, and edges of nodes that were not written are skipped.
+    """
+
+    def __init__(
+        self,
+        driver,
+        schema_config="config/schema_config.yaml",
+        batch_size=DEFAULT_BATCH_SIZE,
+        workers=DEFAULT_WORKERS,
+        ontology=None,
+    ):
+        self.driver = driver
+        self.labels = schema_labels(schema_config)
+        self.ancestors = ancestor_labels(schema_config, ontology) if ontology is not None else {}
+        self.batch_size = batch_size
+        self.node_labels = {}
+        self.edges_seen = set()
+        self.constrained = set()
+        self.stats = defaultdict(int)
+        self.unknown_types = defaultdict(int)
+        self._transactions = threading.Semaphore(workers)
+        self._stats_lock = threading.Lock()
+
+    def label(self, _type):
+        """ Label, properties and preferred ID of ``_type``, ``None`` if it is not in the schema """
+
+        if _type not in self.labels:
+            self.unknown_types[_type] += 1
+            return None
+        return self.labels[_type]
+
+    def ensure_constraint(self, label):
+        """ Unique ``id`` of the nodes of ``label``, or an index on it """
+
+        try:
+            self.driver.query(CONSTRAINT_STATEMENT.format(label=label), raise_errors=True)
+        except ClientError as e:
+            logger.warning(f"Could not create a uniqueness constraint on {label}.id ({e}), indexing it.")
+            self.driver.query(INDEX_STATEMENT.format(label=label), raise_errors=True)
+
+    def write_batch(self, name, statement, rows):
+        """ Write ``rows`` with ``statement`` in one managed transaction """
+
+        def run_tx(tx):
+            tx.run(statement, rows=rows).consume()
+
+        with self._transactions, self.driver.session() as session:
+            session.write_transaction(run_tx)
+
+        with self._stats_lock:
+            self.stats[f"{name}_rows"] += len(rows)
+            self.stats["batches"] += 1
+
+    def write_lanes(self, rows):
+        """ Write ``(name, statement, row)`` items, batched per statement """
+
+        lanes = {}
+        batches = defaultdict(list)
+        try:
+            for name, statement, row in rows:
+                if statement not in lanes:
+                    lanes[statement] = WriterLane(name, statement, self.write_batch)
+                batch = batches[statement]
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    lanes[statement].put(batch)
+                    batches[statement] = []
+
+            for statement, batch in batches.items():
+                if batch:
+                    lanes[statement].put(batch)
+        finally:
+            errors = []
+            for lane in lanes.values():
+                try:
+                    lane.close()
+                except Exception as e:
+                    errors.append(e)
+            if errors:
+                raise errors[0]
+
+    def nodes(self, nodes):
+        """ Consume node tuples, writing them """
+
+        def rows():
+            for _id, _type, props in nodes:
+                mapping = self.label(_type)
+                if mapping is None:
+                    self.stats["nodes_skipped"] += 1
+                    continue
+                label, properties, preferred_id = mapping
+                if _id in self.node_labels:
+                    self.stats["nodes_repeated"] += 1
+                    continue
+                if label not in self.constrained:
+                    self.ensure_constraint(label)
+                    self.constrained.add(label)
+                self.node_labels[_id] = label
+
+                if properties is not None:
+                    props = {k: v for k, v in props.items() if k in properties}
+                props = {**props, "id": _id, "preferred_id": preferred_id}
+                labels = ":".join(self.ancestors.get(_type, [label]))
+                yield label, NODE_UPSERT_STATEMENT.format(label=label, labels=labels), {"id": _id, "props": props}
+
+        self.write_lanes(rows())
+
+    def edges(self, edges):
+        """ Consume edge tuples, writing those between written nodes """
+
+        def rows():
+            for _id, source, target, _type, props in edges:
+                mapping = self.label(_type)
+                if mapping is None:
+                    self.stats["edges_skipped"] += 1
+                    continue
+                label, properties, _ = mapping
+                key = (label, _id) if _id else (label, source, target)
+                if key in self.edges_seen:
+                    self.stats["edges_repeated"] += 1
+                    continue
+                self.edges_seen.add(key)
+                source_label = self.node_labels.get(source)
+                target_label = self.node_labels.get(target)
+                if source_label is None or target_label is None:
+                    self.stats["edges_unresolved"] += 1
+                    continue
+
+                if properties is not None:
+                    props = {k: v for k, v in props.items() if k in properties}
+                row = {"source": source, "target": target, "props": props}
+                if _id:
+                    row["id"] = _id
+                    row["props"] = {**props, "id": _id}
+                statement = (EDGE_ID_UPSERT_STATEMENT if _id else EDGE_UPSERT_STATEMENT).format(
+                    source_label=source_label, target_label=target_label, type=label
+                )
+                yield label, statement, row
+
+        self.write_lanes(rows())
+
+    def finish(self):
+        if self.unknown_types:
+            logger.warning(
+                f"Skipped nodes and edges of types not in the schema configuration: {dict(self.unknown_types)}."
+            )
+        if self.stats["edges_unresolved"]:
+            logger.warning(f"Skipped {self.stats['edges_unresolved']} edges of nodes that were not written.")
+        logger.info(
+            "Online build written: "
+            + ", ".join(f"{v} {k.replace('_', ' ')}" for k, v in sorted(self.stats.items()))
+            + "."
+        )
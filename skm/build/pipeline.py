@@ -0,0 +1,180 @@
+"""
+Pipelined build: the adapter runs on producer threads, handing its output to
+the writers through bounded queues.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger("biocypher")
+
+logger.debug(f"Loading module {__name__}.")
+
+
+class StageStats:
+    """ Throughput of one pipeline stage """
+
+    __slots__ = ("name", "items", "batches", "busy", "blocked")
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        # time spent working, and waiting on the neighbouring stage
+        self.busy = 0.0
+        self.blocked = 0.0
+
+    def as_dict(self):
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "busy_seconds": self.busy,
+            "blocked_seconds": self.blocked,
+            "items_per_s": self.items / self.busy if self.busy else None,
+        }
+
+
+class PipelineStage:
+    """
+    Iterate ``source`` on a producer thread and hand batches of its items to
+    the consumer iterating the stage.
+
+    At most ``max_batches`` batches wait in the queue: a producer that gets
+    ahead blocks until the consumer catches up, so memory is bound by the
+    queue whatever the size of the output. Exceptions of the producer are
+    raised in the consumer. With ``after``, the producer starts once the
+    producer of that stage has finished (e.g. edges once the nodes are
+    resolved), while its consumer may still be busy.
+    """
+
+    _done = object()
+
+    def __init__(self, name, source, batch_size, max_batches, after=None):
+        self.name = name
+        self.source = source
+        self.batch_size = batch_size
+        self.after = after
+        self.produced = StageStats(f"{name}:produce")
+        self.consumed = StageStats(f"{name}:consume")
+        self.finished = threading.Event()
+        self.failed = False
+        self._stop = threading.Event()
+        self._queue = queue.Queue(maxsize=max_batches)
+        self._thread = threading.Thread(target=self._run, name=f"pipeline-{name}", daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                self.produced.blocked += time.perf_counter() - start
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            if self.after is not None:
+                while not self.after.finished.wait(timeout=0.1):
+                    if self._stop.is_set():
+                        return
+                if self.after.failed:
+                    raise RuntimeError(f"Pipeline stage {self.after.name} failed")
+
+            iterator = iter(self.source)
+            while True:
+                start = time.perf_counter()
+                batch = []
+                for item in iterator:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                self.produced.busy += time.perf_counter() - start
+
+                if not batch:
+                    break
+                self.produced.items += len(batch)
+                self.produced.batches += 1
+                if not self._put(batch):
+                    return
+
+        except Exception as e:
+            self.failed = True
+            self.finished.set()
+            self._put(e)
+            return
+
+        self.finished.set()
+        self._put(self._done)
+
+    def __iter__(self):
+        consumed = self.consumed
+        while True:
+            start = time.perf_counter()
+            batch = self._queue.get()
+            consumed.blocked += time.perf_counter() - start
+
+            if batch is self._done:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+
+            consumed.batches += 1
+            consumed.items += len(batch)
+            start = time.perf_counter()
+            yield from batch
+            consumed.busy += time.perf_counter() - start
+
+    def close(self):
+        self._stop.set()
+
+
+class Pipeline:
+    """
+    Producer/consumer stages of a build.
+
+    Each ``stage`` runs an adapter generator (extraction and processing, and
+    deduplication if wrapped around it) on its own thread, while the writer
+    consumes the stage on the calling thread. With ``workers`` > 1 the
+    adapter additionally fetches its records on a thread pool, so network
+    waits, processing and writing overlap.
+
+    ``report`` lists per stage the items, the busy time and the time spent
+    blocked on the other side of the queue: a producer blocked for long is
+    waiting on the writer, a consumer blocked for long on the adapter.
+    """
+
+    def __init__(self, batch_size=1000, max_batches=8):
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.stages = []
+
+    def stage(self, name, source, after=None):
+        """ Start producing ``source`` in the stage ``name``, returns the stage to consume """
+
+        stage = PipelineStage(name, source, self.batch_size, self.max_batches, after=after)
+        self.stages.append(stage)
+        return stage
+
+    def report(self):
+        return {
+            stats.name: stats.as_dict()
+            for stage in self.stages
+            for stats in (stage.produced, stage.consumed)
+        }
+
+    def log_report(self):
+        for name, stats in self.report().items():
+            rate = f"{stats['items_per_s']:.0f}/s" if stats["items_per_s"] else "-"
+            logger.info(
+                f"Pipeline {name}: {stats['items']} items, {rate}, "
+                f"busy {stats['busy_seconds']:.2f} s, blocked {stats['blocked_seconds']:.2f} s."
+            )
+
+    def close(self):
+        for stage in self.stages:
+            stage.close()